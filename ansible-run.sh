@@ -24,12 +24,33 @@
 #                                         during the execution of the playbook
 #                                         As an option the playbook name can be
 #                                         provided
+#
+#  ansible-run <project> [playbook] --shards N
+#                                       : runs the playbook in N parallel containers,
+#                                         every container gets a part of the inventory
+#
+#  ansible-run <project> [playbook] --pool
+#                                       : runs the playbook in a warm container of the
+#                                         project that is reused by the next runs
+#
+#  ansible-run <project> [playbook] --preflight
+#                                       : probes the SSH port of all hosts first, hosts
+#                                         that do not answer are marked unreachable
+#
+#  ansible-run <project> [playbook] --no-queue
+#                                       : runs the playbook right away, also when the
+#                                         run queue (make runqueue) is running
 
 CURRPWD="$(pwd)"
 SYMLINKDIR="$(dirname "$(readlink  "${BASH_SOURCE[0]}")")"
 PROJECT_BASE="$SYMLINKDIR/projects"
+QUEUE_SOCKET="$PROJECT_BASE/.runqueue.sock"
 
 DEFAULT_PLAYBOOK="playbook"
+SHARDS=1
+POOL=0
+QUEUE=1
+PREFLIGHT=no
 E_BADARGS=85   # Wrong number of arguments passed to script.
 
 
@@ -42,12 +63,19 @@ Help()
    # Display Help
    echo "Create and run ansible projects."
    echo
-   echo "Syntax: ansible-run [-hsc] <project> [playbook]"
+   echo "Syntax: ansible-run [-hscpfQ] [-n shards] <project> [playbook]"
    echo
    echo "Options:"
    echo "  -h          Print this Help."
    echo "  -c          Create a new ansible project."
    echo "  -s          Show the location of the projects folder."
+   echo "  -n, --shards <N>"
+   echo "              Split the inventory and run the playbook in N parallel containers."
+   echo "  -p, --pool  Run the playbook in a warm container that is reused by the next runs."
+   echo "  -f, --preflight"
+   echo "              Mark the hosts that do not answer on their SSH port as unreachable before the play."
+   echo "  -Q, --no-queue"
+   echo "              Do not wait in the run queue, run the playbook right away."
    echo "  <project>  The name of the ansible project folder."
    echo "  <playbook> The name of the ansible playbook (default=playbook)."
    echo
@@ -61,6 +89,10 @@ Debug()
   echo "projectdir: $PROJECT_DIR"
   echo "project: $PROJECT"
   echo "playbook: $PLAYBOOK"
+  echo "shards: $SHARDS"
+  echo "pool: $POOL"
+  echo "queue: $QUEUE"
+  echo "preflight: $PREFLIGHT"
 }
 
 ############################################################
@@ -132,7 +164,24 @@ RunProject()
   fi
 
   cd $SYMLINKDIR
-  make run PROJECT=$PROJECT PLAYBOOK=$PLAYBOOK
+  if [[ "$POOL" -eq 1 ]]
+  then
+    JOB=(make run-pool PROJECT=$PROJECT PLAYBOOK=$PLAYBOOK PREFLIGHT=$PREFLIGHT)
+  elif [[ "$SHARDS" -gt 1 ]]
+  then
+    JOB=(make run-shards PROJECT=$PROJECT PLAYBOOK=$PLAYBOOK SHARDS=$SHARDS PREFLIGHT=$PREFLIGHT)
+  else
+    JOB=(make run PROJECT=$PROJECT PLAYBOOK=$PLAYBOOK PREFLIGHT=$PREFLIGHT)
+  fi
+
+  # wait for a free job slot when the run queue is running
+  if [[ "$QUEUE" -eq 1 && -S "$QUEUE_SOCKET" ]]
+  then
+    python3 tools/runqueue.py --socket "$QUEUE_SOCKET" submit --projects-dir "$PROJECT_BASE" \
+      "$PROJECT" "$PLAYBOOK" -- "${JOB[@]}"
+  else
+    "${JOB[@]}"
+  fi
 }
 
 
@@ -165,8 +214,22 @@ ShowProjectsFolder()
 ############################################################
 # Process the input options. Add options as needed.        #
 ############################################################
+# --shards, --pool, --preflight and --no-queue can be given anywhere, rewrite them for getopts
+ARGS=()
+while [ $# -gt "0" ]; do
+  case "$1" in
+    --shards) ARGS=("-n" "$2" "${ARGS[@]}"); shift 2;;
+    --shards=*) ARGS=("-n" "${1#--shards=}" "${ARGS[@]}"); shift;;
+    --pool) ARGS=("-p" "${ARGS[@]}"); shift;;
+    --preflight) ARGS=("-f" "${ARGS[@]}"); shift;;
+    --no-queue) ARGS=("-Q" "${ARGS[@]}"); shift;;
+    *) ARGS+=("$1"); shift;;
+  esac
+done
+set -- "${ARGS[@]}"
+
 # Get the options
-while getopts ":hsc:" option; do
+while getopts ":hsc:n:pfQ" option; do
    case $option in
       h) # display Help
          Help
@@ -178,12 +241,32 @@ while getopts ":hsc:" option; do
       s) # Show projects folder
          ShowProjectsFolder
          exit;;
+      n) # number of shards
+         SHARDS=${OPTARG}
+         if ! [[ "$SHARDS" =~ ^[1-9][0-9]*$ ]]
+         then
+           echo "Error: the number of shards must be a positive number"
+           exit $E_BADARGS
+         fi;;
+      p) # warm pool container
+         POOL=1;;
+      f) # probe the hosts before the play
+         PREFLIGHT=yes;;
+      Q) # bypass the run queue
+         QUEUE=0;;
      \?) # Invalid option
          echo "Error: Invalid option"
          Help
          exit;;
    esac
 done
+shift $((OPTIND - 1))
+
+if [[ "$POOL" -eq 1 && "$SHARDS" -gt 1 ]]
+then
+  echo "Error: --pool and --shards can not be combined"
+  exit $E_BADARGS
+fi
 
 # check user permissions
 Checkgroup
@@ -0,0 +1,180 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+DOCUMENTATION = """
+---
+author: Maarten Wallraf
+name: oneos_preflight
+type: aggregate
+short_description: Marks the hosts that do not answer on their SSH port as unreachable before the play starts
+description:
+  - When a play starts the SSH port (ansible_port, default 22) of every host of the play is probed at the
+    same time with asyncio. Hosts that do not accept the TCP connection and send their SSH banner within
+    the timeout are marked unreachable before the first task, so they don't hold a fork for the SSH and
+    command timeouts and the reachable hosts get all the forks.
+  - The unreachable hosts are counted in the play recap and the run stats (unreachable), the reasons are
+    added to the custom stats as oneos_preflight and written as JSON to the artifacts folder of the job.
+  - Hosts with a local connection are not probed, nor are hosts behind a jump host (ansible_oneos_bastion)
+    which are not reachable from the runner itself.
+requirements:
+  - enable in configuration (ANSIBLE_CALLBACKS_ENABLED=oneos_preflight, make run PREFLIGHT=yes)
+options:
+  timeout:
+    type: float
+    default: 2
+    description:
+    - Seconds a host may take to accept the TCP connection.
+    env:
+    - name: ONEOS_PREFLIGHT_TIMEOUT
+    ini:
+    - section: callback_oneos_preflight
+      key: timeout
+  banner:
+    type: bool
+    default: true
+    description:
+    - The host must also send its SSH banner within the timeout, a firewall or NAT device can accept
+      the TCP connection of a host that is down.
+    env:
+    - name: ONEOS_PREFLIGHT_BANNER
+    ini:
+    - section: callback_oneos_preflight
+      key: banner
+  concurrency:
+    type: int
+    default: 500
+    description:
+    - Maximum number of probes that run at the same time.
+    env:
+    - name: ONEOS_PREFLIGHT_CONCURRENCY
+    ini:
+    - section: callback_oneos_preflight
+      key: concurrency
+  path:
+    type: str
+    description:
+    - File the probe results are written to, default preflight.json in the artifacts folder of the job.
+    env:
+    - name: ONEOS_PREFLIGHT_PATH
+    ini:
+    - section: callback_oneos_preflight
+      key: path
+"""
+
+import json
+import os
+import time
+
+from ansible import constants as C
+from ansible.plugins.callback import CallbackBase
+from ansible.plugins.strategy import StrategyBase
+from ansible.template import Templar
+
+from oneos.preflight import probe
+
+
+DEFAULT_ARTIFACT_DIR = '/runner/artifacts'
+
+DEFAULT_PORT = 22
+
+LOCAL_CONNECTIONS = ('local', 'ansible.builtin.local')
+
+
+def _wrap_strategy(callback):
+    """
+    The strategy is created after v2_playbook_on_play_start and before the
+    unreachable hosts of the task queue manager are removed from the play,
+    the probes run when it is created.
+    """
+    init = StrategyBase.__init__
+    init = getattr(init, '__wrapped__', init)
+
+    def __init__(self, tqm, *args, **kwargs):
+        init(self, tqm, *args, **kwargs)
+        callback.preflight(tqm)
+
+    __init__.__wrapped__ = init
+    StrategyBase.__init__ = __init__
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'oneos_preflight'
+    CALLBACK_NEEDS_ENABLED = True
+    # ansible < 2.11
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        self.artifact_dir = os.environ.get('AWX_ISOLATED_DATA_DIR') or DEFAULT_ARTIFACT_DIR
+        self.play = None
+        self.results = {}
+        _wrap_strategy(self)
+
+    def v2_playbook_on_play_start(self, play):
+        self.play = play
+
+    def targets(self, tqm, hosts):
+        """
+        Returns {host: (address, port)} of the hosts that are probed, the
+        hosts behind a bastion are only reachable through the bastion.
+        """
+        targets = {}
+        for host in hosts:
+            variables = tqm._variable_manager.get_vars(play=self.play, host=host, include_hostvars=False)
+            templar = Templar(loader=tqm._loader, variables=variables)
+            if templar.template(variables.get('ansible_connection', '')) in LOCAL_CONNECTIONS:
+                continue
+            if templar.template(variables.get('ansible_oneos_bastion')):
+                continue
+            address = templar.template(variables.get('ansible_host', host.get_name()))
+            port = int(templar.template(variables.get('ansible_port') or DEFAULT_PORT))
+            targets[host.get_name()] = (str(address), port)
+        return targets
+
+    def preflight(self, tqm):
+        play, self.play = self.play, None
+        if play is None:
+            return
+
+        start = time.time()
+        hosts = [host for host in tqm._inventory.get_hosts(play.hosts, order=play.order)
+                 if host.get_name() not in tqm._unreachable_hosts]
+        targets = self.targets(tqm, hosts)
+        results = probe(targets, self.get_option('timeout'), self.get_option('banner'),
+                        self.get_option('concurrency'))
+
+        unreachable = {}
+        for name, (reachable, error, seconds) in sorted(results.items()):
+            address, port = targets[name]
+            self.results[name] = {'address': address, 'port': port, 'reachable': reachable,
+                                  'error': error, 'seconds': round(seconds, 3)}
+            if not reachable:
+                unreachable[name] = error
+                tqm._unreachable_hosts[name] = True
+                tqm._stats.increment('dark', name)
+        if unreachable:
+            tqm._stats.set_custom_stats('oneos_preflight', unreachable)
+
+        self._display.display("PREFLIGHT: %d of %d hosts reachable, %.2fs"
+                              % (len(results) - len(unreachable), len(results), time.time() - start))
+        for name, error in sorted(unreachable.items()):
+            self._display.display("  %s (%s:%d): %s" % (name, targets[name][0], targets[name][1], error),
+                                  color=C.COLOR_UNREACHABLE)
+        self.write()
+
+    def write(self):
+        path = self.get_option('path') or os.path.join(self.artifact_dir, 'preflight.json')
+        try:
+            with open(path, 'w') as f:
+                json.dump(self.results, f, indent=2, sort_keys=True)
+        except (IOError, OSError) as exc:
+            self._display.warning("oneos_preflight: can't write %s: %s" % (path, exc))
@@ -0,0 +1,314 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+DOCUMENTATION = """
+---
+author: Maarten Wallraf
+name: oneos_timeline
+type: aggregate
+short_description: Splits the wall time of a job in phases
+description:
+  - Records when the container, ansible-runner and ansible-playbook were started and how long the
+    playbook took, with the time spent loading variables, decrypting vault data and setting up the
+    connection of every host. The hits of the vault cache are added when oneos_vault_cache is enabled.
+  - The timeline is written as JSON to the artifacts folder of the job. C(make run) adds the container
+    start and the artifact write (tools/timeline.py) and prints the report, when the playbook is started
+    in another way the report is printed by this callback.
+  - The per-host connect time is the time spent in starting (or reusing) the persistent connection
+    for every task, the SSH and terminal setup are included. With ansible_oneos_metrics enabled the
+    SSH and terminal setup times of the cliconf plugins are added.
+requirements:
+  - enable in configuration (ANSIBLE_CALLBACKS_ENABLED=oneos_timeline)
+options:
+  path:
+    type: str
+    description:
+    - File the timeline is written to, default timeline.json in the artifacts folder of the job.
+    env:
+    - name: ONEOS_TIMELINE_PATH
+    ini:
+    - section: callback_oneos_timeline
+      key: path
+  metrics_dir:
+    type: str
+    default: /runner/artifacts/metrics
+    description:
+    - Folder of the oneos cliconf metrics (ansible_oneos_metrics_dir).
+    env:
+    - name: ANSIBLE_ONEOS_METRICS_DIR
+    ini:
+    - section: callback_oneos_timeline
+      key: metrics_dir
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from ansible.executor import task_executor
+from ansible.parsing.vault import VaultLib
+from ansible.plugins.callback import CallbackBase
+from ansible.vars.manager import VariableManager
+
+from oneos.timeline import format_report
+from oneos.vault_cache import current as vault_cache
+
+
+DEFAULT_ARTIFACT_DIR = '/runner/artifacts'
+
+TOP_TASKS = 10
+
+
+def process_start(pid='self'):
+    """
+    Returns the start time of a process as a unix timestamp, None when it
+    can't be read from /proc.
+    """
+    try:
+        with open('/proc/%s/stat' % pid) as f:
+            # the command name can contain spaces, the fields follow the last ')'
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/stat') as f:
+            btime = [int(line.split()[1]) for line in f if line.startswith('btime')][0]
+        return btime + float(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+
+class Events(object):
+    """
+    Accumulates durations per (kind, key). The worker processes are forked
+    from the controller, their durations are appended to a file that is read
+    by the controller.
+    """
+
+    def __init__(self, path):
+        self.pid = os.getpid()
+        self.path = path
+        self.totals = {}
+
+    def add(self, kind, key, seconds):
+        if os.getpid() == self.pid:
+            total = self.totals.setdefault((kind, key), [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+            return
+        try:
+            # a single short write with O_APPEND is not interleaved with the other workers
+            with open(self.path, 'a') as f:
+                f.write(json.dumps([kind, key, seconds]) + "\n")
+        except (IOError, OSError):
+            pass
+
+    def collect(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        kind, key, seconds = json.loads(line)
+                    except ValueError:
+                        continue
+                    total = self.totals.setdefault((kind, key), [0, 0.0])
+                    total[0] += 1
+                    total[1] += seconds
+            os.remove(self.path)
+        except (IOError, OSError):
+            pass
+        return self.totals
+
+    def by_kind(self, kind):
+        return dict((key, value) for (k, key), value in self.totals.items() if k == kind)
+
+
+def _wrap(owner, name, events, kind, key=None):
+    """
+    Replaces owner.name by a wrapper that adds the duration of every call to
+    events, the original is kept in __wrapped__ so it is only wrapped once.
+    """
+    func = getattr(owner, name)
+    func = getattr(func, '__wrapped__', func)
+
+    def wrapper(*args, **kwargs):
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            events.add(kind, key(*args) if key else '', time.time() - start)
+
+    wrapper.__wrapped__ = func
+    setattr(owner, name, wrapper)
+
+
+def _connection_address(play_context, *args):
+    return play_context.remote_addr or ''
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'oneos_timeline'
+    CALLBACK_NEEDS_ENABLED = True
+    # ansible < 2.11
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        self.marks = {
+            'job_start': _float(os.environ.get('RUNNER_JOB_START')),
+            'container_start': process_start(1),
+            'playbook_process_start': process_start(),
+            'callback_loaded': time.time(),
+        }
+        self.artifact_dir = os.environ.get('AWX_ISOLATED_DATA_DIR') or DEFAULT_ARTIFACT_DIR
+        self.tasks = {}
+        self.task_names = {}
+        self.running = {}
+        self.hosts = {}
+        self.addresses = {}
+
+        fd, events_path = tempfile.mkstemp(prefix='.oneos_timeline.', suffix='.jsonl')
+        os.close(fd)
+        self.events = Events(events_path)
+        _wrap(VariableManager, 'get_vars', self.events, 'vars')
+        _wrap(VaultLib, 'decrypt_and_get_vault_id', self.events, 'vault')
+        _wrap(task_executor, 'start_connection', self.events, 'connect', _connection_address)
+
+    def _mark(self, name):
+        self.marks.setdefault(name, time.time())
+
+    def v2_playbook_on_start(self, playbook):
+        self._mark('playbook_start')
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._mark('first_task_start')
+        self.task_names[task._uuid] = task.get_name()
+
+    v2_playbook_on_handler_task_start = v2_playbook_on_task_start
+
+    def v2_runner_on_start(self, host, task):
+        self.running[(host.get_name(), task._uuid)] = time.time()
+        self.addresses.setdefault(host.vars.get('ansible_host', host.get_name()), host.get_name())
+
+    def _task_done(self, result, *args, **kwargs):
+        host = result._host.get_name()
+        start = self.running.pop((host, result._task._uuid), None)
+        if start is None:
+            return
+        seconds = time.time() - start
+        self.hosts[host] = self.hosts.get(host, 0.0) + seconds
+        self.tasks[result._task._uuid] = self.tasks.get(result._task._uuid, 0.0) + seconds
+
+    v2_runner_on_ok = _task_done
+    v2_runner_on_failed = _task_done
+    v2_runner_on_skipped = _task_done
+    v2_runner_on_unreachable = _task_done
+
+    def v2_playbook_on_stats(self, stats):
+        self._mark('playbook_end')
+        self.events.collect()
+
+        timeline = self.timeline()
+        path = self.get_option('path') or os.path.join(self.artifact_dir, 'timeline.json')
+        try:
+            with open(path, 'w') as f:
+                json.dump(timeline, f, indent=2, sort_keys=True)
+        except (IOError, OSError) as exc:
+            self._display.warning("oneos_timeline: can't write %s: %s" % (path, exc))
+
+        if self.marks['job_start'] is None:
+            # make run prints the complete report with tools/timeline.py
+            self._display.banner("JOB TIMELINE")
+            self._display.display(format_report(timeline))
+
+    def metrics(self):
+        """
+        Returns the SSH and terminal setup per inventory host of the oneos
+        cliconf metrics that were written during this playbook.
+        """
+        result = {}
+        path = self.get_option('metrics_dir')
+        if not path or not os.path.isdir(path):
+            return result
+        for name in os.listdir(path):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(path, name)) as f:
+                    data = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue
+            if data.get('started', 0) < self.marks['callback_loaded']:
+                continue
+            result[self.addresses.get(data['host'], data['host'])] = dict(
+                ('%s %s' % (m['phase'], m['command']), m['sum'])
+                for m in data.get('metrics', []) if m['phase'] in ('connect', 'terminal')
+            )
+        return result
+
+    def timeline(self):
+        marks = self.marks
+        playbook_start = marks.get('playbook_start', marks['callback_loaded'])
+        bounds = [
+            ('collection and plugin import, inventory parse', marks['playbook_process_start'], playbook_start),
+            ('task execution', playbook_start, marks['playbook_end']),
+        ]
+        if marks['job_start'] is not None:
+            # started by make run, pid 1 is the entrypoint of the container. A pool
+            # container (tools/pool.py) was already running when the job started.
+            container_start = marks['container_start']
+            if container_start is not None:
+                container_start = max(container_start, marks['job_start'])
+            bounds[:0] = [
+                ('container start', marks['job_start'], container_start),
+                ('ansible-runner setup', container_start, marks['playbook_process_start']),
+            ]
+        phases = []
+        for name, start, end in bounds:
+            if start is not None and end is not None:
+                phases.append({'name': name, 'start': start, 'end': end, 'seconds': max(end - start, 0.0)})
+
+        totals = self.events.totals
+        vars_count, vars_seconds = totals.get(('vars', ''), (0, 0.0))
+        vault_count, vault_seconds = totals.get(('vault', ''), (0, 0.0))
+        connect = {}
+        for address, (count, seconds) in self.events.by_kind('connect').items():
+            host = connect.setdefault(self.addresses.get(address, address), {'count': 0, 'seconds': 0.0})
+            host['count'] += count
+            host['seconds'] += seconds
+        for host, setup in self.metrics().items():
+            connect.setdefault(host, {'count': 0, 'seconds': 0.0})['setup'] = setup
+
+        tasks = sorted(self.tasks.items(), key=lambda item: item[1], reverse=True)[:TOP_TASKS]
+        timeline = {
+            'marks': marks,
+            'phases': phases,
+            'task_execution': {
+                'vars_load': {'count': vars_count, 'seconds': vars_seconds},
+                'vault_decrypt': {'count': vault_count, 'seconds': vault_seconds},
+                'connect': connect,
+                'hosts': self.hosts,
+                'slowest_tasks': [{'name': self.task_names.get(uuid, uuid), 'seconds': seconds}
+                                  for uuid, seconds in tasks],
+            },
+        }
+        cache = vault_cache()
+        if cache is not None:
+            # oneos_vault_cache, the decryption calls above are the misses
+            timeline['task_execution']['vault_cache'] = cache.stats()
+        return timeline
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
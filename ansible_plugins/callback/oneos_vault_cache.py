@@ -0,0 +1,82 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+DOCUMENTATION = """
+---
+author: Maarten Wallraf
+name: oneos_vault_cache
+type: aggregate
+short_description: Decrypts every vaulted value at most once per run
+description:
+  - Without the cache every vaulted value (ansible_password, vaulted group and host vars) is decrypted,
+    with its PBKDF2 key derivation, every time it is used by a task of a host.
+  - The vaulted values are decrypted in the controller when they are loaded (or when the play starts) and
+    the plaintext is kept in memory that is locked and excluded from core dumps, the worker processes of
+    the tasks use it. A value that is not cached is decrypted in the worker without caching it, only the
+    controller writes to the locked memory. The cache is never written to a file and it is wiped when the
+    playbook ends.
+  - The hits and misses are added to the job timeline (oneos_timeline) and are shown with -v.
+  - When the memory can't be locked (ulimit -l) or is full the values are decrypted as without the cache.
+requirements:
+  - enable in configuration (ANSIBLE_CALLBACKS_ENABLED=oneos_vault_cache), enabled by make run
+options:
+  size:
+    type: int
+    default: 32768
+    description:
+    - Bytes of locked memory that hold the plaintexts, the locked memory limit of the process must
+      allow it.
+    env:
+    - name: ONEOS_VAULT_CACHE_SIZE
+    ini:
+    - section: callback_oneos_vault_cache
+      key: size
+"""
+
+from ansible.plugins.callback import CallbackBase
+
+from oneos.vault_cache import install, prewarm
+
+
+class CallbackModule(CallbackBase):
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'oneos_vault_cache'
+    CALLBACK_NEEDS_ENABLED = True
+    # ansible < 2.11
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self, *args, **kwargs):
+        super(CallbackModule, self).__init__(*args, **kwargs)
+        self.cache = None
+
+    def set_options(self, *args, **kwargs):
+        super(CallbackModule, self).set_options(*args, **kwargs)
+        self.cache = install(self.get_option('size'))
+        if not self.cache.locked:
+            self._display.warning("oneos_vault_cache: can't lock %d bytes of memory (ulimit -l), "
+                                  "vaulted values are not cached" % self.cache.size)
+
+    def v2_playbook_on_play_start(self, play):
+        # the extra vars and inventory vars were loaded before the cache was installed
+        variable_manager = play.get_variable_manager()
+        prewarm(variable_manager.extra_vars)
+        prewarm(play.vars)
+        inventory = variable_manager._inventory
+        if inventory is not None:
+            for group in inventory.groups.values():
+                prewarm(group.vars)
+            for host in inventory.hosts.values():
+                prewarm(host.vars)
+
+    def v2_playbook_on_stats(self, stats):
+        if self.cache is not None:
+            self._display.v("VAULT CACHE: %(hits)d hits, %(misses)d misses, %(entries)d values, "
+                            "%(bytes)d of %(size)d bytes locked" % self.cache.stats())
@@ -14,15 +14,277 @@ short_description: Cliconf plugin to configure and run CLI commands on Nokia SR
 description:
   - This plugin provides low level abstraction APIs for sending CLI commands and
     receiving responses from Nokia SR OS network devices.
+  - get_config(sections=...) returns the blocks of the given top level lines, OneOS 5 has no filter for
+    them so the complete running-config is fetched.
+  - get_diff(fetch_running=True) fetches the running-config itself, only for callers of the get_diff rpc,
+    cli_config always fetches the running-config and passes it.
+options:
+  facts_cache_path:
+    type: str
+    default: /runner/artifacts/oneos_facts_cache.db
+    description:
+    - Location of the SQLite database that caches the device_info between runs.
+    env:
+    - name: ANSIBLE_ONEOS_FACTS_CACHE_PATH
+    vars:
+    - name: ansible_oneos_facts_cache_path
+  facts_cache_ttl:
+    type: int
+    default: 86400
+    description:
+    - Maximum age in seconds of a cached device_info, 0 means no expiry.
+    - A cached entry is always refreshed when the device rebooted or runs another image.
+    env:
+    - name: ANSIBLE_ONEOS_FACTS_CACHE_TTL
+    vars:
+    - name: ansible_oneos_facts_cache_ttl
+  facts_cache_max_entries:
+    type: int
+    default: 20000
+    description:
+    - Maximum number of hosts kept in the cache, least recently used hosts are evicted first.
+    env:
+    - name: ANSIBLE_ONEOS_FACTS_CACHE_MAX_ENTRIES
+    vars:
+    - name: ansible_oneos_facts_cache_max_entries
+  facts_cache_bypass:
+    type: boolean
+    default: false
+    description:
+    - Always collect the device_info from the device and don't use the cache.
+    env:
+    - name: ANSIBLE_ONEOS_FACTS_CACHE_BYPASS
+    vars:
+    - name: ansible_oneos_facts_cache_bypass
+  capabilities_device_info:
+    type: boolean
+    default: false
+    description:
+    - Include the device_info in the result of get_capabilities.
+    - When disabled the device_info is only collected when it is requested with the get_device_info rpc.
+    env:
+    - name: ANSIBLE_ONEOS_CAPABILITIES_DEVICE_INFO
+    vars:
+    - name: ansible_oneos_capabilities_device_info
+  batch_size:
+    type: int
+    default: 20
+    description:
+    - Maximum number of commands that are written to the device at once by run_commands_batch.
+    env:
+    - name: ANSIBLE_ONEOS_BATCH_SIZE
+    vars:
+    - name: ansible_oneos_batch_size
+  config_stream_dir:
+    type: str
+    default: /runner/artifacts/configs
+    description:
+    - Folder where stream_config writes the configuration if no path is given.
+    env:
+    - name: ANSIBLE_ONEOS_CONFIG_STREAM_DIR
+    vars:
+    - name: ansible_oneos_config_stream_dir
+  diff_engine:
+    type: str
+    default: networkconfig
+    choices:
+    - networkconfig
+    - indexed
+    description:
+    - Implementation used by get_diff, C(networkconfig) uses NetworkConfig.difference,
+      C(indexed) indexes the running-config once which is a lot faster on large configs
+      and gives the same result.
+    env:
+    - name: ANSIBLE_ONEOS_DIFF_ENGINE
+    vars:
+    - name: ansible_oneos_diff_engine
+  config_mode:
+    type: str
+    default: line
+    choices:
+    - line
+    - bulk
+    - file
+    description:
+    - How edit_config sends the candidate to the device. C(line) sends every line and
+      waits for the prompt, C(bulk) writes batch_size lines at once and checks the
+      echoed output of every line for errors. A bulk chunk ends after a line with
+      children, when a line fails the lines after it in the same chunk were already
+      sent, they are listed in the error. C(file) uploads the candidate to
+      config_file_dir and loads it with config_load_command (line mode is used
+      if the upload fails).
+    env:
+    - name: ANSIBLE_ONEOS_CONFIG_MODE
+    vars:
+    - name: ansible_oneos_config_mode
+  config_file_dir:
+    type: str
+    default: /BSA/config
+    description:
+    - Folder on the device where the candidate is uploaded in file mode.
+    env:
+    - name: ANSIBLE_ONEOS_CONFIG_FILE_DIR
+    vars:
+    - name: ansible_oneos_config_file_dir
+  config_file_proto:
+    type: str
+    default: sftp
+    choices:
+    - sftp
+    - scp
+    description:
+    - Protocol used to transfer files, used by the file mode of edit_config and by backup_config.
+    env:
+    - name: ANSIBLE_ONEOS_CONFIG_FILE_PROTO
+    vars:
+    - name: ansible_oneos_config_file_proto
+  config_load_command:
+    type: str
+    default: copy {path} running-config
+    description:
+    - Command that merges the uploaded candidate in the running-config, {path} is
+      replaced by the location of the file on the device.
+    env:
+    - name: ANSIBLE_ONEOS_CONFIG_LOAD_COMMAND
+    vars:
+    - name: ansible_oneos_config_load_command
+  config_delete_command:
+    type: str
+    default: rm {path}
+    description:
+    - Command that removes the uploaded candidate from the device after it was loaded,
+      {path} is replaced by the location of the file on the device.
+    env:
+    - name: ANSIBLE_ONEOS_CONFIG_DELETE_COMMAND
+    vars:
+    - name: ansible_oneos_config_delete_command
+  metrics:
+    type: boolean
+    default: false
+    description:
+    - Record the wall time, received bytes and prompt match time of the SSH setup, the
+      terminal setup and every command, see plugin_utils/oneos/instrument.py.
+    env:
+    - name: ANSIBLE_ONEOS_METRICS
+    vars:
+    - name: ansible_oneos_metrics
+  metrics_dir:
+    type: str
+    default: /runner/artifacts/metrics
+    description:
+    - Folder where the metrics are written per host as JSON (<host>.json) and in the
+      Prometheus text format (<host>.prom).
+    env:
+    - name: ANSIBLE_ONEOS_METRICS_DIR
+    vars:
+    - name: ansible_oneos_metrics_dir
+  profile:
+    type: boolean
+    default: false
+    description:
+    - Profile the CPU (cProfile) and memory allocations (tracemalloc) of the persistent connection
+      process, the dumps are written when the connection is closed.
+    - Use tools/merge_profiles.py to merge the dumps of all hosts.
+    env:
+    - name: ANSIBLE_ONEOS_PROFILE
+    vars:
+    - name: ansible_oneos_profile
+  profile_dir:
+    type: str
+    description:
+    - Folder where the profiles are written per host, default the profiles folder in the artifacts
+      folder of the job (artifacts/<ident>/profiles).
+    env:
+    - name: ANSIBLE_ONEOS_PROFILE_DIR
+    vars:
+    - name: ansible_oneos_profile_dir
+  login_rate:
+    type: float
+    default: 0
+    description:
+    - Maximum number of SSH logins per second of all hosts, shared by all forks through
+      login_state_path (a token bucket, see plugin_utils/oneos/ratelimit.py). 0 disables the limit.
+    env:
+    - name: ANSIBLE_ONEOS_LOGIN_RATE
+    vars:
+    - name: ansible_oneos_login_rate
+  login_burst:
+    type: int
+    default: 10
+    description:
+    - Number of SSH logins that can start at once before login_rate applies.
+    env:
+    - name: ANSIBLE_ONEOS_LOGIN_BURST
+    vars:
+    - name: ansible_oneos_login_burst
+  login_backoff:
+    type: float
+    default: 5
+    description:
+    - Seconds all logins wait after a failed authentication, doubled for every failure in a row.
+    env:
+    - name: ANSIBLE_ONEOS_LOGIN_BACKOFF
+    vars:
+    - name: ansible_oneos_login_backoff
+  login_retries:
+    type: int
+    default: 2
+    description:
+    - Number of times the login of a host is retried after a failed authentication.
+    env:
+    - name: ANSIBLE_ONEOS_LOGIN_RETRIES
+    vars:
+    - name: ansible_oneos_login_retries
+  login_state_path:
+    type: str
+    default: /runner/artifacts/.oneos_login_limiter
+    description:
+    - State file of the login rate limiter, the containers that mount the same file share the limit.
+    env:
+    - name: ANSIBLE_ONEOS_LOGIN_STATE_PATH
+    vars:
+    - name: ansible_oneos_login_state_path
+  bastion:
+    type: str
+    description:
+    - Jump host of the device as [user@]host[:port]. All devices with the same bastion share a single
+      SSH session to it (OpenSSH ControlMaster), a device connection only opens a channel in that
+      session. See plugin_utils/oneos/bastion.py.
+    env:
+    - name: ANSIBLE_ONEOS_BASTION
+    vars:
+    - name: ansible_oneos_bastion
+  bastion_persist:
+    type: int
+    description:
+    - Seconds the bastion session stays open after the last device closed its channel, default the
+      idle_timeout of env/settings.
+    env:
+    - name: ANSIBLE_ONEOS_BASTION_PERSIST
+    vars:
+    - name: ansible_oneos_bastion_persist
+  bastion_ssh_args:
+    type: str
+    default: -o StrictHostKeyChecking=accept-new -o ServerAliveInterval=30
+    description:
+    - Extra arguments of the ssh command of the bastion session, for example the key (-i).
+    env:
+    - name: ANSIBLE_ONEOS_BASTION_SSH_ARGS
+    vars:
+    - name: ansible_oneos_bastion_ssh_args
 """
 
-import re
+import os
+import posixpath
 import json
+import tempfile
+import time
 
 from ansible.errors import AnsibleConnectionFailure
 from ansible.module_utils.common._collections_compat import Mapping
 from ansible.module_utils._text import to_text
 from ansible.plugins.cliconf import CliconfBase, enable_mode
+from ansible.utils.display import Display
 
 from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.config import NetworkConfig
 
@@ -33,9 +295,48 @@ except ImportError:
     # if netcommon is not installed, fallback for Ansible 2.8 and 2.9
     from ansible.module_utils.network.common.utils import to_list
 
+from oneos.bastion import attach_bastion
+from oneos.batch import BatchTimeout, config_chunks, drain, run_batch
+from oneos.diff import config_diff
+from oneos.facts_cache import FactsCache, device_fingerprint
+from oneos.instrument import attach_recorder, in_phase, measure
+from oneos.parsers import get_parser, parse
+from oneos.profiler import attach_profiler
+from oneos.ratelimit import attach_login_limiter
+from oneos.stream import stream_command
+from oneos.transfer import download
+
+display = Display()
+
 
 class Cliconf(CliconfBase):
 
+    def __init__(self, *args, **kwargs):
+        super(Cliconf, self).__init__(*args, **kwargs)
+        # get_capabilities() result per connection: (with device_info, json)
+        self._capabilities = None
+
+    def set_options(self, task_keys=None, var_options=None, direct=None):
+        super(Cliconf, self).set_options(task_keys=task_keys, var_options=var_options, direct=direct)
+        if self.get_option('metrics'):
+            attach_recorder(self._connection, self.get_option('metrics_dir'))
+        if self.get_option('profile'):
+            attach_profiler(self._connection, self.get_option('profile_dir'))
+        if self.get_option('login_rate'):
+            attach_login_limiter(self._connection, self.get_option('login_state_path'),
+                                 self.get_option('login_rate'), self.get_option('login_burst'),
+                                 self.get_option('login_backoff'), self.get_option('login_retries'))
+        if self.get_option('bastion'):
+            attach_bastion(self._connection, self.get_option('bastion'), self.get_option('bastion_persist'),
+                           self.get_option('bastion_ssh_args'))
+
+
+    def send_command(self, command=None, *args, **kwargs):
+        with measure(self._connection, to_text(command)) as sample:
+            response = super(Cliconf, self).send_command(command, *args, **kwargs)
+            sample.received = len(response) if response else 0
+        return response
+
     def get_device_operations(self):
         return {                                    # supported: ---------------
     #         'supports_commit': False,                # identify if commit is supported by device or not
@@ -56,7 +357,12 @@ class Cliconf(CliconfBase):
 
     def get_oneos_rpc(self):
         return [
-            'get_diff'
+            'get_diff',
+            'get_device_info',       # Retrieves the device information, not included in get_capabilities
+            'run_commands_batch',    # Execute a list of commands with a single write to the device
+            'get_parsed',            # Execute show commands and return the parsed output
+            'stream_config',         # Write the configuration to a file on the controller
+            'backup_config',         # Download the startup-config to a file on the controller
             # 'get_config',          # Retrieves the specified configuration from the device
             # 'edit_config',         # Loads the specified commands into the remote device
             # 'get_capabilities',    # Retrieves device information and supported rpc methods
@@ -73,7 +379,15 @@ class Cliconf(CliconfBase):
         }
 
 
-    def get_diff(self, candidate=None, running=None, diff_match='line', diff_ignore_lines=None, path=None, diff_replace='line'):
+    def get_diff(self, candidate=None, running=None, diff_match='line', diff_ignore_lines=None, path=None, diff_replace='line',
+                 fetch_running=False):
+        """
+        Returns the lines of the candidate that are not in the running-config.
+
+        If running is not given and fetch_running is True the running-config
+        is fetched from the device, for callers of the get_diff rpc that don't
+        have it (cli_config always passes running).
+        """
         diff = {} 
 
         device_operations = self.get_device_operations()
@@ -88,6 +402,14 @@ class Cliconf(CliconfBase):
         if diff_replace not in option_values['diff_replace']:
             raise ValueError("'replace' value %s in invalid, valid values are %s" % (diff_replace, ', '.join(option_values['diff_replace'])))
 
+        if running is None and fetch_running and diff_match != 'none':
+            running = self.get_config()
+
+        if self.get_option('diff_engine') == 'indexed':
+            diff['config_diff'] = config_diff(candidate, running, match=diff_match, path=path, replace=diff_replace,
+                                              ignore_lines=diff_ignore_lines)
+            return diff
+
         # prepare candidate configuration
         candidate_obj = NetworkConfig(indent=1)
         candidate_obj.load(candidate)
@@ -123,6 +445,7 @@ class Cliconf(CliconfBase):
 
 
 
+    @in_phase('device_info')
     def get_device_info(self):
         """
         homeoffice159#show system status
@@ -306,124 +629,98 @@ class Cliconf(CliconfBase):
         - allocation group size:	4 clusters
         - free space on volume:	222,011,392 bytes        
         """
-        device_info = dict()
-
-        device_info['network_os_vendor'] = 'ekinops'
-        device_info['network_os_vendor_alt'] = 'oneaccess'
-        device_info['network_os'] = 'OneOS'
-        device_info['network_os_version'] = '5'
-        device_info["network_os_software_location"] = "/BSA/binaries"
-
-        reply = self.get('show running-config |hostname')
-        data = to_text(reply, errors='surrogate_or_strict').strip()
-
-        match = re.search(r'\W*hostname\W+(\S+)\W*$', data, re.M)
-        if match:
-            device_info['network_os_hostname'] = match.group(1)
-
-
-        reply = self.get('show product-info-area')
-        data = to_text(reply, errors='surrogate_or_strict').strip()
-
-        match = re.search(r'\W*Product [Nn]ame\W+(\S+)\W+$', data, re.M)
-        if match:
-            device_info['network_os_platform'] = match.group(1)
-
-        match = re.search(r'\W*Commercial [Nn]ame\W+(\S+)\W+$', data, re.M)
-        if match:
-            device_info['network_os_platform_commercial'] = match.group(1)
-
-        match = re.search(r'\W*Serial [Nn]umber\W+(\S+)\W+$', data, re.M)
-        if match:
-            device_info['network_os_serial_number'] = match.group(1)
-
-
         reply = self.get('show system status')
-        data1 = to_text(reply, errors='surrogate_or_strict').strip()
-
-        match = re.search(r'\W*Software [Vv]ersion\W+(\S+)\W*$', data1, re.M)
-        if match:
-            device_info['network_os_software_version'] = match.group(1)       
-            match2 = re.search(r'.*\-V([0-9]+)', match.group(1))
-            if match2:
-                device_info['network_os_version'] = match2.group(1)
-
-        match = re.search(r'\W*Boot [Vv]ersion\W+(\S+)\W*$', data1, re.M)
-        if match:
-            device_info['network_os_boot_version'] = match.group(1)
-
-        match = re.search(r'\W*License token\W+(\S+)\W*$', data1, re.M)
-        if match:
-            device_info['network_os_license_token'] = match.group(1)
-
-        match = re.search(r'\W*System started\W+(.*)$', data1, re.M)
-        if match:
-            device_info['network_os_system_started'] = match.group(1)
-
-        match = re.search(r'\W*Sys Up time\W+(.*)$', data1, re.M)
-        if match:
-            device_info['network_os_system_uptime'] = match.group(1)
+        status = to_text(reply, errors='surrogate_or_strict').strip()
 
-        match = re.search(r'\W*System clock ticks\W+(.*)$', data1, re.M)
-        if match:
-            device_info['network_os_system_uptime_secs'] = match.group(1)
+        host = self._connection.get_option('host')
+        fingerprint = device_fingerprint(status)
+        cache = self._get_facts_cache() if fingerprint else None
 
-        match = re.search(r'\W*Start caused by\W+(.*)$', data1, re.M)
-        if match:
-            device_info['network_os_system_restart_cause'] = match.group(1)
+        if cache:
+            device_info = cache.get(host, fingerprint)
+            if device_info is not None:
+                # uptime related facts are always taken from the device
+                device_info.update(parse('oneos5', 'show system status', status))
+                return device_info
 
-        match = re.search(r'\W*OneOS Ram size\W+(\d+)Mo', data1, re.M)
-        if match:
-            device_info['network_os_diskspace_total_bytes'] = int(match.group(1))*1000
+        device_info = self._collect_device_info(status)
 
+        if cache:
+            cache.set(host, fingerprint, device_info)
 
-        reply = self.get('ls /BSA/binaries')
-        data2 = to_text(reply, errors='surrogate_or_strict').strip()
+        return device_info
 
-        matches = re.finditer(r'\W+(\S+)\s+([0-9]{2,})$', data2, re.M)
-        if matches:
-            boot_files = []
-            for matchNum, match in enumerate(matches, start=1):
-                boot_files.append({"file": match.group(1), "size": match.group(2)})
-            device_info['network_os_boot_available_files'] = boot_files
 
+    def _get_facts_cache(self):
+        if self.get_option('facts_cache_bypass'):
+            return None
 
-        reply = self.get('cat /BSA/bsaBoot.inf')
-        data3 = to_text(reply, errors='surrogate_or_strict').strip()
+        return FactsCache(path=self.get_option('facts_cache_path'),
+                          ttl=self.get_option('facts_cache_ttl'),
+                          max_entries=self.get_option('facts_cache_max_entries'))
 
-        match = re.search(r'flash:(/BSA/binaries/\w+)$', data3, re.M)
-        if match:
-            device_info['network_os_boot_startup_image'] = match.group(1)
 
-        match = re.search(r'flash:(/BSA/config/\S+)$', data3, re.M)
-        if match:
-            device_info['network_os_startup_config'] = match.group(1)
+    def _get_outputs(self, commands):
+        """
+        Runs the commands in one batch and returns the output per command,
+        the output of a failed command is empty. When the output of the batch
+        can't be split per command the commands are sent one by one.
+        """
+        try:
+            results = self._run_batch(commands)
+        except BatchTimeout as exc:
+            display.warning("%s, sending the commands one by one" % to_text(exc))
+            drain(self._connection)
+            outputs = {}
+            for command in commands:
+                try:
+                    outputs[command] = self.get(command)
+                except AnsibleConnectionFailure:
+                    outputs[command] = ''
+            return outputs
+
+        return dict((r['command'], '' if r['error'] else r['output']) for r in results)
+
+
+    def _collect_device_info(self, status):
+        commands = [
+                    'show running-config |hostname',
+                    'show product-info-area',
+                    'ls /BSA/binaries',
+                    'cat /BSA/bsaBoot.inf',
+                    'show device status flash'
+        ]
+        outputs = self._get_outputs(commands)
 
+        device_info = dict()
 
-        reply = self.get('show device status flash')
-        data4 = to_text(reply, errors='surrogate_or_strict').strip()
+        device_info['network_os_vendor'] = 'ekinops'
+        device_info['network_os_vendor_alt'] = 'oneaccess'
+        device_info['network_os'] = 'OneOS'
+        device_info['network_os_version'] = '5'
+        device_info["network_os_software_location"] = "/BSA/binaries"
 
-        match = re.search(r'\Wfree space on volume:\W+(\S+)', data4, re.M)
-        if match:
-            device_info['network_os_diskspace_free_bytes'] = match.group(1).replace(",", "")
+        device_info.update(parse('oneos5', 'show system status', status))
 
+        for command in commands:
+            device_info.update(parse('oneos5', command, outputs[command]))
 
         return device_info
 
 
     def get_capabilities(self):
-        result = super(Cliconf, self).get_capabilities()
-        return json.dumps(result)        
-
-
-    def get_capabilities(self):
-        capabilities = super(Cliconf, self).get_capabilities()
-        capabilities['device_operations'] = self.get_device_operations()
-        capabilities['rpc'] += self.get_oneos_rpc()
-        capabilities['device_info'] = self.get_device_info()
-        capabilities['network_api'] = 'cliconf'
-        capabilities.update(self.get_option_values())
-        return json.dumps(capabilities)
+        include_device_info = self.get_option('capabilities_device_info')
+        if self._capabilities is None or self._capabilities[0] != include_device_info:
+            capabilities = dict()
+            capabilities['rpc'] = self.get_base_rpc() + self.get_oneos_rpc()
+            capabilities['device_operations'] = self.get_device_operations()
+            if include_device_info:
+                capabilities['device_info'] = self.get_device_info()
+            capabilities['network_api'] = 'cliconf'
+            capabilities.update(self.get_option_values())
+            self._capabilities = (include_device_info, json.dumps(capabilities))
+
+        return self._capabilities[1]
 
     # def get_default_flag(self):
     #     return ['detail']
@@ -434,13 +731,25 @@ class Cliconf(CliconfBase):
     #     match = re.search(r'Configuration Mode Oper:\s+(.+)', data)
     #     return not match or match.group(1) == 'classic'
 
-    def get_config(self, source='running', format='text', flags=None):
+    def get_config(self, source='running', format='text', flags=None, sections=None):
+        """
+        Returns the running-config, if sections is a list of top level lines
+        (ex. 'interface gigabitethernet 0/1', 'ip vrf CUSTOMER') only these
+        sections are returned. OneOS 5 has no filter that returns a section
+        (|<text> only returns the matching lines), the complete running-config
+        is fetched and the sections are taken from it.
+        """
         if source != 'running':
             raise ValueError("fetching configuration from %s is not supported" % source)
 
         if format != 'text':
             raise ValueError("'format' value %s is invalid. Only format supported is 'text'" % format)
 
+        if sections:
+            if flags:
+                raise ValueError("'flags' can't be combined with 'sections'")
+            return self._get_config_sections(sections)
+
         if not flags:
             flags = []
 
@@ -452,10 +761,128 @@ class Cliconf(CliconfBase):
         return self.send_command(cmd)
 
 
+    def stream_config(self, path=None, source='running', flags=None):
+        """
+        Writes the configuration to a file on the controller while it is
+        received from the device, the configuration itself is never kept in
+        memory. An existing file is only replaced when the configuration
+        differs. Returns the location, size and sha256 of the file:
+
+            {'path': <path>, 'size': <bytes>, 'sha256': <hexdigest>, 'changed': <file was replaced>}
+
+        If no path is given the file is written to
+        <config_stream_dir>/<host>_<source>.cfg
+        """
+        if source != 'running':
+            raise ValueError("fetching configuration from %s is not supported" % source)
+
+        if path is None:
+            path = os.path.join(self.get_option('config_stream_dir'),
+                                '%s_%s.cfg' % (self._connection.get_option('host'), source))
+
+        cmd = "show running-config "
+        cmd += " ".join(to_list(flags))
+        cmd = cmd.strip()
+
+        try:
+            with measure(self._connection, cmd, grouped=False) as sample:
+                result = stream_command(self._connection, cmd, path)
+                sample.received = result['size']
+        except (BatchTimeout, EOFError, OSError) as exc:
+            raise AnsibleConnectionFailure(to_text(exc))
+
+        self.history.append((cmd, '*****'))
+
+        if result.pop('error'):
+            raise AnsibleConnectionFailure("%s failed, the configuration was not written to %s" % (cmd, path))
+
+        return result
+
+
+    def _get_config_sections(self, sections):
+        """
+        Returns the blocks of the top level lines in sections (the line, its
+        children and the closing exit) from the running-config.
+        """
+        sections = set(section.strip() for section in to_list(sections))
+        lines = []
+        inside = False
+        for line in self.get_config().splitlines():
+            if line and not line[0].isspace():
+                if line.strip() == 'exit':
+                    if inside:
+                        lines.append(line)
+                    inside = False
+                    continue
+                inside = line.rstrip() in sections
+            if inside:
+                lines.append(line)
+
+        return "\n".join(lines)
+
+
+    @in_phase('backup_config')
+    def backup_config(self, path=None, source='startup', fallback=True):
+        """
+        Downloads the startup-config that is referenced in /BSA/bsaBoot.inf
+        over sftp/scp to a file on the controller. If the download fails and
+        fallback is True the running-config is written to the file instead
+        (stream_config). With source=running the running-config is always
+        fetched from the terminal.
+
+            {'path': <path>, 'size': <bytes>, 'sha256': <hexdigest>, 'source': <file on the device or running-config>,
+             'method': <sftp, scp or cli>, 'seconds': <transfer time>, 'throughput': <bytes per second>,
+             'changed': <file was replaced>}
+        """
+        if source not in ('startup', 'running'):
+            raise ValueError("'source' value %s is invalid, valid values are startup, running" % source)
+
+        host = self._connection.get_option('host')
+        folder = self.get_option('config_stream_dir')
+        result = None
+
+        if source == 'startup':
+            command = 'cat /BSA/bsaBoot.inf'
+            startup_config = parse('oneos5', command, self._get_outputs([command])[command]).get(
+                'network_os_startup_config', '/BSA/config/bsaStart.cfg')
+            proto = self.get_option('config_file_proto')
+            try:
+                with measure(self._connection, 'download %s' % proto) as sample:
+                    result = download(self._connection, startup_config, path or os.path.join(folder, '%s_startup.cfg' % host),
+                                      proto=proto, timeout=self._connection.get_option('persistent_command_timeout'))
+                    sample.received = result['size']
+                result['source'] = startup_config
+                result['method'] = proto
+            except Exception as exc:
+                if not fallback:
+                    raise AnsibleConnectionFailure("unable to download %s: %s" % (startup_config, to_text(exc)))
+                display.warning("unable to download %s, using the running-config: %s" % (startup_config, to_text(exc)))
+
+        if result is None:
+            start = time.time()
+            result = self.stream_config(path=path)
+            result['seconds'] = time.time() - start
+            result['source'] = 'running-config'
+            result['method'] = 'cli'
+
+        result['throughput'] = int(result['size'] / result['seconds']) if result['seconds'] else result['size']
+        return result
+
+
+    @in_phase('edit_config', label='config line')
     def edit_config(self, candidate=None, commit=False, replace=None, comment=None):
         """
         TODO: error when command fails
         """
+        config_mode = self.get_option('config_mode')
+        if config_mode != 'line' and not any(isinstance(cmd, dict) for cmd in to_list(candidate)):
+            if config_mode == 'bulk':
+                return self._edit_config_bulk(candidate)
+
+            resp = self._edit_config_file(candidate)
+            if resp is not None:
+                return resp
+
         resp = {}
         results = []
         requests = []
@@ -486,12 +913,165 @@ class Cliconf(CliconfBase):
         return resp
 
 
+    def _edit_config_bulk(self, candidate):
+        """
+        Writes the candidate in chunks of batch_size lines, the output of every
+        line is checked with terminal_stderr_re. A chunk ends after a line with
+        children, so the children of a line that failed are never sent. When
+        a line fails the remaining chunks are not sent, the lines after it in
+        the same chunk were already sent and are listed in the error.
+        """
+        resp = {}
+        results = []
+        requests = [cmd for cmd in to_list(candidate) if cmd.strip() and cmd != 'end' and cmd[0] != '!']
+
+        for cmd in ["end", "configure terminal"]:
+            self.send_command(cmd)
+
+        try:
+            for chunk in config_chunks(requests, self.get_option('batch_size')):
+                chunk_results = self.run_commands_batch(chunk, check_rc=False)
+                for index, result in enumerate(chunk_results):
+                    if result['error']:
+                        message = "configuration line '%s' failed: %s" % (result['command'], result['error'])
+                        sent = [r['command'] for r in chunk_results[index + 1:]]
+                        if sent:
+                            message += ", the next lines were sent as well: %s" % ", ".join("'%s'" % c for c in sent)
+                        raise AnsibleConnectionFailure(message)
+                    results.append(result['output'])
+        finally:
+            self.send_command('end')
+
+        resp['request'] = requests
+        resp['response'] = results
+        return resp
+
+
+    def _edit_config_file(self, candidate):
+        """
+        Uploads the candidate to the device and merges it in the running-config
+        with a single command, the file is removed from the device afterwards.
+        The output of the load command is checked with terminal_stderr_re.
+        Returns None if the file could not be uploaded.
+
+        The request and response hold the single load command and its output.
+        """
+        resp = {}
+        requests = [cmd for cmd in to_list(candidate) if cmd.strip() and cmd != 'end' and cmd[0] != '!']
+        path = posixpath.join(self.get_option('config_file_dir'), 'ansible_candidate.cfg')
+
+        fd, source = tempfile.mkstemp(suffix='.cfg')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write("\n".join(requests) + "\n")
+
+            self._connection.copy_file(source=source, destination=path, proto=self.get_option('config_file_proto'),
+                                       timeout=self._connection.get_option('persistent_command_timeout'))
+        except Exception as exc:
+            display.warning("unable to upload the candidate to %s, using line mode: %s" % (path, to_text(exc)))
+            return None
+        finally:
+            os.remove(source)
+
+        load_command = self.get_option('config_load_command').format(path=path)
+        try:
+            self.send_command('end')
+            result = self.run_commands_batch([load_command], check_rc=False)[0]
+        finally:
+            try:
+                self.send_command(self.get_option('config_delete_command').format(path=path))
+            except AnsibleConnectionFailure as exc:
+                display.warning("unable to remove the candidate %s from the device: %s" % (path, to_text(exc)))
+
+        if result['error']:
+            raise AnsibleConnectionFailure("loading the candidate %s failed: %s" % (path, result['error']))
+
+        resp['request'] = [load_command]
+        resp['response'] = [result['output']]
+        return resp
+
+
     def get(self, command, prompt=None, answer=None, sendonly=False, output=None, newline=True, check_all=False):
         if output:
             raise ValueError("'output' value %s is not supported for get" % output)
 
         return self.send_command(command=command, prompt=prompt, answer=answer, sendonly=sendonly, newline=newline, check_all=check_all)
 
+
+    def run_commands_batch(self, commands=None, check_rc=True):
+        """
+        Executes a list of commands by writing them to the device at once
+        instead of waiting for the prompt after each command. Returns a list
+        with a dict per command:
+
+            {'command': <command>, 'output': <output>, 'error': <output if terminal_stderr_re matched or None>}
+
+        If check_rc is True an exception is raised for the first failed command.
+        """
+        if commands is None:
+            raise ValueError("'commands' value is required")
+
+        cmds = []
+        for cmd in to_list(commands):
+            if isinstance(cmd, Mapping):
+                if cmd.get('prompt') or cmd.get('answer'):
+                    raise ValueError("prompt and answer are not supported in a batch: %s" % cmd['command'])
+                cmd = cmd['command']
+            cmds.append(cmd)
+
+        try:
+            results = self._run_batch(cmds)
+        except (BatchTimeout, EOFError, OSError) as exc:
+            raise AnsibleConnectionFailure(to_text(exc))
+
+        if check_rc:
+            for result in results:
+                if result['error']:
+                    raise AnsibleConnectionFailure(result['error'])
+
+        return results
+
+
+    def _run_batch(self, commands):
+        """
+        run_batch with the metrics and the command history, raises
+        BatchTimeout when the output can't be split per command in time.
+        """
+        with measure(self._connection, 'batch', grouped=False) as sample:
+            results = run_batch(self._connection, commands, batch_size=self.get_option('batch_size'))
+            sample.received = sum(len(result['output']) for result in results)
+
+        for result in results:
+            if self.response_logging:
+                self.history.append((result['command'], result['output']))
+            else:
+                self.history.append(('*****', '*****'))
+
+        return results
+
+
+    def get_parsed(self, commands=None):
+        """
+        Executes show commands and returns the parsed output per command:
+
+            {'show memory': {'network_os_diskspace_total_bytes': 415300000.0, ...}}
+
+        Only commands with a parser in oneos.parsers are supported.
+        """
+        if commands is None:
+            raise ValueError("'commands' value is required")
+
+        commands = to_list(commands)
+        for command in commands:
+            if get_parser('oneos5', command) is None:
+                raise ValueError("'%s' is not supported by get_parsed" % command)
+
+        parsed = dict()
+        for result in self.run_commands_batch(commands):
+            parsed[result['command']] = parse('oneos5', result['command'], result['output'])
+
+        return parsed
+
     # def rollback(self, rollback_id, commit=True):
     #     if not self.is_classic_mode():
     #         raise ValueError("Nokia SROS node is not running in classic mode. Use ansible_network_os=nokia.sros.md")
@@ -4,7 +4,6 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 from __future__ import (absolute_import, division, print_function)
-from datetime import datetime
 
 __metaclass__ = type
 
@@ -17,15 +16,210 @@ short_description: Cliconf plugin to configure and run CLI commands on Nokia SR
 description:
   - This plugin provides low level abstraction APIs for sending CLI commands and
     receiving responses from Nokia SR OS network devices.
+options:
+  facts_cache_path:
+    type: str
+    default: /runner/artifacts/oneos_facts_cache.db
+    description:
+    - Location of the SQLite database that caches the device_info between runs.
+    env:
+    - name: ANSIBLE_ONEOS_FACTS_CACHE_PATH
+    vars:
+    - name: ansible_oneos_facts_cache_path
+  facts_cache_ttl:
+    type: int
+    default: 86400
+    description:
+    - Maximum age in seconds of a cached device_info, 0 means no expiry.
+    - A cached entry is always refreshed when the device rebooted or runs another image.
+    env:
+    - name: ANSIBLE_ONEOS_FACTS_CACHE_TTL
+    vars:
+    - name: ansible_oneos_facts_cache_ttl
+  facts_cache_max_entries:
+    type: int
+    default: 20000
+    description:
+    - Maximum number of hosts kept in the cache, least recently used hosts are evicted first.
+    env:
+    - name: ANSIBLE_ONEOS_FACTS_CACHE_MAX_ENTRIES
+    vars:
+    - name: ansible_oneos_facts_cache_max_entries
+  facts_cache_bypass:
+    type: boolean
+    default: false
+    description:
+    - Always collect the device_info from the device and don't use the cache.
+    env:
+    - name: ANSIBLE_ONEOS_FACTS_CACHE_BYPASS
+    vars:
+    - name: ansible_oneos_facts_cache_bypass
+  capabilities_device_info:
+    type: boolean
+    default: false
+    description:
+    - Include the device_info in the result of get_capabilities.
+    - When disabled the device_info is only collected when it is requested with the get_device_info rpc.
+    env:
+    - name: ANSIBLE_ONEOS_CAPABILITIES_DEVICE_INFO
+    vars:
+    - name: ansible_oneos_capabilities_device_info
+  batch_size:
+    type: int
+    default: 20
+    description:
+    - Maximum number of commands that are written to the device at once by run_commands_batch.
+    env:
+    - name: ANSIBLE_ONEOS_BATCH_SIZE
+    vars:
+    - name: ansible_oneos_batch_size
+  config_stream_dir:
+    type: str
+    default: /runner/artifacts/configs
+    description:
+    - Folder where stream_config writes the configuration if no path is given.
+    env:
+    - name: ANSIBLE_ONEOS_CONFIG_STREAM_DIR
+    vars:
+    - name: ansible_oneos_config_stream_dir
+  config_file_proto:
+    type: str
+    default: sftp
+    choices:
+    - sftp
+    - scp
+    description:
+    - Protocol used to transfer files, used by backup_config.
+    env:
+    - name: ANSIBLE_ONEOS_CONFIG_FILE_PROTO
+    vars:
+    - name: ansible_oneos_config_file_proto
+  metrics:
+    type: boolean
+    default: false
+    description:
+    - Record the wall time, received bytes and prompt match time of the SSH setup, the
+      terminal setup and every command, see plugin_utils/oneos/instrument.py.
+    env:
+    - name: ANSIBLE_ONEOS_METRICS
+    vars:
+    - name: ansible_oneos_metrics
+  metrics_dir:
+    type: str
+    default: /runner/artifacts/metrics
+    description:
+    - Folder where the metrics are written per host as JSON (<host>.json) and in the
+      Prometheus text format (<host>.prom).
+    env:
+    - name: ANSIBLE_ONEOS_METRICS_DIR
+    vars:
+    - name: ansible_oneos_metrics_dir
+  profile:
+    type: boolean
+    default: false
+    description:
+    - Profile the CPU (cProfile) and memory allocations (tracemalloc) of the persistent connection
+      process, the dumps are written when the connection is closed.
+    - Use tools/merge_profiles.py to merge the dumps of all hosts.
+    env:
+    - name: ANSIBLE_ONEOS_PROFILE
+    vars:
+    - name: ansible_oneos_profile
+  profile_dir:
+    type: str
+    description:
+    - Folder where the profiles are written per host, default the profiles folder in the artifacts
+      folder of the job (artifacts/<ident>/profiles).
+    env:
+    - name: ANSIBLE_ONEOS_PROFILE_DIR
+    vars:
+    - name: ansible_oneos_profile_dir
+  login_rate:
+    type: float
+    default: 0
+    description:
+    - Maximum number of SSH logins per second of all hosts, shared by all forks through
+      login_state_path (a token bucket, see plugin_utils/oneos/ratelimit.py). 0 disables the limit.
+    env:
+    - name: ANSIBLE_ONEOS_LOGIN_RATE
+    vars:
+    - name: ansible_oneos_login_rate
+  login_burst:
+    type: int
+    default: 10
+    description:
+    - Number of SSH logins that can start at once before login_rate applies.
+    env:
+    - name: ANSIBLE_ONEOS_LOGIN_BURST
+    vars:
+    - name: ansible_oneos_login_burst
+  login_backoff:
+    type: float
+    default: 5
+    description:
+    - Seconds all logins wait after a failed authentication, doubled for every failure in a row.
+    env:
+    - name: ANSIBLE_ONEOS_LOGIN_BACKOFF
+    vars:
+    - name: ansible_oneos_login_backoff
+  login_retries:
+    type: int
+    default: 2
+    description:
+    - Number of times the login of a host is retried after a failed authentication.
+    env:
+    - name: ANSIBLE_ONEOS_LOGIN_RETRIES
+    vars:
+    - name: ansible_oneos_login_retries
+  login_state_path:
+    type: str
+    default: /runner/artifacts/.oneos_login_limiter
+    description:
+    - State file of the login rate limiter, the containers that mount the same file share the limit.
+    env:
+    - name: ANSIBLE_ONEOS_LOGIN_STATE_PATH
+    vars:
+    - name: ansible_oneos_login_state_path
+  bastion:
+    type: str
+    description:
+    - Jump host of the device as [user@]host[:port]. All devices with the same bastion share a single
+      SSH session to it (OpenSSH ControlMaster), a device connection only opens a channel in that
+      session. See plugin_utils/oneos/bastion.py.
+    env:
+    - name: ANSIBLE_ONEOS_BASTION
+    vars:
+    - name: ansible_oneos_bastion
+  bastion_persist:
+    type: int
+    description:
+    - Seconds the bastion session stays open after the last device closed its channel, default the
+      idle_timeout of env/settings.
+    env:
+    - name: ANSIBLE_ONEOS_BASTION_PERSIST
+    vars:
+    - name: ansible_oneos_bastion_persist
+  bastion_ssh_args:
+    type: str
+    default: -o StrictHostKeyChecking=accept-new -o ServerAliveInterval=30
+    description:
+    - Extra arguments of the ssh command of the bastion session, for example the key (-i).
+    env:
+    - name: ANSIBLE_ONEOS_BASTION_SSH_ARGS
+    vars:
+    - name: ansible_oneos_bastion_ssh_args
 """
 
+import os
 import re
 import json
+import time
 
 from ansible.errors import AnsibleConnectionFailure
 from ansible.module_utils.common._collections_compat import Mapping
 from ansible.module_utils._text import to_text
 from ansible.plugins.cliconf import CliconfBase
+from ansible.utils.display import Display
 
 try:
     from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.utils import to_list
@@ -34,9 +228,46 @@ except ImportError:
     # if netcommon is not installed, fallback for Ansible 2.8 and 2.9
     from ansible.module_utils.network.common.utils import to_list
 
+from oneos.bastion import attach_bastion
+from oneos.batch import BatchTimeout, drain, run_batch
+from oneos.facts_cache import FactsCache, device_fingerprint
+from oneos.instrument import attach_recorder, in_phase, measure
+from oneos.parsers import get_parser, parse
+from oneos.profiler import attach_profiler
+from oneos.ratelimit import attach_login_limiter
+from oneos.stream import stream_command
+from oneos.transfer import download
+
+display = Display()
+
 
 class Cliconf(CliconfBase):
 
+    def __init__(self, *args, **kwargs):
+        super(Cliconf, self).__init__(*args, **kwargs)
+        # get_capabilities() result per connection: (with device_info, json)
+        self._capabilities = None
+
+    def set_options(self, task_keys=None, var_options=None, direct=None):
+        super(Cliconf, self).set_options(task_keys=task_keys, var_options=var_options, direct=direct)
+        if self.get_option('metrics'):
+            attach_recorder(self._connection, self.get_option('metrics_dir'))
+        if self.get_option('profile'):
+            attach_profiler(self._connection, self.get_option('profile_dir'))
+        if self.get_option('login_rate'):
+            attach_login_limiter(self._connection, self.get_option('login_state_path'),
+                                 self.get_option('login_rate'), self.get_option('login_burst'),
+                                 self.get_option('login_backoff'), self.get_option('login_retries'))
+        if self.get_option('bastion'):
+            attach_bastion(self._connection, self.get_option('bastion'), self.get_option('bastion_persist'),
+                           self.get_option('bastion_ssh_args'))
+
+    def send_command(self, command=None, *args, **kwargs):
+        with measure(self._connection, to_text(command)) as sample:
+            response = super(Cliconf, self).send_command(command, *args, **kwargs)
+            sample.received = len(response) if response else 0
+        return response
+
     def get_device_operations(self):
         return {                                    # supported: ---------------
             'supports_commit': False,                # identify if commit is supported by device or not
@@ -61,6 +292,11 @@ class Cliconf(CliconfBase):
             #'edit_config',         # Loads the specified commands into the remote device
             'get_capabilities',    # Retrieves device information and supported rpc methods
             'get',                 # Execute specified command on remote device
+            'get_device_info',     # Retrieves the device information, not included in get_capabilities
+            'run_commands_batch',  # Execute a list of commands with a single write to the device
+            'get_parsed',          # Execute show commands and return the parsed output
+            'stream_config',       # Write the configuration to a file on the controller
+            'backup_config',       # Download the startup-config to a file on the controller
             #'get_default_flag'     # CLI option to include defaults for config dumps
         ]
 
@@ -72,6 +308,7 @@ class Cliconf(CliconfBase):
             'output': ['text']
         }
 
+    @in_phase('device_info')
     def get_device_info(self):
         """
         UNV-DE-NAMUR_03103096_PLUG401_VLAN2817#show system status
@@ -251,130 +488,95 @@ class Cliconf(CliconfBase):
         -------------- Alternate bank -------------
         Installation status : NOT COMPLETE ! 
         """
-        device_info = dict()
-
-        device_info['network_os_vendor'] = 'ekinops'
-        device_info['network_os_vendor_alt'] = 'oneaccess'
-        device_info['network_os'] = 'OneOS'
-        device_info['network_os_version'] = '6'
-        device_info["network_os_software_location"] = "/BSA/binaries"
-
-        reply = self.get('show running-config hostname')
-        data = to_text(reply, errors='surrogate_or_strict').strip()
-
-        match = re.search(r'\W*hostname\W+(\S+)\W*$', data, re.M)
-        if match:
-            device_info['network_os_hostname'] = match.group(1)
-
-
-        reply = self.get('show product-info-area')
-        data = to_text(reply, errors='surrogate_or_strict').strip()
-
-        match = re.search(r'\W*Product [Nn]ame\W+(\S+)\W+$', data, re.M)
-        if match:
-            device_info['network_os_platform'] = match.group(1)
-
-        match = re.search(r'\W*Commercial [Nn]ame\W+(\S+)\W+$', data, re.M)
-        if match:
-            device_info['network_os_platform_commercial'] = match.group(1)
-
-        match = re.search(r'\W*Serial [Nn]umber\W+(\S+)\W+$', data, re.M)
-        if match:
-            device_info['network_os_serial_number'] = match.group(1)
-
-
         reply = self.get('show system status')
-        data1 = to_text(reply, errors='surrogate_or_strict').strip()
-
-        match = re.search(r'\W*Software [Vv]ersion\W+(\S+)\W*$', data1, re.M)
-        if match:
-            device_info['network_os_software_version'] = match.group(1)
-
-        match = re.search(r'\W*Boot [Vv]ersion\W+(\S+)\W*$', data1, re.M)
-        if match:
-            device_info['network_os_boot_version'] = match.group(1)
-            device_info['network_os_boot_startup_image'] = match.group(1)
-
-        #match = re.search(r'\W*License token\W+(\S+)\W*$', data1, re.M)
-        #if match:
-        #    device_info['network_os_license_token'] = match.group(1)
-
-        match = re.search(r'\W*System started\W+(.*)$', data1, re.M)
-        if match:
-            device_info['network_os_system_started'] = match.group(1)
-            device_info['network_os_system_uptime_secs'] = datetime.strptime(match.group(1), \
-                                                            "%Y-%m-%d %H:%M:%S%z").timestamp()
-
-        match = re.search(r'\W*Sys Up time\W+(.*)$', data1, re.M)
-        if match:
-            device_info['network_os_system_uptime'] = match.group(1)
+        status = to_text(reply, errors='surrogate_or_strict').strip()
 
-        match = re.search(r'\W*Start caused by\W+(.*)$', data1, re.M)
-        if match:
-            device_info['network_os_system_restart_cause'] = match.group(1)
+        host = self._connection.get_option('host')
+        fingerprint = device_fingerprint(status)
+        cache = self._get_facts_cache() if fingerprint else None
 
+        if cache:
+            device_info = cache.get(host, fingerprint)
+            if device_info is not None:
+                # uptime related facts are always taken from the device
+                device_info.update(parse('oneos6', 'show system status', status))
+                return device_info
 
-        reply = self.get('show memory')
-        data = to_text(reply, errors='surrogate_or_strict').strip()
+        device_info = self._collect_device_info(status)
 
-        match = re.search(r'.*- user\W+([0-9\.]+)MiB\W+([0-9\.]+)MiB', data, re.M)
-        if match:
-            device_info['network_os_diskspace_total_bytes'] = float(match.group(1))*1000*1000
-            device_info['network_os_diskspace_free_bytes'] = float(match.group(2))*1000*1000
-
-
-
-        reply = self.get('ls -l /BSA/binaries')
-        data = to_text(reply, errors='surrogate_or_strict').strip()
-
-        matches = re.finditer(r'\S+ +\d+ +(\d+).* (.*)$', data, re.M)
-        if matches:
-            boot_files = []
-            for matchNum, match in enumerate(matches, start=1):
-                boot_files.append({"file": match.group(2), "size": match.group(1)})
-            device_info['network_os_boot_available_files'] = boot_files
+        if cache:
+            cache.set(host, fingerprint, device_info)
 
+        return device_info
 
-        reply = self.get('show software-image')
-        data = to_text(reply, errors='surrogate_or_strict').strip()
+    def _get_facts_cache(self):
+        if self.get_option('facts_cache_bypass'):
+            return None
 
-        device_info['network_os_software_bank_primary'] = "NOT SET"
-        device_info['network_os_software_bank_alternate'] = "NOT SET"
+        return FactsCache(path=self.get_option('facts_cache_path'),
+                          ttl=self.get_option('facts_cache_ttl'),
+                          max_entries=self.get_option('facts_cache_max_entries'))
 
-        match = re.search(r'.*Software version\W+(\S*).*Alternate.*', data, re.DOTALL)
-        if match:
-            device_info['network_os_software_bank_primary'] = match.group(1)
+    def _get_outputs(self, commands):
+        """
+        Runs the commands in one batch and returns the output per command,
+        the output of a failed command is empty. When the output of the batch
+        can't be split per command the commands are sent one by one.
+        """
+        try:
+            results = self._run_batch(commands)
+        except BatchTimeout as exc:
+            display.warning("%s, sending the commands one by one" % to_text(exc))
+            drain(self._connection)
+            outputs = {}
+            for command in commands:
+                try:
+                    outputs[command] = self.get(command)
+                except AnsibleConnectionFailure:
+                    outputs[command] = ''
+            return outputs
+
+        return dict((r['command'], '' if r['error'] else r['output']) for r in results)
+
+    def _collect_device_info(self, status):
+        commands = [
+                    'show running-config hostname',
+                    'show product-info-area',
+                    'show memory',
+                    'ls -l /BSA/binaries',
+                    'show software-image',
+                    'cat /BSA/bsaBoot.inf'
+        ]
+        outputs = self._get_outputs(commands)
 
-        match = re.search(r'Alternate.*Software version\W+(\S*)', data, re.DOTALL)
-        if match:
-            device_info['network_os_software_bank_alternate'] = match.group(1)
+        device_info = dict()
 
-        device_info['network_os_startup_config'] = "/BSA/config/bsaStart.cfg"
+        device_info['network_os_vendor'] = 'ekinops'
+        device_info['network_os_vendor_alt'] = 'oneaccess'
+        device_info['network_os'] = 'OneOS'
+        device_info['network_os_version'] = '6'
+        device_info["network_os_software_location"] = "/BSA/binaries"
 
-        reply = self.get('ls /BSA/bsaBoot.inf')
-        data = to_text(reply, errors='surrogate_or_strict').strip()
+        device_info.update(parse('oneos6', 'show system status', status))
 
-        match = re.search(r'bsaBoot.inf', data, re.M)
-        if match:
-            reply = self.get('cat /BSA/bsaBoot.inf')
-            data = to_text(reply, errors='surrogate_or_strict').strip()
-            
-            match = re.search(r'flash:(/BSA/config/\S+)$', data, re.M)
-            if match:
-                device_info['network_os_startup_config'] = match.group(1)
+        for command in commands:
+            device_info.update(parse('oneos6', command, outputs[command]))
 
         return device_info
 
-
-
     def get_capabilities(self):
-        capabilities = super(Cliconf, self).get_capabilities()
-        #capabilities['device_operations'] = self.get_device_operations()
-        capabilities['rpc'] = self.get_oneos_rpc()
-        capabilities['device_info'] = self.get_device_info()
-        capabilities['network_api'] = 'cliconf'
-        capabilities.update(self.get_option_values())
-        return json.dumps(capabilities)
+        include_device_info = self.get_option('capabilities_device_info')
+        if self._capabilities is None or self._capabilities[0] != include_device_info:
+            capabilities = dict()
+            #capabilities['device_operations'] = self.get_device_operations()
+            capabilities['rpc'] = self.get_oneos_rpc()
+            if include_device_info:
+                capabilities['device_info'] = self.get_device_info()
+            capabilities['network_api'] = 'cliconf'
+            capabilities.update(self.get_option_values())
+            self._capabilities = (include_device_info, json.dumps(capabilities))
+
+        return self._capabilities[1]
 
     def get_default_flag(self):
         return ['detail']
@@ -385,19 +587,123 @@ class Cliconf(CliconfBase):
         match = re.search(r'Configuration Mode Oper:\s+(.+)', data)
         return not match or match.group(1) == 'classic'
 
-    def get_config(self, source='running', format='text', flags="ordered"):
+    def get_config(self, source='running', format='text', flags="ordered", sections=None):
+        """
+        Returns the running-config, if sections is a list of top level lines
+        (ex. 'interface gigabitethernet 0/1', 'ip vrf CUSTOMER') only these
+        sections are fetched from the device.
+        """
         if source != 'running':
             raise ValueError("fetching configuration from %s is not supported" % source)
 
         if format != 'text':
             raise ValueError("'format' value %s is invalid. Only format supported is 'text'" % format)
 
-        cmd = 'show running-config %s' % ' '.join(flags)
         self.send_command('end')
+
+        if sections:
+            # the sections are fetched without flags, only the default can be combined
+            if flags and to_list(flags) != ['ordered']:
+                raise ValueError("'flags' can't be combined with 'sections'")
+            return self._get_config_sections(sections)
+
+        cmd = 'show running-config %s' % ' '.join(to_list(flags))
         response = self.send_command(cmd.strip())
 
         return response
 
+    def _get_config_sections(self, sections):
+        commands = ["show running-config %s" % section.strip() for section in to_list(sections)]
+        results = self.run_commands_batch(commands)
+
+        return "\n".join(result['output'] for result in results if result['output'])
+
+    def stream_config(self, path=None, source='running', flags=None):
+        """
+        Writes the configuration to a file on the controller while it is
+        received from the device, the configuration itself is never kept in
+        memory. An existing file is only replaced when the configuration
+        differs. Returns the location, size and sha256 of the file:
+
+            {'path': <path>, 'size': <bytes>, 'sha256': <hexdigest>, 'changed': <file was replaced>}
+
+        If no path is given the file is written to
+        <config_stream_dir>/<host>_<source>.cfg
+        """
+        if source != 'running':
+            raise ValueError("fetching configuration from %s is not supported" % source)
+
+        if path is None:
+            path = os.path.join(self.get_option('config_stream_dir'),
+                                '%s_%s.cfg' % (self._connection.get_option('host'), source))
+
+        cmd = "show running-config "
+        cmd += " ".join(to_list(flags))
+        cmd = cmd.strip()
+        self.send_command('end')
+
+        try:
+            with measure(self._connection, cmd, grouped=False) as sample:
+                result = stream_command(self._connection, cmd, path)
+                sample.received = result['size']
+        except (BatchTimeout, EOFError, OSError) as exc:
+            raise AnsibleConnectionFailure(to_text(exc))
+
+        self.history.append((cmd, '*****'))
+
+        if result.pop('error'):
+            raise AnsibleConnectionFailure("%s failed, the configuration was not written to %s" % (cmd, path))
+
+        return result
+
+    @in_phase('backup_config')
+    def backup_config(self, path=None, source='startup', fallback=True):
+        """
+        Downloads the startup-config that is referenced in /BSA/bsaBoot.inf
+        over sftp/scp to a file on the controller. If the download fails and
+        fallback is True the running-config is written to the file instead
+        (stream_config). With source=running the running-config is always
+        fetched from the terminal.
+
+            {'path': <path>, 'size': <bytes>, 'sha256': <hexdigest>, 'source': <file on the device or running-config>,
+             'method': <sftp, scp or cli>, 'seconds': <transfer time>, 'throughput': <bytes per second>,
+             'changed': <file was replaced>}
+        """
+        if source not in ('startup', 'running'):
+            raise ValueError("'source' value %s is invalid, valid values are startup, running" % source)
+
+        host = self._connection.get_option('host')
+        folder = self.get_option('config_stream_dir')
+        result = None
+
+        if source == 'startup':
+            command = 'cat /BSA/bsaBoot.inf'
+            startup_config = parse('oneos6', command, self._get_outputs([command])[command]).get(
+                'network_os_startup_config', '/BSA/config/bsaStart.cfg')
+            proto = self.get_option('config_file_proto')
+            try:
+                with measure(self._connection, 'download %s' % proto) as sample:
+                    result = download(self._connection, startup_config, path or os.path.join(folder, '%s_startup.cfg' % host),
+                                      proto=proto, timeout=self._connection.get_option('persistent_command_timeout'))
+                    sample.received = result['size']
+                result['source'] = startup_config
+                result['method'] = proto
+            except Exception as exc:
+                if not fallback:
+                    raise AnsibleConnectionFailure("unable to download %s: %s" % (startup_config, to_text(exc)))
+                display.warning("unable to download %s, using the running-config: %s" % (startup_config, to_text(exc)))
+
+        if result is None:
+            start = time.time()
+            result = self.stream_config(path=path)
+            result['seconds'] = time.time() - start
+            result['source'] = 'running-config'
+            result['method'] = 'cli'
+
+        result['throughput'] = int(result['size'] / result['seconds']) if result['seconds'] else result['size']
+        return result
+
+    @in_phase('edit_config', label='config line')
     def edit_config(self, candidate=None, commit=True, replace=None, comment=None):
         operations = self.get_device_operations()
         self.check_edit_config_capability(operations, candidate, commit, replace, comment)
@@ -452,6 +758,78 @@ class Cliconf(CliconfBase):
 
         return self.send_command(command=command, prompt=prompt, answer=answer, sendonly=sendonly, newline=newline, check_all=check_all)
 
+    def run_commands_batch(self, commands=None, check_rc=True):
+        """
+        Executes a list of commands by writing them to the device at once
+        instead of waiting for the prompt after each command. Returns a list
+        with a dict per command:
+
+            {'command': <command>, 'output': <output>, 'error': <output if terminal_stderr_re matched or None>}
+
+        If check_rc is True an exception is raised for the first failed command.
+        """
+        if commands is None:
+            raise ValueError("'commands' value is required")
+
+        cmds = []
+        for cmd in to_list(commands):
+            if isinstance(cmd, Mapping):
+                if cmd.get('prompt') or cmd.get('answer'):
+                    raise ValueError("prompt and answer are not supported in a batch: %s" % cmd['command'])
+                cmd = cmd['command']
+            cmds.append(cmd)
+
+        try:
+            results = self._run_batch(cmds)
+        except (BatchTimeout, EOFError, OSError) as exc:
+            raise AnsibleConnectionFailure(to_text(exc))
+
+        if check_rc:
+            for result in results:
+                if result['error']:
+                    raise AnsibleConnectionFailure(result['error'])
+
+        return results
+
+    def _run_batch(self, commands):
+        """
+        run_batch with the metrics and the command history, raises
+        BatchTimeout when the output can't be split per command in time.
+        """
+        with measure(self._connection, 'batch', grouped=False) as sample:
+            results = run_batch(self._connection, commands, batch_size=self.get_option('batch_size'))
+            sample.received = sum(len(result['output']) for result in results)
+
+        for result in results:
+            if self.response_logging:
+                self.history.append((result['command'], result['output']))
+            else:
+                self.history.append(('*****', '*****'))
+
+        return results
+
+    def get_parsed(self, commands=None):
+        """
+        Executes show commands and returns the parsed output per command:
+
+            {'show memory': {'network_os_diskspace_total_bytes': 415300000.0, ...}}
+
+        Only commands with a parser in oneos.parsers are supported.
+        """
+        if commands is None:
+            raise ValueError("'commands' value is required")
+
+        commands = to_list(commands)
+        for command in commands:
+            if get_parser('oneos6', command) is None:
+                raise ValueError("'%s' is not supported by get_parsed" % command)
+
+        parsed = dict()
+        for result in self.run_commands_batch(commands):
+            parsed[result['command']] = parse('oneos6', result['command'], result['output'])
+
+        return parsed
+
     def rollback(self, rollback_id, commit=True):
         if not self.is_classic_mode():
             raise ValueError("Nokia SROS node is not running in classic mode. Use ansible_network_os=nokia.sros.md")
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = """
+---
+module: oneos_backup
+short_description: Backup the configuration of OneOS devices
+description:
+- Downloads the startup-config that is referenced in /BSA/bsaBoot.inf over sftp or
+  scp in a single binary transfer and writes it to a file on the controller.
+- Falls back to the running-config (read from the terminal and written to the file
+  while it is received) when the download fails.
+- An existing backup file is only replaced, and the task only reports changed, when the
+  new backup has a different sha256.
+- Works with the oneos5 and oneos6 cliconf plugins over network_cli, run the task
+  with a high number of forks (and strategy free) to backup many hosts in parallel.
+options:
+  dest:
+    description:
+    - Location of the backup file on the controller, the default is
+      <ansible_oneos_config_stream_dir>/<host>_startup.cfg
+      (or <host>_running.cfg when the running-config is used).
+    type: path
+  source:
+    description:
+    - C(startup) downloads the startup-config file, C(running) reads the running-config
+      from the terminal.
+    type: str
+    choices:
+    - startup
+    - running
+    default: startup
+  fallback:
+    description:
+    - Use the running-config if the startup-config can't be downloaded.
+    type: bool
+    default: true
+notes:
+- The file transfer protocol is set with ansible_oneos_config_file_proto (sftp or scp).
+"""
+
+EXAMPLES = """
+- name: nightly backup
+  hosts: all
+  gather_facts: no
+  strategy: free
+  tasks:
+  - name: backup the startup-config
+    oneos_backup:
+      dest: "/runner/artifacts/backups/{{ inventory_hostname }}.cfg"
+    register: backup
+
+  - debug:
+      msg: "{{ backup.size }} bytes in {{ backup.seconds }}s ({{ backup.throughput }} bytes/s) via {{ backup.method }}"
+"""
+
+RETURN = """
+backup_path:
+  description: location of the backup file on the controller
+  returned: always
+  type: str
+size:
+  description: size of the backup in bytes
+  returned: always
+  type: int
+sha256:
+  description: sha256 checksum of the backup
+  returned: always
+  type: str
+source:
+  description: file on the device that was downloaded or running-config
+  returned: always
+  type: str
+  sample: /BSA/config/bsaStart.cfg
+method:
+  description: how the backup was taken, sftp, scp or cli
+  returned: always
+  type: str
+seconds:
+  description: transfer time in seconds
+  returned: always
+  type: float
+throughput:
+  description: transfer speed in bytes per second
+  returned: always
+  type: int
+"""
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.connection import Connection, ConnectionError
+from ansible.module_utils._text import to_text
+
+
+def main():
+    argument_spec = dict(
+        dest=dict(type='path'),
+        source=dict(type='str', choices=['startup', 'running'], default='startup'),
+        fallback=dict(type='bool', default=True),
+    )
+
+    module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+
+    if module.check_mode:
+        module.exit_json(changed=False)
+
+    connection = Connection(module._socket_path)
+    try:
+        backup = connection.backup_config(path=module.params['dest'], source=module.params['source'],
+                                          fallback=module.params['fallback'])
+    except ConnectionError as exc:
+        module.fail_json(msg=to_text(exc, errors='surrogate_then_replace'), code=exc.code)
+
+    result = dict(changed=backup.pop('changed', True), backup_path=backup.pop('path'))
+    result.update(backup)
+    module.exit_json(**result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Shared helpers for the oneos5/oneos6 cliconf and terminal plugins.
+
+The package is installed next to the plugins in the runner image and is put
+on the PYTHONPATH, it has no dependencies besides the python stdlib so it can
+also be used outside of ansible (benchmarks, tools).
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
@@ -0,0 +1,169 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Batch size control of the oneos_adaptive strategy.
+
+The batch is the number of hosts that run the play at the same time. It
+grows additively for every host that finishes healthy and is multiplied by
+the decrease factor (halved by default) when a host fails or its command
+latency is more than latency_factor times the baseline, at most once for
+the hosts that were started before the previous decrease. When the failure
+rate of the last hosts is above max_failure_rate no new hosts are started
+for pause seconds.
+
+The latency baseline is the lowest median of the last healthy hosts seen in
+the play, there is a baseline per source of the latency (the command metrics
+or the task times) as a host is only compared with hosts measured the same
+way. Group limits cap the number of running hosts per inventory group,
+the limits are fnmatch patterns so {'site_*': 2} allows 2 hosts per site
+group.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import fnmatch
+import json
+import os
+import re
+import time
+
+from collections import deque
+
+
+# number of healthy hosts in the latency median
+LATENCY_SAMPLES = 5
+
+# the failure rate is only checked when this many hosts finished
+MIN_FAILURE_SAMPLES = 5
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+class AdaptiveBatch(object):
+    """
+    Decides when the next host may start.
+
+    :param initial: batch size of the first hosts
+    :param minimum: lowest batch size
+    :param maximum: highest batch size
+    :param increase: hosts added to the batch for every healthy host
+    :param decrease: factor the batch is multiplied with when a host is unhealthy
+    :param max_failure_rate: failure rate of the last hosts that pauses the play
+    :param latency_factor: latency above baseline * latency_factor is unhealthy
+    :param pause: seconds no new hosts are started after too many failures
+    :param window: number of hosts in the failure rate
+    :param group_limits: {group pattern: maximum running hosts per matching group}
+    """
+
+    def __init__(self, initial=1, minimum=1, maximum=50, increase=1.0, decrease=0.5, max_failure_rate=0.2,
+                 latency_factor=2.0, pause=60, window=20, group_limits=None):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.batch = float(min(max(initial, self.minimum), self.maximum))
+        self.increase = increase
+        self.decrease = decrease
+        self.max_failure_rate = max_failure_rate
+        self.latency_factor = latency_factor
+        self.pause = pause
+        self.group_limits = group_limits or {}
+        self.baselines = {}
+        self.paused_until = 0
+        self.running = {}
+        self._results = deque(maxlen=window)
+        self._latencies = {}
+        self._started = 0
+        self._order = {}
+        self._decreased = 0
+
+    def _limited_groups(self, groups):
+        """
+        Returns the (group, limit) of the groups of a host that have a limit.
+        """
+        result = []
+        for group in groups:
+            for pattern, limit in self.group_limits.items():
+                if fnmatch.fnmatch(group, pattern):
+                    result.append((group, limit))
+                    break
+        return result
+
+    def can_start(self, groups=()):
+        if len(self.running) >= int(self.batch) or time.time() < self.paused_until:
+            return False
+        for group, limit in self._limited_groups(groups):
+            if sum(1 for running in self.running.values() if group in running) >= limit:
+                return False
+        return True
+
+    def start(self, host, groups=()):
+        self._started += 1
+        self._order[host] = self._started
+        self.running[host] = set(groups)
+
+    def finish(self, host, failed, latency=None, source='command'):
+        """
+        Updates the batch size for a host that finished the play, returns a
+        message when the batch was decreased or the play is paused. The
+        latency is compared with the baseline of its source.
+        """
+        self.running.pop(host, None)
+        self._results.append(failed)
+        baseline = self.baselines.get(source)
+        slow = (not failed and latency is not None and baseline is not None and
+                latency > baseline * self.latency_factor)
+
+        if not failed and not slow:
+            if latency is not None:
+                latencies = self._latencies.setdefault(source, deque(maxlen=LATENCY_SAMPLES))
+                latencies.append(latency)
+                median = _median(latencies)
+                self.baselines[source] = median if baseline is None else min(baseline, median)
+            self.batch = min(self.batch + self.increase, self.maximum)
+            return None
+
+        reason = "%s failed" % host if failed else "%s %s latency %.3fs, baseline %.3fs" % (
+            host, source, latency, baseline)
+        message = None
+        # a single decrease for the hosts that ran at the same time
+        if self._order.get(host, 0) > self._decreased:
+            previous = int(self.batch)
+            self.batch = max(self.batch * self.decrease, self.minimum)
+            self._decreased = self._started
+            message = "batch %d -> %d (%s)" % (previous, int(self.batch), reason)
+
+        failures = sum(1 for result in self._results if result)
+        if len(self._results) >= MIN_FAILURE_SAMPLES and failures > self.max_failure_rate * len(self._results):
+            self.paused_until = time.time() + self.pause
+            message = "%d of the last %d hosts failed, no new hosts for %ds, batch %d" % (
+                failures, len(self._results), self.pause, int(self.batch))
+            # measure again after the pause
+            self._results.clear()
+        return message
+
+
+def command_latency(metrics_dir, address, since=0):
+    """
+    Returns the mean command latency of a host from the metrics of the
+    oneos cliconf plugins (ansible_oneos_metrics), None when the host has no
+    metrics that were started after since.
+    """
+    name = re.sub(r'[^\w.-]', '_', address)
+    try:
+        with open(os.path.join(metrics_dir, name + '.json')) as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if data.get('started', 0) < since:
+        return None
+    metrics = [m for m in data.get('metrics', []) if m.get('phase') != 'connect']
+    count = sum(m['count'] for m in metrics)
+    if not count:
+        return None
+    return sum(m['sum'] for m in metrics) / count
@@ -0,0 +1,171 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Shared SSH sessions to the jump hosts (bastions) of the devices.
+
+Without sharing every persistent connection process logs in on the bastion
+with its own ProxyCommand, so every device pays for two SSH handshakes.
+With a bastion set for a device:
+
+- one OpenSSH ControlMaster session per bastion is started (under a file
+  lock, so the first device starts it and the others wait for it) and
+  stays open for ControlPersist seconds after the last device closed its
+  channel, the idle_timeout of env/settings by default
+- the device connection uses "ssh -W %h:%p" through the control socket as
+  ProxyCommand, which only opens a channel in the bastion session
+
+The control sockets are kept in CONTROL_DIR of the container, so the jobs
+that run in a pool container reuse the sessions. The bastion login must not
+be interactive (a key or an agent), ssh runs with BatchMode.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import fcntl
+import hashlib
+import os
+import shlex
+import subprocess
+import tempfile
+import time
+
+from ansible.errors import AnsibleConnectionFailure
+from ansible.utils.display import Display
+
+from oneos.instrument import get_recorder, wrap_ssh_connect
+
+display = Display()
+
+
+CONTROL_DIR = '/tmp/oneos-bastion'
+
+SETTINGS_PATH = '/runner/env/settings'
+
+DEFAULT_PERSIST = 600
+
+DEFAULT_SSH_ARGS = '-o StrictHostKeyChecking=accept-new -o ServerAliveInterval=30'
+
+
+def idle_timeout(path=SETTINGS_PATH):
+    """
+    Returns the idle_timeout of the ansible-runner settings, DEFAULT_PERSIST
+    when it is not set.
+    """
+    try:
+        import yaml
+        with open(path) as f:
+            settings = yaml.safe_load(f) or {}
+        return int(settings.get('idle_timeout') or DEFAULT_PERSIST)
+    except (IOError, OSError, ValueError, AttributeError, ImportError):
+        return DEFAULT_PERSIST
+
+
+def parse_bastion(bastion):
+    """
+    Returns (user, host, port) of [user@]host[:port].
+    """
+    user, _, host = bastion.rpartition('@')
+    port = None
+    if host.count(':') == 1:
+        host, port = host.split(':')
+    return user or None, host, int(port) if port else None
+
+
+class Bastion(object):
+    """
+    The ControlMaster session of a bastion.
+
+    :param bastion: [user@]host[:port]
+    :param persist: seconds the session stays open when it is not used
+    :param ssh_args: extra ssh arguments (string)
+    """
+
+    def __init__(self, bastion, persist=DEFAULT_PERSIST, ssh_args=DEFAULT_SSH_ARGS, control_dir=CONTROL_DIR):
+        self.bastion = bastion
+        self.persist = persist
+        self.user, self.host, self.port = parse_bastion(bastion)
+        self.ssh_args = shlex.split(ssh_args or '')
+        # ControlPath has a length limit, the name is a digest of the bastion
+        name = hashlib.sha1(bastion.encode('utf-8')).hexdigest()[:16]
+        self.control_dir = control_dir
+        self.control_path = os.path.join(control_dir, name)
+
+    def _ssh(self, *args):
+        command = ['ssh', '-o', 'BatchMode=yes', '-o', 'ControlPath=%s' % self.control_path]
+        if self.user:
+            command.extend(['-l', self.user])
+        if self.port:
+            command.extend(['-p', str(self.port)])
+        return command + self.ssh_args + list(args) + [self.host]
+
+    def is_running(self):
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(self._ssh('-O', 'check'), stdout=devnull, stderr=devnull) == 0
+
+    def ensure_master(self):
+        """
+        Starts the ControlMaster session when it is not running, returns the
+        seconds it took to start it (0 when it was running).
+        """
+        if os.path.exists(self.control_path) and self.is_running():
+            return 0.0
+        if not os.path.isdir(self.control_dir):
+            os.makedirs(self.control_dir, 0o700)
+
+        start = time.time()
+        with open(self.control_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # started by another device while waiting for the lock
+            if os.path.exists(self.control_path) and self.is_running():
+                return 0.0
+            # the master that ssh -f leaves in the background may keep its stdio
+            # open, only wait for the return code and read the errors from a file
+            with open(os.devnull, 'wb') as devnull, tempfile.TemporaryFile() as stderr:
+                returncode = subprocess.call(
+                    self._ssh('-M', '-N', '-f', '-o', 'ControlMaster=yes', '-o', 'ControlPersist=%d' % self.persist),
+                    stdin=devnull, stdout=devnull, stderr=stderr)
+                if returncode != 0:
+                    stderr.seek(0)
+                    raise AnsibleConnectionFailure("failed to open the SSH session to bastion %s: %s"
+                                                   % (self.bastion, stderr.read().decode('utf-8', 'replace').strip()))
+        return time.time() - start
+
+    def proxy_command(self):
+        """
+        The ProxyCommand of a device, %h and %p are replaced by the
+        connection plugin. ControlMaster=auto opens a session of its own when
+        the shared session expired in the meantime.
+        """
+        args = self._ssh('-o', 'ControlMaster=auto', '-o', 'ControlPersist=%d' % self.persist, '-W', '%h:%p')
+        return ' '.join(shlex.quote(arg) if arg != '%h:%p' else arg for arg in args)
+
+
+def attach_bastion(connection, bastion, persist=None, ssh_args=DEFAULT_SSH_ARGS):
+    """
+    Connects a network_cli connection through the shared session of the
+    bastion (once, also after a reset_connection). The session start is
+    recorded as the bastion command of the connect phase when metrics are
+    enabled.
+    """
+    if getattr(connection, '_oneos_bastion', None) is not None:
+        return
+
+    session = Bastion(bastion, persist or idle_timeout(), ssh_args)
+    connection._oneos_bastion = session
+
+    def _connect(ssh, ssh_connect, *args, **kwargs):
+        seconds = session.ensure_master()
+        recorder = get_recorder(connection)
+        if recorder is not None:
+            recorder.record('connect', 'bastion', seconds)
+        ssh.set_option('proxy_command', session.proxy_command())
+        display.vvv("connecting through the shared session of bastion %s" % bastion,
+                    host=connection.get_option('host'))
+        return ssh_connect(*args, **kwargs)
+
+    wrap_ssh_connect(connection, _connect)
+    return session
@@ -0,0 +1,333 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Pipelined command execution for the OneOS cliconf plugins.
+
+network_cli sends a command and waits for the prompt before the next command
+can be sent, on high latency links a sweep of show commands is dominated by
+round trips. The functions below write a list of commands to the shell in a
+single write and split the combined output back per command with the prompt
+regexes of the terminal plugin:
+
+    cmd1                      <- echo of the first command
+    <output of cmd1>
+    host#cmd2                 <- prompt followed by the echo of the next command
+    <output of cmd2>
+    host#                     <- final prompt, the batch is complete
+
+The stderr regexes of the terminal plugin are applied to the output of every
+command separately so errors are reported per command.
+
+Not every device echoes "<prompt><command>" once per command. A device that
+echoes the input as soon as it is received (type-ahead) sends the echo of all
+commands first and then only the prompts, and a long command can be echoed
+wrapped over several lines. The splitter counts every line that starts with
+the prompt as the start of the next command, drops the type-ahead and wrapped
+echoes and takes prompts without output as commands without output. When the
+output still can't be split the batch ends with BatchTimeout, the callers
+that only read (get_device_info) then send the commands one by one.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import re
+import socket
+import time
+
+
+DEFAULT_BATCH_SIZE = 20
+
+# the end of a prompt, the prompt regexes are end-anchored
+PROMPT_END_RE = re.compile(br'[>#] ?')
+
+# seconds without data after which drain() returns
+DRAIN_IDLE = 1.0
+
+
+class BatchTimeout(Exception):
+    pass
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+def _to_text(value):
+    return value.decode('utf-8', 'surrogateescape')
+
+
+def is_prompt(line, prompt_re):
+    """
+    Returns True if the whole line is matched by one of the prompt regexes.
+    """
+    for regex in prompt_re:
+        if regex.match(line):
+            return True
+    return False
+
+
+class BatchSplitter(object):
+    """
+    Splits the output of pipelined commands back per command.
+
+    Data has to be fed in the order it is received from the shell, the data
+    should start right after the prompt that preceded the batch.
+
+    :param commands: list of commands (bytes) in the order they were sent
+    :param prompt_re: list of compiled prompt regexes (terminal_stdout_re)
+    :param prompt: the prompt that preceded the batch, a line only starts with
+        a prompt when it starts with the same host name
+    """
+
+    def __init__(self, commands, prompt_re, prompt=None):
+        self.commands = [_to_bytes(c).strip() for c in commands]
+        self.prompt_re = prompt_re
+        self.outputs = [[] for c in self.commands]
+        self.index = 0
+        self.prompt = None
+        self.hostname = None
+        if prompt:
+            match = re.match(br'[\w\+\-\.:\/\[\]]+', _to_bytes(prompt).strip())
+            self.hostname = match.group() if match else None
+        self._pending = b''
+        self._first_line = True
+        # the last command of which the echo was received before its prompt
+        self._typed = 0
+        # the part of a wrapped echo that was not received yet
+        self._echo_rest = None
+
+    @property
+    def done(self):
+        return self.prompt is not None
+
+    def feed(self, data):
+        """
+        Processes a chunk of received data, returns True when the final
+        prompt has been received.
+        """
+        lines = (self._pending + data).split(b'\n')
+        self._pending = lines.pop()
+
+        for line in lines:
+            self._line(line.rstrip(b'\r'))
+
+        # prompts of commands without output (type-ahead) before the final prompt
+        pending = self._pending.rstrip(b'\r')
+        index = self.index
+        while index < len(self.commands) - 1:
+            end = self._prompt_end(pending)
+            if not end or end == len(pending):
+                break
+            index += 1
+            pending = pending[end:]
+        if index == len(self.commands) - 1 and pending and is_prompt(pending, self.prompt_re):
+            self.index = index
+            self.prompt = pending
+
+        return self.done
+
+    def _prompt_end(self, line):
+        """
+        Returns the length of the prompt the line starts with, 0 when it does
+        not start with a prompt.
+        """
+        if self.hostname is not None and not line.startswith(self.hostname):
+            return 0
+        match = PROMPT_END_RE.search(line, 0, 256)
+        if match and is_prompt(line[:match.end()], self.prompt_re):
+            return match.end()
+        return 0
+
+    def _line(self, line):
+        if self._first_line:
+            # the echo of the first command
+            self._first_line = False
+            stripped = line.strip()
+            if stripped == self.commands[0]:
+                return
+            if stripped and self.commands[0].startswith(stripped):
+                self._echo_rest = self.commands[0][len(stripped):].strip()
+                return
+
+        while self.index + 1 < len(self.commands):
+            end = self._prompt_end(line)
+            if not end:
+                break
+            # the prompt before the next command
+            self.index += 1
+            self._typed = max(self._typed, self.index)
+            self._echo_rest = None
+            command = self.commands[self.index]
+            line = line[end:]
+            # indented (config) commands are echoed with extra spaces after the prompt
+            stripped = line.strip()
+            if not stripped or stripped == command:
+                return
+            if command.startswith(stripped):
+                self._echo_rest = command[len(stripped):].strip()
+                return
+            # the command was echoed before (type-ahead), the output follows the prompt
+
+        stripped = line.strip()
+        if self._echo_rest and stripped and self._echo_rest.startswith(stripped):
+            # the continuation of a wrapped echo
+            self._echo_rest = self._echo_rest[len(stripped):].strip()
+            return
+        self._echo_rest = None
+
+        if not self.outputs[self.index] and self._typed + 1 < len(self.commands) \
+                and stripped == self.commands[self._typed + 1]:
+            # the echo of a command that was typed ahead, before the output of the current command
+            self._typed += 1
+            return
+
+        self.outputs[self.index].append(line)
+
+    def results(self, stderr_re=None):
+        """
+        Returns a list with a dict per command:
+
+            {'command': <command>, 'output': <text>, 'error': <error text or None>}
+        """
+        results = []
+        for command, lines in zip(self.commands, self.outputs):
+            output = b'\n'.join(lines).strip()
+            error = None
+            for regex in stderr_re or []:
+                match = regex.search(output)
+                if match:
+                    error = _to_text(output)
+                    break
+            results.append({'command': _to_text(command), 'output': _to_text(output), 'error': error})
+        return results
+
+
+def _strip_ansi(data, ansi_re):
+    for regex in ansi_re:
+        data = regex.sub(b'', data)
+    return data
+
+
+def receive(connection, consumer, timeout):
+    """
+    Reads from the shell of the connection and feeds the data to the consumer
+    until consumer.done is True. Raises BatchTimeout if no data is received
+    within timeout seconds.
+    """
+    shell = connection._ssh_shell
+    ansi_re = getattr(connection._terminal, 'ansi_re', [])
+    libssh = connection.ssh_type == 'libssh'
+
+    if not libssh:
+        # network_cli sets its own timeout on the channel
+        previous = shell.gettimeout()
+        shell.settimeout(timeout)
+
+    try:
+        deadline = time.time() + timeout
+        while not consumer.done:
+            if libssh:
+                data = shell.read_bulk_response()
+                if not data:
+                    if time.time() > deadline:
+                        raise BatchTimeout()
+                    time.sleep(0.01)
+                    continue
+                deadline = time.time() + timeout
+            else:
+                try:
+                    data = shell.recv(65536)
+                except socket.timeout:
+                    raise BatchTimeout()
+                if not data:
+                    raise EOFError("connection closed while receiving batch output")
+
+            consumer.feed(_strip_ansi(data, ansi_re))
+    finally:
+        if not libssh:
+            shell.settimeout(previous)
+
+
+class _Discard(object):
+
+    done = False
+
+    def feed(self, data):
+        pass
+
+
+def drain(connection, idle=DRAIN_IDLE):
+    """
+    Discards the output that the shell still sends after a batch that timed
+    out, until no data was received for idle seconds.
+    """
+    try:
+        receive(connection, _Discard(), idle)
+    except (BatchTimeout, EOFError, OSError):
+        pass
+
+
+def _indent(line):
+    return len(line) - len(line.lstrip())
+
+
+def config_chunks(lines, size=DEFAULT_BATCH_SIZE):
+    """
+    Splits configuration lines in chunks of at most size lines. A chunk also
+    ends after a line that is followed by indented lines (an interface, a
+    vrf, ...), so the children are only sent when their parent was accepted.
+    """
+    size = size or len(lines) or 1
+    chunk = []
+    for index, line in enumerate(lines):
+        chunk.append(line)
+        following = lines[index + 1] if index + 1 < len(lines) else None
+        if len(chunk) >= size or (following is not None and _indent(following) > _indent(line)):
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(connection, commands, batch_size=DEFAULT_BATCH_SIZE, timeout=None):
+    """
+    Executes a list of commands on a network_cli connection, the commands are
+    written in batches of batch_size commands.
+
+    Returns a list with a dict per command, see BatchSplitter.results(), the
+    caller decides what to do with errors.
+    """
+    if not connection._connected:
+        connection._connect()
+
+    prompt_re = connection._get_terminal_std_re('terminal_stdout_re')
+    stderr_re = connection._get_terminal_std_re('terminal_stderr_re')
+    if timeout is None:
+        timeout = connection.get_option('persistent_command_timeout')
+
+    results = []
+    commands = [_to_bytes(c) for c in commands]
+    batch_size = batch_size or len(commands) or 1
+    for start in range(0, len(commands), batch_size):
+        chunk = commands[start:start + batch_size]
+        splitter = BatchSplitter(chunk, prompt_re, connection._matched_prompt)
+
+        connection._ssh_shell.sendall(b''.join(c + b'\r' for c in chunk))
+        try:
+            receive(connection, splitter, timeout)
+        except BatchTimeout:
+            raise BatchTimeout(
+                "timeout value %s seconds reached while waiting for the output of: %s"
+                % (timeout, _to_text(splitter.commands[splitter.index]))
+            )
+
+        connection._matched_prompt = splitter.prompt
+        results.extend(splitter.results(stderr_re))
+
+    return results
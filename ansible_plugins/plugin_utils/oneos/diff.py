@@ -0,0 +1,249 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Indexed config diff for the oneos5 cliconf plugin.
+
+NetworkConfig.difference() checks every candidate line with "item not in
+other", which compares the full path of the line (parents + text, rebuilt on
+every comparison) against every line of the running-config. On configs of
+tens of thousands of lines that is quadratic. This module parses both configs
+the same way NetworkConfig does, but the running-config is indexed once by
+the path of every line so a candidate line is checked with a single lookup.
+
+The result is the same as NetworkConfig.difference() followed by the "end"
+nesting of Cliconf.get_diff (match line/strict/exact/none, replace
+line/block/config and path).
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import re
+
+
+COMMENT_TOKENS = ("#", "!", "/*", "*/", "echo")
+
+IGNORE_LINES_RE = (
+    re.compile(r"Using \d+ out of \d+ bytes"),
+    re.compile(r"Building configuration"),
+    re.compile(r"Current configuration : \d+ bytes"),
+)
+
+ENTRY_RE = re.compile(r"([{};])")
+
+
+class Line(object):
+    """
+    A config line, line is the path of the line (the text of all parents and
+    the line itself) and is used to compare lines.
+    """
+
+    __slots__ = ('raw', 'text', 'line', 'parents', 'children')
+
+    def __init__(self, raw, parents=()):
+        self.raw = raw
+        self.text = raw.strip()
+        self.parents = parents
+        self.children = []
+        if parents:
+            # the path of a parent already contains its own parents
+            self.line = parents[-1].line + " " + self.text
+        else:
+            self.line = self.text
+
+
+def _ignore_line(text, ignore_re):
+    if text.startswith(COMMENT_TOKENS):
+        return True
+    for regex in ignore_re:
+        if regex.match(text):
+            return True
+    return False
+
+
+def parse(config, ignore_lines=None):
+    """
+    Parses a config the same way NetworkConfig.parse does and returns the
+    list of Line objects.
+    """
+    ignore_re = list(IGNORE_LINES_RE)
+    for item in ignore_lines or []:
+        ignore_re.append(re.compile(item) if not hasattr(item, 'match') else item)
+
+    ancestors = []
+    indents = [0]
+    items = []
+
+    for raw in config.split("\n"):
+        text = raw.strip()
+        if '{' in text or '}' in text or ';' in text:
+            text = ENTRY_RE.sub("", text).strip()
+        if not text or _ignore_line(text, ignore_re):
+            continue
+
+        if not raw[0].isspace():
+            cfg = Line(raw)
+            ancestors = [cfg]
+            indents = [0]
+            items.append(cfg)
+            continue
+
+        line_indent = len(raw) - len(raw.lstrip())
+        while indents[-1] > line_indent:
+            indents.pop()
+        if line_indent > indents[-1]:
+            indents.append(line_indent)
+
+        curlevel = len(indents) - 1
+        cfg = Line(raw, tuple(ancestors[:curlevel]))
+
+        if curlevel <= len(ancestors):
+            del ancestors[curlevel:]
+            ancestors.append(cfg)
+            ancestors[curlevel - 1].children.append(cfg)
+
+        items.append(cfg)
+
+    return items
+
+
+def _expand_block(item):
+    block = [item]
+    seen = set([item.line])
+    stack = list(reversed(item.children))
+    while stack:
+        child = stack.pop()
+        if child.line in seen:
+            continue
+        seen.add(child.line)
+        block.append(child)
+        stack.extend(reversed(child.children))
+    return block
+
+
+def _get_block(items, path):
+    for item in items:
+        if item.text == path[-1] and [p.text for p in item.parents] == path[:-1]:
+            return _expand_block(item)
+    return []
+
+
+def _diff_line(candidate, running):
+    index = set(item.line for item in running)
+    return [item for item in candidate if item.line not in index]
+
+
+def _diff_strict(candidate, running):
+    if running and running[0].parents:
+        running = [Line(p.text) for p in reversed(running[0].parents)] + running
+
+    updates = []
+    for index, item in enumerate(candidate):
+        if index >= len(running) or item.text != running[index].raw.strip():
+            updates.append(item)
+    return updates
+
+
+def _diff_exact(candidate, running):
+    if len(candidate) != len(running):
+        return list(candidate)
+    for ours, theirs in zip(candidate, running):
+        if ours.line != theirs.line:
+            return list(candidate)
+    return []
+
+
+DIFF_METHODS = {
+    'line': _diff_line,
+    'strict': _diff_strict,
+    'exact': _diff_exact,
+}
+
+
+def difference(candidate, running, match='line', path=None, replace=None):
+    """
+    Returns the list of candidate Line objects that are not in running, with
+    the parents that are needed to apply them (NetworkConfig.difference).
+    """
+    if path and match != 'line':
+        running = _get_block(running, path)
+
+    updates = DIFF_METHODS[match](candidate, running)
+
+    if replace == 'block':
+        parents = []
+        seen = set()
+        for item in updates:
+            if not item.parents:
+                parents.append(item)
+                seen.add(item.line)
+            else:
+                for p in item.parents:
+                    if p.line not in seen:
+                        parents.append(p)
+                        seen.add(p.line)
+
+        updates = []
+        for item in parents:
+            updates.extend(_expand_block(item))
+
+    visited = set()
+    expanded = []
+
+    for curr in updates:
+        add_parents = False
+        if expanded:
+            last = expanded[-1]
+            if curr.parents and last.parents and curr.parents[0].text != last.parents[0].text:
+                add_parents = True
+            if last.children and last.children[0].text != curr.text:
+                add_parents = True
+        for p in curr.parents:
+            if add_parents or p.line not in visited:
+                visited.add(p.line)
+                expanded.append(p)
+        expanded.append(curr)
+        visited.add(curr.line)
+
+    return expanded
+
+
+def dumps(items):
+    """
+    Returns the text of the diff lines, every nested block is closed with
+    "end".
+    """
+    lines = []
+    last = len(items) - 1
+    for i, item in enumerate(items):
+        lines.append(item.text)
+        if i < last:
+            levels = len(item.parents) - len(items[i + 1].parents)
+        else:
+            levels = len(item.parents)
+        if item.text == 'end':
+            levels -= 1
+        if levels > 0:
+            lines.extend(["end"] * levels)
+    return "\n".join(lines)
+
+
+def config_diff(candidate, running=None, match='line', path=None, replace='line', ignore_lines=None):
+    """
+    Returns the lines of the candidate config that have to be applied to get
+    to the running config as text (empty string if there is no difference).
+    """
+    candidate_items = parse(candidate)
+
+    if running and match != 'none':
+        updates = difference(candidate_items, parse(running, ignore_lines), match=match, path=path, replace=replace)
+    else:
+        updates = candidate_items
+
+    if updates and replace == 'config':
+        return candidate
+
+    return dumps(updates)
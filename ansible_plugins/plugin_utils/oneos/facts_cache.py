@@ -0,0 +1,174 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Persistent device_info cache for the OneOS cliconf plugins.
+
+Collecting the device_info of a OneOS device takes 6-8 commands, the result
+only changes when the device reboots or gets a new image. The cache stores the
+collected facts per host in a SQLite database together with a fingerprint
+(serial number, system start time and software version) taken from a single
+"show system status". As long as the fingerprint matches and the entry is not
+older than the TTL the cached facts are reused.
+
+The database is shared by all persistent connection processes of a run (and
+across runs), errors are never fatal: when the database can't be used the
+cache simply behaves as a miss.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+import re
+import sqlite3
+import time
+
+
+DEFAULT_CACHE_PATH = "/runner/artifacts/oneos_facts_cache.db"
+DEFAULT_TTL = 86400
+DEFAULT_MAX_ENTRIES = 20000
+
+FINGERPRINT_RE = (
+    ('serial', re.compile(r'S/N\s+(\S+)')),
+    ('started', re.compile(r'^\W*System started\W+(.*?)\s*$', re.M)),
+    ('software', re.compile(r'^\W*Software [Vv]ersion\W+(\S+)', re.M)),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS device_facts (
+    host        TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    facts       TEXT NOT NULL,
+    created     REAL NOT NULL,
+    accessed    REAL NOT NULL
+)
+"""
+
+
+def device_fingerprint(status):
+    """
+    Returns the fingerprint of a device based on the output of
+    "show system status" or None if the output does not contain a serial number
+    and system start time (in that case the facts should not be cached).
+    """
+    values = []
+    for name, regex in FINGERPRINT_RE:
+        match = regex.search(status)
+        if not match:
+            if name == 'software':
+                values.append('')
+                continue
+            return None
+        values.append(match.group(1))
+
+    return "|".join(values)
+
+
+class FactsCache(object):
+    """
+    SQLite backed device_info cache.
+
+    :param path: location of the database file, the parent folder is created
+                 if it does not exist yet
+    :param ttl: maximum age in seconds of a cached entry, 0 disables expiry
+    :param max_entries: maximum number of hosts kept in the cache, the least
+                        recently used entries are evicted first
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = int(ttl or 0)
+        self.max_entries = int(max_entries or 0)
+
+    def _connect(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(SCHEMA)
+        return db
+
+    def get(self, host, fingerprint):
+        """
+        Returns the cached device_info for host or None when there is no valid
+        entry for the given fingerprint.
+        """
+        try:
+            db = self._connect()
+            try:
+                row = db.execute(
+                    "SELECT fingerprint, facts, created FROM device_facts WHERE host = ?", (host,)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                cached_fingerprint, facts, created = row
+                now = time.time()
+                if cached_fingerprint != fingerprint or (self.ttl and now - created > self.ttl):
+                    with db:
+                        db.execute("DELETE FROM device_facts WHERE host = ?", (host,))
+                    return None
+
+                with db:
+                    db.execute("UPDATE device_facts SET accessed = ? WHERE host = ?", (now, host))
+                return json.loads(facts)
+            finally:
+                db.close()
+        except (sqlite3.Error, OSError, ValueError):
+            return None
+
+    def set(self, host, fingerprint, facts):
+        """
+        Stores the device_info for host, returns False if the entry could not
+        be written.
+        """
+        try:
+            db = self._connect()
+            try:
+                now = time.time()
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO device_facts (host, fingerprint, facts, created, accessed) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (host, fingerprint, json.dumps(facts), now, now)
+                    )
+                    self._evict(db)
+            finally:
+                db.close()
+        except (sqlite3.Error, OSError, TypeError, ValueError):
+            return False
+
+        return True
+
+    def invalidate(self, host):
+        """
+        Removes the cached entry of a single host.
+        """
+        try:
+            db = self._connect()
+            try:
+                with db:
+                    db.execute("DELETE FROM device_facts WHERE host = ?", (host,))
+            finally:
+                db.close()
+        except (sqlite3.Error, OSError):
+            return False
+
+        return True
+
+    def _evict(self, db):
+        if self.ttl:
+            db.execute("DELETE FROM device_facts WHERE created < ?", (time.time() - self.ttl,))
+
+        if self.max_entries:
+            db.execute(
+                "DELETE FROM device_facts WHERE host IN ("
+                "SELECT host FROM device_facts ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
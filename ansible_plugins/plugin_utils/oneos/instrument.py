@@ -0,0 +1,327 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Per-command latency metrics of a network_cli connection.
+
+When the metrics option of the oneos cliconf plugins is enabled a Recorder
+is attached to the connection. It records for the SSH setup, the terminal
+setup (on_open_shell, on_become) and every command that is sent:
+
+- the wall time
+- the bytes that were received
+- the time that was spent matching the prompt and error regexes (only for
+  the matchers of oneos.matcher)
+
+and aggregates them in a histogram per (phase, command). The phase is the
+rpc the command was sent for (device_info, edit_config, ...), the
+configuration lines of edit_config are grouped under a single label.
+
+The histograms are written per host to <metrics_dir>/<host>.json and to
+<metrics_dir>/<host>.prom in the Prometheus text format (for the textfile
+collector of node_exporter), at most every EXPORT_INTERVAL seconds and when
+the persistent connection process exits.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import atexit
+import functools
+import json
+import os
+import re
+import tempfile
+import time
+
+from contextlib import contextmanager
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+EXPORT_INTERVAL = 10
+
+DEFAULT_PHASE = 'command'
+
+
+class Histogram(object):
+    """
+    Wall time histogram of a command with the totals of the received bytes
+    and the prompt match time.
+    """
+
+    __slots__ = ('count', 'sum', 'max', 'received', 'match_seconds', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.received = 0
+        self.match_seconds = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds, received=0, match_seconds=0.0):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.received += received
+        self.match_seconds += match_seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'received_bytes': self.received,
+            'match_seconds': self.match_seconds,
+            'buckets': dict(zip([str(b) for b in BUCKETS], self.buckets)),
+        }
+
+
+class Sample(object):
+    """
+    A single measurement, the caller sets the number of received bytes.
+    """
+
+    __slots__ = ('received',)
+
+    def __init__(self):
+        self.received = 0
+
+
+class Recorder(object):
+    """
+    Collects the metrics of a single connection.
+
+    :param host: host label of the metrics and name of the export files
+    :param path: folder the JSON and Prometheus files are written to
+    """
+
+    def __init__(self, host, path, interval=EXPORT_INTERVAL):
+        self.host = host
+        self.path = path
+        self.interval = interval
+        self.histograms = {}
+        self.patterns = []
+        self.phase = DEFAULT_PHASE
+        self.label = None
+        self.started = time.time()
+        self._exported = 0
+
+    def match_seconds(self):
+        return sum(pattern.elapsed for pattern in self.patterns)
+
+    def record(self, phase, command, seconds, received=0, match_seconds=0.0):
+        key = (phase, command)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(seconds, received, match_seconds)
+
+        if time.time() - self._exported >= self.interval:
+            self.export()
+
+    @contextmanager
+    def measure(self, command, phase=None, grouped=True):
+        """
+        Records the wall time of the with block for a command in phase (or
+        the current phase). If grouped is True and the current phase has a
+        label the label is used instead of the command.
+        """
+        if phase is None:
+            phase = self.phase
+            if grouped and self.label:
+                command = self.label
+
+        sample = Sample()
+        match_start = self.match_seconds()
+        start = time.time()
+        try:
+            yield sample
+        finally:
+            self.record(phase, command, time.time() - start, sample.received, self.match_seconds() - match_start)
+
+    @contextmanager
+    def in_phase(self, phase, label=None):
+        """
+        Commands in the with block are recorded for phase, with label as
+        command if it is set.
+        """
+        previous = self.phase, self.label
+        self.phase, self.label = phase, label
+        try:
+            yield
+        finally:
+            self.phase, self.label = previous
+
+    def to_dict(self):
+        metrics = []
+        for (phase, command), histogram in sorted(self.histograms.items()):
+            metric = {'phase': phase, 'command': command}
+            metric.update(histogram.to_dict())
+            metrics.append(metric)
+        return {
+            'host': self.host,
+            'pid': os.getpid(),
+            'started': self.started,
+            'updated': time.time(),
+            'metrics': metrics,
+        }
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP oneos_command_duration_seconds Wall time of the commands sent to OneOS devices.",
+            "# TYPE oneos_command_duration_seconds histogram",
+        ]
+        for (phase, command), histogram in sorted(self.histograms.items()):
+            labels = 'host="%s",phase="%s",command="%s"' % (_escape(self.host), _escape(phase), _escape(command))
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                lines.append('oneos_command_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, count))
+            lines.append('oneos_command_duration_seconds_bucket{%s,le="+Inf"} %d' % (labels, histogram.count))
+            lines.append('oneos_command_duration_seconds_sum{%s} %f' % (labels, histogram.sum))
+            lines.append('oneos_command_duration_seconds_count{%s} %d' % (labels, histogram.count))
+
+        for name, attr, help_text in (
+                ('oneos_command_received_bytes_total', 'received', 'Bytes received for the commands.'),
+                ('oneos_command_match_seconds_total', 'match_seconds', 'Time spent matching the prompt and error regexes.')):
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s counter" % name)
+            for (phase, command), histogram in sorted(self.histograms.items()):
+                labels = 'host="%s",phase="%s",command="%s"' % (_escape(self.host), _escape(phase), _escape(command))
+                lines.append('%s{%s} %s' % (name, labels, getattr(histogram, attr)))
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """
+        Writes the JSON and Prometheus files, errors are ignored so the
+        metrics never break a task.
+        """
+        self._exported = time.time()
+        name = re.sub(r'[^\w.-]', '_', self.host)
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            _write(os.path.join(self.path, name + '.json'), json.dumps(self.to_dict(), indent=2))
+            _write(os.path.join(self.path, name + '.prom'), self.to_prometheus())
+        except (IOError, OSError):
+            pass
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write(path, data):
+    # write and rename, the textfile collector must never read a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.%s.' % os.path.basename(path))
+    with os.fdopen(fd, 'w') as f:
+        f.write(data)
+    os.rename(tmp_path, path)
+
+
+def get_recorder(connection):
+    return getattr(connection, '_oneos_recorder', None)
+
+
+def wrap_ssh_connect(connection, wrapper):
+    """
+    Calls wrapper(ssh, ssh_connect, *args, **kwargs) instead of the _connect
+    of the SSH plugin (paramiko or libssh) of a network_cli connection.
+    network_cli drops its SSH plugin in close() (reset_connection) and
+    creates a new one for the next connect, so the wrappers are applied to
+    the SSH plugin every time network_cli connects. The first wrapper is the
+    innermost.
+    """
+    wrappers = getattr(connection, '_oneos_ssh_wrappers', None)
+    if wrappers is None:
+        wrappers = connection._oneos_ssh_wrappers = []
+        network_connect = connection._connect
+
+        def _connect(*args, **kwargs):
+            if not connection._connected:
+                ssh = connection.ssh_type_conn
+                applied = getattr(ssh, '_oneos_wrapped', 0)
+                for wrap in wrappers[applied:]:
+                    ssh._connect = functools.partial(wrap, ssh, ssh._connect)
+                ssh._oneos_wrapped = len(wrappers)
+            return network_connect(*args, **kwargs)
+
+        connection._connect = _connect
+    wrappers.append(wrapper)
+
+
+def attach_recorder(connection, path):
+    """
+    Attaches a Recorder to a network_cli connection (once), times the SSH
+    setup of every connect and enables the timing of the terminal matchers.
+    """
+    recorder = get_recorder(connection)
+    if recorder is not None:
+        recorder.path = path
+        return recorder
+
+    recorder = Recorder(connection.get_option('host'), path)
+    connection._oneos_recorder = recorder
+
+    terminal = getattr(connection, '_terminal', None)
+    for regex in getattr(terminal, 'terminal_stdout_re', []) + getattr(terminal, 'terminal_stderr_re', []):
+        if hasattr(regex, 'timing'):
+            regex.timing = True
+            recorder.patterns.append(regex)
+
+    def _connect(ssh, ssh_connect, *args, **kwargs):
+        with recorder.measure('ssh', phase='connect'):
+            return ssh_connect(*args, **kwargs)
+
+    wrap_ssh_connect(connection, _connect)
+
+    atexit.register(recorder.export)
+    return recorder
+
+
+@contextmanager
+def measure(connection, command, phase=None, grouped=True):
+    """
+    Recorder.measure for the connection, does nothing if there is no
+    recorder.
+    """
+    recorder = get_recorder(connection)
+    if recorder is None:
+        yield Sample()
+    else:
+        with recorder.measure(command, phase, grouped) as sample:
+            yield sample
+
+
+def timed(phase, command):
+    """
+    Decorator for plugin methods, the call is recorded as a single command.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with measure(self._connection, command, phase):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def in_phase(phase, label=None):
+    """
+    Decorator for plugin methods, the commands that are sent by the method
+    are recorded for phase.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            recorder = get_recorder(self._connection)
+            if recorder is None:
+                return func(self, *args, **kwargs)
+            with recorder.in_phase(phase, label):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
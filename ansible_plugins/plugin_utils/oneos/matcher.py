@@ -0,0 +1,178 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Prompt and error matchers for the OneOS terminal plugins.
+
+network_cli checks every received chunk against the terminal_stdout_re and
+terminal_stderr_re regexes. With libssh the regexes are searched over the
+complete response that was received so far, so for a multi-MB running-config
+or "show log" the same bytes are scanned over and over again, once per regex
+per chunk.
+
+The objects below behave like compiled regexes (search, match and pattern) so
+they can be used in terminal_stdout_re/terminal_stderr_re as they are:
+
+- TailPattern searches an end-anchored prompt regex only in the last bytes of
+  the response, a prompt is never longer than the window.
+- CombinedPattern groups a list of error regexes in a single object and
+  remembers the response it has already scanned, when the next response
+  starts with it only the new bytes (and a small overlap) are scanned.
+
+The regexes of CombinedPattern are searched one by one and not as a single
+alternation: re only uses its fast literal scan for a regex that starts with
+a literal, an alternation of the same literals is about 3 times slower (see
+benchmarks/bench_parsers.py).
+
+When timing is set on a matcher the time spent in search() and match() is
+added to its elapsed attribute (used by oneos.instrument).
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import re
+import time
+
+
+DEFAULT_WINDOW = 512
+DEFAULT_OVERLAP = 1024
+
+# inline flags that can be scoped to a single alternative, (?i:...)
+SCOPED_FLAGS = (
+    (re.IGNORECASE, 'i'),
+    (re.MULTILINE, 'm'),
+    (re.DOTALL, 's'),
+    (re.VERBOSE, 'x'),
+)
+
+
+def _compile(pattern):
+    if hasattr(pattern, 'pattern'):
+        return pattern
+    return re.compile(pattern)
+
+
+class Pattern(object):
+    """
+    Base class of the matchers, subclasses implement _search and _match.
+    """
+
+    timing = False
+    elapsed = 0.0
+
+    def search(self, data, pos=0):
+        if not self.timing:
+            return self._search(data, pos)
+        start = time.perf_counter()
+        try:
+            return self._search(data, pos)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+    def match(self, data, *args):
+        if not self.timing:
+            return self._match(data, *args)
+        start = time.perf_counter()
+        try:
+            return self._match(data, *args)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+
+class TailPattern(Pattern):
+    """
+    An end-anchored regex that is only searched in the last window bytes.
+
+    :param pattern: compiled regex or pattern, it has to end with $
+    :param window: number of bytes at the end of the response that are searched
+    """
+
+    def __init__(self, pattern, window=DEFAULT_WINDOW):
+        self.regex = _compile(pattern)
+        self.pattern = self.regex.pattern
+        self.flags = self.regex.flags
+        self.window = window
+
+    def _search(self, data, pos):
+        return self.regex.search(data, max(pos, len(data) - self.window))
+
+    def _match(self, data, *args):
+        return self.regex.match(data, *args)
+
+    def __repr__(self):
+        return "TailPattern(%r, window=%d)" % (self.pattern, self.window)
+
+
+class CombinedPattern(Pattern):
+    """
+    A list of regexes that behaves like a single regex, search() and match()
+    try the regexes in order and return the match of the first regex that
+    matches (not the leftmost match of all regexes like an alternation). The
+    pattern attribute is the equivalent alternation, for messages.
+
+    The last response that was searched without a match is kept, when the
+    next response starts with it (the receive buffer grew) the search starts
+    overlap bytes before the end of the previous response. The overlap has to
+    be longer than the longest match.
+
+    :param patterns: list of compiled regexes or patterns, all bytes or all text
+    :param overlap: number of bytes of the previous response that are searched again
+    """
+
+    def __init__(self, patterns, overlap=DEFAULT_OVERLAP):
+        self.regexes = [_compile(p) for p in patterns]
+        self.overlap = overlap
+        self.pattern = self._join(self.regexes)
+        # the flags that apply to all regexes
+        self.flags = 0
+        if self.regexes:
+            self.flags = self.regexes[0].flags
+            for regex in self.regexes[1:]:
+                self.flags &= regex.flags
+        self._last = None
+
+    @staticmethod
+    def _join(regexes):
+        parts = []
+        for regex in regexes:
+            flags = ''.join(letter for flag, letter in SCOPED_FLAGS if regex.flags & flag)
+            fmt = '(?%s:%%s)' % flags if flags else '(?:%s)'
+            if isinstance(regex.pattern, bytes):
+                fmt = fmt.encode('ascii')
+            parts.append(fmt % regex.pattern)
+        if not parts:
+            # never matches
+            return b'(?!)'
+        separator = b'|' if isinstance(parts[0], bytes) else '|'
+        return separator.join(parts)
+
+    def _search(self, data, pos):
+        last = self._last
+        if pos == 0 and last is not None and len(data) > self.overlap and data.startswith(last):
+            pos = max(0, len(last) - self.overlap)
+
+        match = None
+        for regex in self.regexes:
+            match = regex.search(data, pos)
+            if match:
+                break
+
+        # a response with a match is always searched from the start again
+        self._last = data if match is None else None
+        return match
+
+    def _match(self, data, *args):
+        for regex in self.regexes:
+            match = regex.match(data, *args)
+            if match:
+                return match
+        return None
+
+    def reset(self):
+        self._last = None
+
+    def __repr__(self):
+        return "CombinedPattern(%r)" % [r.pattern for r in self.regexes]
@@ -0,0 +1,256 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Table driven parsers for the show output of OneOS devices.
+
+Every supported command has a CommandParser with a list of Field specs. The
+field regexes of a command are compiled into a single alternation so the
+output is scanned only once, the group that matched tells which field it
+belongs to:
+
+    (<field 1 regex>)|(<field 2 regex>)|...
+
+Field regexes are line based: \\W and \\s never match a newline, so a field can
+not swallow the line of another field.
+
+    >>> parse('oneos6', 'show memory', data)
+    {'network_os_diskspace_total_bytes': 415300000.0, 'network_os_diskspace_free_bytes': 345700000.0}
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import re
+from datetime import datetime
+
+
+def _line_local(pattern):
+    return pattern.replace(r'\W', r'[^\w\n]').replace(r'\s', r'[^\S\n]')
+
+
+class Field(object):
+    """
+    Describes a value in the output of a command.
+
+    :param name: key in the parsed result, a tuple of keys if convert returns
+                 multiple values
+    :param pattern: regex with capture groups, matched per line (re.M)
+    :param convert: function that gets the captured groups as arguments, the
+                    default returns the first group (or all groups as a tuple)
+                    keys with value None are not added to the result
+    :param multiple: collect all matches in a list instead of the first match
+    """
+
+    def __init__(self, name, pattern, convert=None, multiple=False):
+        self.names = name if isinstance(name, tuple) else (name,)
+        self.regex = re.compile(_line_local(pattern), re.M)
+        self.convert = convert
+        self.multiple = multiple
+
+    def values(self, groups):
+        if self.convert:
+            value = self.convert(*groups)
+        elif len(groups) == 1:
+            value = groups[0]
+        else:
+            value = groups
+
+        if len(self.names) == 1:
+            return (value,)
+        return value
+
+
+class CommandParser(object):
+    """
+    Parses the output of a single command in one pass.
+
+    :param fields: list of Field specs
+    :param defaults: values that are returned if a field is not found
+    :param finalize: function that is called with the result dict for values
+                     that depend on multiple fields
+    """
+
+    def __init__(self, fields, defaults=None, finalize=None):
+        self.fields = fields
+        self.defaults = defaults or {}
+        self.finalize = finalize
+
+        parts = []
+        self._dispatch = {}
+        index = 1
+        for field in fields:
+            parts.append('(%s)' % field.regex.pattern)
+            # the wrapper group is always the last group that is closed, so
+            # match.lastindex points to it
+            self._dispatch[index] = (field, index, index + field.regex.groups)
+            index += 1 + field.regex.groups
+
+        self.regex = re.compile('|'.join(parts), re.M)
+
+    def parse(self, text):
+        result = dict(self.defaults)
+        for field in self.fields:
+            if field.multiple:
+                for name in field.names:
+                    result[name] = []
+
+        found = set()
+        for match in self.regex.finditer(text.replace('\r', '')):
+            field, start, end = self._dispatch[match.lastindex]
+            if field in found:
+                continue
+
+            groups = match.groups()[start:end]
+            for name, value in zip(field.names, field.values(groups)):
+                if value is None:
+                    continue
+                if field.multiple:
+                    result[name].append(value)
+                else:
+                    result[name] = value
+
+            if not field.multiple:
+                found.add(field)
+
+        if self.finalize:
+            self.finalize(result)
+
+        return result
+
+
+def _version_number(version):
+    match = re.search(r'.*\-V([0-9]+)', version)
+    return version, match.group(1) if match else None
+
+
+def _timestamp(started):
+    try:
+        return started, datetime.strptime(started, "%Y-%m-%d %H:%M:%S%z").timestamp()
+    except ValueError:
+        return started, None
+
+
+def _software_banks(result):
+    # lines are (bank header, software version) tuples in the order of the output
+    primary = None
+    alternate = None
+    in_alternate = False
+    for bank, version in result.pop('software_image_lines'):
+        if bank:
+            in_alternate = True
+        elif in_alternate:
+            if alternate is None:
+                alternate = version
+        else:
+            primary = version
+
+    if in_alternate and primary is not None:
+        result['network_os_software_bank_primary'] = primary
+    if alternate is not None:
+        result['network_os_software_bank_alternate'] = alternate
+
+
+def _product_info(name):
+    return r'^\|\s*%s\s*\|\s*(\S.*?)\s*\|\s*$' % name
+
+
+PRODUCT_INFO_AREA = CommandParser([
+    Field('network_os_platform', _product_info(r'Product [Nn]ame')),
+    Field('network_os_platform_commercial', _product_info(r'Commercial [Nn]ame')),
+    Field('network_os_serial_number', _product_info(r'Serial [Nn]umber')),
+])
+
+
+PARSERS = {
+    'oneos5': {
+        'show system status': CommandParser([
+            Field(('network_os_software_version', 'network_os_version'),
+                  r'\W*Software [Vv]ersion\W+(\S+)\W*$', convert=_version_number),
+            Field('network_os_boot_version', r'\W*Boot [Vv]ersion\W+(\S+)\W*$'),
+            Field('network_os_license_token', r'\W*License token\W+(\S+)\W*$'),
+            Field('network_os_system_started', r'\W*System started\W+(.*)$'),
+            Field('network_os_system_uptime', r'\W*Sys Up time\W+(.*)$'),
+            Field('network_os_system_uptime_secs', r'\W*System clock ticks\W+(.*)$'),
+            Field('network_os_system_restart_cause', r'\W*Start caused by\W+(.*)$'),
+            Field('network_os_diskspace_total_bytes', r'\W*OneOS Ram size\W+(\d+)Mo',
+                  convert=lambda size: int(size) * 1000),
+        ]),
+        'show running-config |hostname': CommandParser([
+            Field('network_os_hostname', r'\W*hostname\W+(\S+)\W*$'),
+        ]),
+        'show product-info-area': PRODUCT_INFO_AREA,
+        'ls /BSA/binaries': CommandParser([
+            Field('network_os_boot_available_files', r'^\W*(\S+)\s+([0-9]{2,})\s*$',
+                  convert=lambda name, size: {"file": name, "size": size}, multiple=True),
+        ]),
+        'cat /BSA/bsaBoot.inf': CommandParser([
+            Field('network_os_boot_startup_image', r'flash:(/BSA/binaries/\w+)$'),
+            Field('network_os_startup_config', r'flash:(/BSA/config/\S+)$'),
+        ]),
+        'show device status flash': CommandParser([
+            Field('network_os_diskspace_free_bytes', r'\Wfree space on volume:\W+(\S+)',
+                  convert=lambda size: size.replace(",", "")),
+        ]),
+    },
+    'oneos6': {
+        'show system status': CommandParser([
+            Field('network_os_software_version', r'\W*Software [Vv]ersion\W+(\S+)\W*$'),
+            Field(('network_os_boot_version', 'network_os_boot_startup_image'),
+                  r'\W*Boot [Vv]ersion\W+(\S+)\W*$', convert=lambda version: (version, version)),
+            Field(('network_os_system_started', 'network_os_system_uptime_secs'),
+                  r'\W*System started\W+(.*)$', convert=_timestamp),
+            Field('network_os_system_uptime', r'\W*Sys Up time\W+(.*)$'),
+            Field('network_os_system_restart_cause', r'\W*Start caused by\W+(.*)$'),
+        ]),
+        'show running-config hostname': CommandParser([
+            Field('network_os_hostname', r'\W*hostname\W+(\S+)\W*$'),
+        ]),
+        'show product-info-area': PRODUCT_INFO_AREA,
+        'show memory': CommandParser([
+            Field(('network_os_diskspace_total_bytes', 'network_os_diskspace_free_bytes'),
+                  r'.*- user\W+([0-9\.]+)MiB\W+([0-9\.]+)MiB',
+                  convert=lambda total, free: (float(total) * 1000 * 1000, float(free) * 1000 * 1000)),
+        ]),
+        'ls -l /BSA/binaries': CommandParser([
+            Field('network_os_boot_available_files', r'\S+ +\d+ +(\d+).* (.*)$',
+                  convert=lambda size, name: {"file": name, "size": size}, multiple=True),
+        ]),
+        'show software-image': CommandParser([
+            Field('software_image_lines', r'^-+ (Alternate) bank|\W*Software version\W+(\S*)', multiple=True),
+        ], defaults={
+            'network_os_software_bank_primary': "NOT SET",
+            'network_os_software_bank_alternate': "NOT SET",
+        }, finalize=_software_banks),
+        'cat /BSA/bsaBoot.inf': CommandParser([
+            Field('network_os_startup_config', r'flash:(/BSA/config/\S+)$'),
+        ], defaults={
+            'network_os_startup_config': "/BSA/config/bsaStart.cfg",
+        }),
+    },
+}
+
+
+def normalize_command(command):
+    return ' '.join(command.split())
+
+
+def get_parser(network_os, command):
+    """
+    Returns the CommandParser for a command or None if there is no parser.
+    """
+    return PARSERS.get(network_os, {}).get(normalize_command(command))
+
+
+def parse(network_os, command, text):
+    """
+    Parses the output of a command, raises ValueError if the command is not
+    supported.
+    """
+    parser = get_parser(network_os, command)
+    if parser is None:
+        raise ValueError("no parser available for '%s' on %s" % (command, network_os))
+
+    return parser.parse(text)
@@ -0,0 +1,72 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+TCP reachability probes of the oneos_preflight callback.
+
+All hosts are probed at the same time with asyncio, so the probes of a
+fleet take about the timeout of a single probe instead of a fork per host
+that waits for the SSH timeout. A host is reachable when it accepts the TCP
+connection and, unless banner is disabled, sends the SSH banner within the
+timeout.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import asyncio
+import time
+
+
+async def _probe(address, port, timeout, banner, semaphore):
+    async with semaphore:
+        start = time.time()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+        except asyncio.TimeoutError:
+            return False, 'no answer on port %s within %ss' % (port, timeout), time.time() - start
+        except (OSError, ValueError) as exc:
+            return False, str(exc) or exc.__class__.__name__, time.time() - start
+
+        error = None
+        if banner:
+            # a firewall or NAT device can accept the connection for a host that is down
+            try:
+                line = await asyncio.wait_for(reader.readline(), max(timeout - (time.time() - start), 0.01))
+                if not line.startswith(b'SSH-'):
+                    error = 'no SSH banner on port %s' % port
+            except asyncio.TimeoutError:
+                error = 'no SSH banner on port %s within %ss' % (port, timeout)
+            except (OSError, ValueError) as exc:
+                error = str(exc) or exc.__class__.__name__
+        writer.close()
+        return error is None, error, time.time() - start
+
+
+async def _probe_all(targets, timeout, banner, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    names = list(targets)
+    results = await asyncio.gather(*[_probe(targets[name][0], targets[name][1], timeout, banner, semaphore)
+                                     for name in names])
+    return dict(zip(names, results))
+
+
+def probe(targets, timeout=2.0, banner=True, concurrency=500):
+    """
+    Opens a TCP connection to every target, returns {name: (reachable,
+    error, seconds)}.
+
+    :param targets: {name: (address, port)}
+    :param timeout: seconds a connection may take
+    :param banner: the host must also send the SSH banner within the timeout
+    :param concurrency: maximum number of connections that are open at once
+    """
+    if not targets:
+        return {}
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(_probe_all(targets, timeout, banner, concurrency))
+    finally:
+        loop.close()
@@ -0,0 +1,143 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+CPU and memory profiling of the persistent connection process.
+
+The cliconf and terminal plugins run in the ansible-connection process of a
+host, a profiler of ansible-playbook never sees them. When the profile
+option of the oneos cliconf plugins is enabled a Profiler is attached to the
+connection: cProfile and tracemalloc are started when the connection is
+opened and stopped when the connection is closed (or the process exits).
+Then the dumps are written to <profile_dir>:
+
+    <host>.<pid>.<n>.prof         cProfile stats (pstats), n counts the
+                                  connections of the process
+    <host>.<pid>.<n>.tracemalloc  tracemalloc snapshot
+
+cProfile only profiles the thread that opened the connection, that is the
+thread that handles the requests of the persistent connection. The reader
+thread of paramiko is not included.
+
+tools/merge_profiles.py merges the dumps of all hosts in one report.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import atexit
+import cProfile
+import os
+import re
+import tracemalloc
+
+
+DEFAULT_ARTIFACT_DIR = '/runner/artifacts'
+
+TRACEMALLOC_FRAMES = 10
+
+
+def default_profile_dir():
+    """
+    Returns the profiles folder in the artifacts folder of the job.
+    """
+    return os.path.join(os.environ.get('AWX_ISOLATED_DATA_DIR') or DEFAULT_ARTIFACT_DIR, 'profiles')
+
+
+class Profiler(object):
+    """
+    cProfile and tracemalloc for the connection to a single host.
+
+    :param host: host name in the file names of the dumps
+    :param path: folder the dumps are written to
+    """
+
+    def __init__(self, host, path, frames=TRACEMALLOC_FRAMES):
+        self.host = host
+        self.path = path
+        self.frames = frames
+        self.profile = None
+        self.count = 0
+        self._tracemalloc = False
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.count += 1
+        # tracemalloc may have been started with -X tracemalloc, it is only stopped when started here
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._tracemalloc = True
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        """
+        Stops the profilers and writes the dumps, errors are ignored so the
+        profiling never breaks a task.
+        """
+        if not self.running:
+            return
+        profile, self.profile = self.profile, None
+        profile.disable()
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if self._tracemalloc:
+            tracemalloc.stop()
+            self._tracemalloc = False
+
+        name = os.path.join(self.path, '%s.%d.%d' % (re.sub(r'[^\w.-]', '_', self.host), os.getpid(), self.count))
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            profile.dump_stats(name + '.prof')
+            if snapshot is not None:
+                snapshot.dump(name + '.tracemalloc')
+        except (IOError, OSError):
+            pass
+
+
+def get_profiler(connection):
+    return getattr(connection, '_oneos_profiler', None)
+
+
+def attach_profiler(connection, path=None):
+    """
+    Attaches a Profiler to a network_cli connection (once). The profilers
+    are started when the connection is opened, so only in the persistent
+    connection process, and stopped when the connection is closed.
+    """
+    profiler = get_profiler(connection)
+    if profiler is not None:
+        profiler.path = path or profiler.path
+        return profiler
+
+    profiler = Profiler(connection.get_option('host'), path or default_profile_dir())
+    connection._oneos_profiler = profiler
+
+    connection_connect = connection._connect
+
+    def _connect(*args, **kwargs):
+        if not connection._connected:
+            profiler.start()
+        return connection_connect(*args, **kwargs)
+
+    connection._connect = _connect
+
+    connection_close = connection.close
+
+    def close(*args, **kwargs):
+        try:
+            return connection_close(*args, **kwargs)
+        finally:
+            profiler.stop()
+
+    connection.close = close
+
+    atexit.register(profiler.stop)
+    return profiler
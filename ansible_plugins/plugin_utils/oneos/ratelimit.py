@@ -0,0 +1,168 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+SSH login rate limiter shared by the persistent connection processes.
+
+Every host has its own persistent connection process, with a high number of
+forks hundreds of processes log in at the same time and the TACACS/RADIUS
+servers behind the devices time out. The LoginLimiter is a token bucket in
+a state file that is locked with flock, so it is shared by all processes
+(and all containers that mount the same file):
+
+- a login takes a token, the bucket holds at most burst tokens and is
+  refilled with rate tokens per second
+- a failed authentication blocks all logins for the backoff time, the
+  backoff doubles for every failure in a row (up to MAX_BACKOFF) and is
+  reset by a successful login
+- the login of a host is retried when the authentication failed
+
+The limiter is attached to the SSH connection of network_cli, before the
+terminal setup (on_open_shell) of the oneos terminal plugins.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import fcntl
+import json
+import os
+import re
+import time
+
+from contextlib import contextmanager
+
+from ansible.errors import AnsibleAuthenticationFailure
+from ansible.utils.display import Display
+
+from oneos.instrument import get_recorder, wrap_ssh_connect
+
+display = Display()
+
+
+MAX_BACKOFF = 300.0
+
+AUTH_ERROR_RE = re.compile(r'authenticat', re.I)
+
+
+def is_auth_error(exc):
+    return isinstance(exc, AnsibleAuthenticationFailure) or bool(AUTH_ERROR_RE.search(str(exc)))
+
+
+class LoginLimiter(object):
+    """
+    Token bucket of the logins in a state file.
+
+    :param path: state file, created when it does not exist
+    :param rate: logins per second
+    :param burst: logins that can start at once
+    :param backoff: seconds all logins wait after the first failed authentication
+    """
+
+    def __init__(self, path, rate, burst=10, backoff=5.0):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.backoff = backoff
+
+    @contextmanager
+    def _state(self):
+        """
+        Yields the locked state, it is written when the with block ends.
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                except ValueError:
+                    state = {}
+                now = time.time()
+                if 'tokens' not in state:
+                    state = {'tokens': float(self.burst), 'updated': now, 'blocked_until': 0, 'failures': 0}
+                state['tokens'] = min(float(self.burst), state['tokens'] + (now - state['updated']) * self.rate)
+                state['updated'] = now
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self):
+        """
+        Waits for a login token, returns the seconds that were waited.
+        """
+        start = time.time()
+        while True:
+            with self._state() as state:
+                now = state['updated']
+                if now < state['blocked_until']:
+                    wait = state['blocked_until'] - now
+                elif state['tokens'] >= 1:
+                    state['tokens'] -= 1
+                    return now - start
+                else:
+                    wait = (1 - state['tokens']) / self.rate
+            time.sleep(wait)
+
+    def failed(self):
+        """
+        Blocks the logins after a failed authentication, returns the backoff.
+        """
+        with self._state() as state:
+            state['failures'] += 1
+            backoff = min(self.backoff * 2 ** (state['failures'] - 1), MAX_BACKOFF)
+            state['blocked_until'] = max(state['blocked_until'], state['updated'] + backoff)
+            state['tokens'] = 0.0
+            return backoff
+
+    def succeeded(self):
+        with self._state() as state:
+            state['failures'] = 0
+
+
+def attach_login_limiter(connection, path, rate, burst=10, backoff=5.0, retries=2):
+    """
+    Limits the SSH logins of a network_cli connection (once, also after a
+    reset_connection). The wait for a token is recorded as the login_wait
+    command of the connect phase when metrics are enabled.
+    """
+    if getattr(connection, '_oneos_login_limiter', None) is not None:
+        return
+
+    limiter = LoginLimiter(path, rate, burst, backoff)
+    connection._oneos_login_limiter = limiter
+    host = connection.get_option('host')
+
+    def _connect(ssh, ssh_connect, *args, **kwargs):
+        attempt = 0
+        while True:
+            waited = limiter.acquire()
+            recorder = get_recorder(connection)
+            if recorder is not None:
+                recorder.record('connect', 'login_wait', waited)
+            try:
+                result = ssh_connect(*args, **kwargs)
+            except Exception as exc:
+                if not is_auth_error(exc):
+                    raise
+                backoff = limiter.failed()
+                attempt += 1
+                if attempt > retries:
+                    raise
+                display.vvv("login of %s failed (%s), retry %d of %d, logins blocked for %ds"
+                            % (host, exc, attempt, retries, backoff), host=host)
+                continue
+            limiter.succeeded()
+            return result
+
+    wrap_ssh_connect(connection, _connect)
+    return limiter
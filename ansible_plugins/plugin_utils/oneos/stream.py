@@ -0,0 +1,157 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Streams the output of a single command to a file.
+
+send_command keeps the complete output of a command in memory (and copies it
+a few times before it reaches the playbook), for running-configs of tens of
+MB that is a lot of memory per fork. stream_command writes the output to a
+file line by line while it is received, only the current line is kept in
+memory. The size and sha256 of the file are calculated on the fly.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import hashlib
+import os
+import tempfile
+
+from oneos.batch import BatchTimeout, is_prompt, receive
+from oneos.transfer import replace_file
+
+
+class StreamWriter(object):
+    """
+    Writes the received output of a command to a file object.
+
+    The echo of the command, leading and trailing empty lines and the final
+    prompt are not written, which gives the same result as send_command.
+
+    :param command: the command (bytes) that was sent
+    :param fileobj: binary file object the output is written to
+    :param prompt_re: list of compiled prompt regexes (terminal_stdout_re)
+    :param stderr_re: list of compiled error regexes (terminal_stderr_re)
+    """
+
+    def __init__(self, command, fileobj, prompt_re, stderr_re=None):
+        self.command = command.strip()
+        self.fileobj = fileobj
+        self.prompt_re = prompt_re
+        self.stderr_re = stderr_re or []
+        self.prompt = None
+        self.error = None
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self._pending = b''
+        self._first_line = True
+        self._started = False
+        self._empty_lines = 0
+
+    @property
+    def done(self):
+        return self.prompt is not None
+
+    def feed(self, data):
+        lines = (self._pending + data).split(b'\n')
+        self._pending = lines.pop()
+
+        for line in lines:
+            self._line(line.rstrip(b'\r'))
+
+        pending = self._pending.rstrip(b'\r')
+        if pending and is_prompt(pending, self.prompt_re):
+            self.prompt = pending
+
+        return self.done
+
+    def _line(self, line):
+        if self._first_line:
+            self._first_line = False
+            if line.strip() == self.command:
+                return
+
+        if self.error is None:
+            for regex in self.stderr_re:
+                if regex.search(line):
+                    self.error = line.decode('utf-8', 'surrogateescape')
+                    break
+
+        if not line.strip():
+            # only written when followed by a non empty line
+            if self._started:
+                self._empty_lines += 1
+            return
+
+        self._write(b'\n' * self._empty_lines)
+        if self._started:
+            self._write(b'\n')
+        self._write(line)
+        self._started = True
+        self._empty_lines = 0
+
+    def _write(self, data):
+        if data:
+            self.fileobj.write(data)
+            self.sha256.update(data)
+            self.size += len(data)
+
+
+def stream_command(connection, command, path, timeout=None):
+    """
+    Executes a command on a network_cli connection and writes the output to
+    path. The output is written to a temporary file in the same folder first,
+    path is only replaced if the command succeeded and the output differs
+    from it.
+
+    Returns a dict:
+
+        {'path': <path>, 'size': <bytes>, 'sha256': <hexdigest>, 'error': <error line or None>,
+         'changed': <path was replaced>}
+    """
+    if not connection._connected:
+        connection._connect()
+
+    prompt_re = connection._get_terminal_std_re('terminal_stdout_re')
+    stderr_re = connection._get_terminal_std_re('terminal_stderr_re')
+    if timeout is None:
+        timeout = connection.get_option('persistent_command_timeout')
+
+    if not isinstance(command, bytes):
+        command = command.encode('utf-8')
+
+    folder = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.%s.' % os.path.basename(path))
+    changed = False
+    try:
+        with os.fdopen(fd, 'wb') as fileobj:
+            writer = StreamWriter(command, fileobj, prompt_re, stderr_re)
+            connection._ssh_shell.sendall(command + b'\r')
+            try:
+                receive(connection, writer, timeout)
+            except BatchTimeout:
+                raise BatchTimeout(
+                    "timeout value %s seconds reached while waiting for the output of: %s"
+                    % (timeout, command.decode('utf-8', 'surrogateescape'))
+                )
+
+        connection._matched_prompt = writer.prompt
+        if writer.error is None:
+            changed = replace_file(tmp_path, path, writer.sha256.hexdigest())
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return {
+        'path': path,
+        'size': writer.size,
+        'sha256': writer.sha256.hexdigest(),
+        'error': writer.error,
+        'changed': changed,
+    }
@@ -0,0 +1,86 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Job phase timeline written by the oneos_timeline callback.
+
+make run passes the time before docker run as RUNNER_JOB_START to the
+container, the callback writes the phases up to the end of the playbook and
+tools/timeline.py adds the last phase when docker run returned:
+
+    container start               job start -> pid 1 of the container
+    ansible-runner setup          pid 1 -> ansible-playbook process
+    collection and plugin import,
+    inventory parse               ansible-playbook process -> playbook start
+    task execution                playbook start -> playbook stats
+    artifact write and container
+    stop                          playbook stats -> docker run returned
+
+The vars load, vault decryption and per-host connect times are summed over
+all workers and are part of the task execution.
+
+Only the standard library is used, tools/timeline.py runs on the docker host.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+ARTIFACT_WRITE = 'artifact write and container stop'
+
+
+def add_job_end(timeline, job_end):
+    """
+    Adds the phase between the end of the playbook and job_end, when docker
+    run returned.
+    """
+    marks = timeline['marks']
+    marks['job_end'] = job_end
+    timeline['phases'] = [phase for phase in timeline['phases'] if phase['name'] != ARTIFACT_WRITE]
+    timeline['phases'].append({
+        'name': ARTIFACT_WRITE, 'start': marks['playbook_end'], 'end': job_end,
+        'seconds': max(job_end - marks['playbook_end'], 0.0),
+    })
+    return timeline
+
+
+def format_report(timeline):
+    """
+    Returns the timeline as a text report.
+    """
+    phases = timeline['phases']
+    total = sum(phase['seconds'] for phase in phases) or 1.0
+    lines = ["%-48s %10s %6s" % ('phase', 'seconds', '%')]
+    for phase in phases:
+        lines.append("%-48s %10.2f %5.1f%%" % (phase['name'], phase['seconds'], 100.0 * phase['seconds'] / total))
+    lines.append("%-48s %10.2f" % ('total', sum(phase['seconds'] for phase in phases)))
+
+    execution = timeline['task_execution']
+    lines.append("")
+    lines.append("task execution, summed over all hosts and forks:")
+    lines.append("  %-46s %10.2f (%d calls)" % ('inventory and vars load', execution['vars_load']['seconds'],
+                                               execution['vars_load']['count']))
+    lines.append("  %-46s %10.2f (%d calls)" % ('vault decryption', execution['vault_decrypt']['seconds'],
+                                               execution['vault_decrypt']['count']))
+    cache = execution.get('vault_cache')
+    if cache:
+        if cache['locked']:
+            lines.append("    %-44s %10s (%d hits, %d misses, %d values, %d bytes locked)"
+                         % ('vault cache', '', cache['hits'], cache['misses'], cache['entries'], cache['bytes']))
+        else:
+            lines.append("    %-44s %10s (memory can't be locked, disabled)" % ('vault cache', ''))
+    connect = execution['connect']
+    if connect:
+        seconds = [host['seconds'] for host in connect.values()]
+        lines.append("  %-46s %10.2f (%d hosts, max %.2f)" % ('connect', sum(seconds), len(seconds), max(seconds)))
+        slowest = sorted(connect.items(), key=lambda item: item[1]['seconds'], reverse=True)[:5]
+        for host, row in slowest:
+            setup = ', '.join('%s %.2f' % item for item in sorted(row.get('setup', {}).items()))
+            lines.append("    %-44s %10.2f%s" % (host, row['seconds'], ' (%s)' % setup if setup else ''))
+    if execution['slowest_tasks']:
+        lines.append("  slowest tasks:")
+        for task in execution['slowest_tasks']:
+            lines.append("    %-44s %10.2f" % (task['name'][:44], task['seconds']))
+    return "\n".join(lines)
@@ -0,0 +1,80 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+File downloads over the network_cli connection.
+
+network_cli.get_file() downloads a file from the device over sftp/scp in a
+single binary transfer, much faster than printing the file on the terminal.
+download() adds what the backup rpc needs: an atomic write of the local file,
+the size and sha256 of the file and the transfer time. The local file is kept
+when the download has the same sha256.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import hashlib
+import os
+import tempfile
+import time
+
+
+def file_checksum(path, blocksize=65536):
+    """
+    Returns the size and sha256 of a local file.
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha256.update(block)
+            size += len(block)
+    return size, sha256.hexdigest()
+
+
+def replace_file(tmp_path, path, sha256):
+    """
+    Renames tmp_path to path unless path has the same sha256, returns True
+    if path was replaced.
+    """
+    if os.path.isfile(path) and file_checksum(path)[1] == sha256:
+        return False
+    os.rename(tmp_path, path)
+    return True
+
+
+def download(connection, source, path, proto='sftp', timeout=30):
+    """
+    Downloads source from the device to path, path is only replaced if the
+    download succeeded and differs from it. Returns a dict:
+
+        {'path': <path>, 'size': <bytes>, 'sha256': <hexdigest>, 'seconds': <transfer time>,
+         'changed': <path was replaced>}
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.%s.' % os.path.basename(path))
+    os.close(fd)
+    try:
+        start = time.time()
+        connection.get_file(source=source, destination=tmp_path, proto=proto, timeout=timeout)
+        seconds = time.time() - start
+
+        size, sha256 = file_checksum(tmp_path)
+        changed = replace_file(tmp_path, path, sha256)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return {
+        'path': path,
+        'size': size,
+        'sha256': sha256,
+        'seconds': seconds,
+        'changed': changed,
+    }
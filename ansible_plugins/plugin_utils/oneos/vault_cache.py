@@ -0,0 +1,206 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Run scoped cache of the decrypted vault data, installed by the
+oneos_vault_cache callback.
+
+Every vaulted value is decrypted (with a PBKDF2 key derivation) every time
+it is used, in the worker process of every task and host. With the cache:
+
+- the plaintext of a vaulted blob is kept by the sha256 of the vaulttext
+  and returned by VaultLib.decrypt_and_get_vault_id for the next uses
+- the vaulted values (!vault) are decrypted in the controller when they
+  are loaded, or at the play start when they were loaded before the cache
+  was installed (ansible >= 2.19). Every worker process that is forked
+  later finds them in the cache, so each distinct blob is decrypted once.
+  Only the controller adds values, the memory lock is not inherited by the
+  forked workers so they decrypt a value that is not cached without
+  caching it.
+- the plaintext is kept in an anonymous memory map that is locked (mlock,
+  never swapped) and excluded from core dumps, it is never written to a
+  file and it is wiped when the controller exits. When the memory can't be
+  locked or is full the values are not cached.
+
+The hits and misses of all processes are counted in shared memory.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import atexit
+import ctypes
+import ctypes.util
+import hashlib
+import mmap
+import multiprocessing
+import os
+
+from collections.abc import Mapping
+
+from ansible.module_utils._text import to_bytes
+from ansible.parsing.vault import VaultLib
+
+try:
+    from ansible.parsing.vault import EncryptedString, VaultSecretsContext
+    from ansible.module_utils._internal._datatag import AnsibleTagHelper
+except ImportError:
+    # ansible < 2.19 decrypts the vaulted values when they are used, only those calls are cached
+    EncryptedString = VaultSecretsContext = AnsibleTagHelper = None
+
+
+DEFAULT_SIZE = 32768
+
+HITS, MISSES, UNCACHED = range(3)
+
+_cache = None
+
+
+def _mlock(buffer, size):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return libc.mlock(ctypes.c_void_p(ctypes.addressof(buffer)), ctypes.c_size_t(size)) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+class SecretCache(object):
+    """
+    Plaintexts by vaulttext digest in a locked memory map of size bytes.
+    """
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.pid = os.getpid()
+        self.size = size
+        # private: the workers read the pages of the controller, they never write
+        self.arena = mmap.mmap(-1, size, flags=mmap.MAP_PRIVATE)
+        self._buffer = (ctypes.c_char * size).from_buffer(self.arena)
+        self.locked = _mlock(self._buffer, size)
+        if hasattr(mmap, 'MADV_DONTDUMP'):
+            self.arena.madvise(mmap.MADV_DONTDUMP)
+        # digest: (offset, length, vault id, vault secret)
+        self.entries = {}
+        self.used = 0
+        self.counters = multiprocessing.Array('q', 3)
+
+    def count(self, counter):
+        with self.counters.get_lock():
+            self.counters[counter] += 1
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        offset, length, vault_id, vault_secret = entry
+        return self.arena[offset:offset + length], vault_id, vault_secret
+
+    def put(self, key, plaintext, vault_id, vault_secret):
+        # a copy-on-write page of a worker is not locked
+        if (os.getpid() != self.pid or self.arena.closed or not self.locked or
+                self.used + len(plaintext) > self.size):
+            self.count(UNCACHED)
+            return False
+        self.arena[self.used:self.used + len(plaintext)] = plaintext
+        self.entries[key] = (self.used, len(plaintext), vault_id, vault_secret)
+        self.used += len(plaintext)
+        return True
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.used,
+            'size': self.size,
+            'locked': self.locked,
+            'hits': self.counters[HITS],
+            'misses': self.counters[MISSES],
+            'uncached': self.counters[UNCACHED],
+        }
+
+    def wipe(self):
+        # only the controller owns the memory, the workers exit without atexit handlers
+        if os.getpid() != self.pid or self.arena.closed:
+            return
+        self.arena[:self.used] = b'\0' * self.used
+        self.entries.clear()
+        del self._buffer
+        self.arena.close()
+
+
+def current():
+    return _cache
+
+
+def _prewarm(ciphertext):
+    """
+    Decrypts a vaulted value that was loaded into the cache, a value that
+    can't be decrypted is reported when it is used.
+    """
+    if _cache is None or VaultSecretsContext is None:
+        return
+    if hashlib.sha256(to_bytes(ciphertext)).digest() in _cache.entries:
+        return
+    try:
+        context = VaultSecretsContext.current(optional=True)
+        if context is not None and context.secrets:
+            VaultLib(secrets=context.secrets).decrypt_and_get_vault_id(ciphertext)
+    except Exception:
+        pass
+
+
+def prewarm(value):
+    """
+    Decrypts the vaulted values of (nested) variables into the cache.
+    """
+    if isinstance(value, Mapping):
+        for item in value.values():
+            prewarm(item)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            prewarm(item)
+    elif EncryptedString is not None and type(value) is EncryptedString:
+        _prewarm(value._ciphertext)
+
+
+def install(size=DEFAULT_SIZE):
+    """
+    Installs the cache (once) and returns it.
+    """
+    global _cache
+    if _cache is not None:
+        return _cache
+    cache = _cache = SecretCache(size)
+    atexit.register(cache.wipe)
+
+    decrypt = VaultLib.decrypt_and_get_vault_id
+
+    def decrypt_and_get_vault_id(self, vaulttext):
+        if not self.secrets or cache.arena.closed:
+            return decrypt(self, vaulttext)
+        key = hashlib.sha256(to_bytes(vaulttext)).digest()
+        entry = cache.get(key)
+        if entry is not None:
+            cache.count(HITS)
+            b_plaintext, vault_id, vault_secret = entry
+            if AnsibleTagHelper is not None:
+                b_plaintext = AnsibleTagHelper.tag_copy(vaulttext, b_plaintext)
+            return b_plaintext, vault_id, vault_secret
+
+        cache.count(MISSES)
+        b_plaintext, vault_id, vault_secret = decrypt(self, vaulttext)
+        cache.put(key, bytes(b_plaintext), vault_id, vault_secret)
+        return b_plaintext, vault_id, vault_secret
+
+    VaultLib.decrypt_and_get_vault_id = decrypt_and_get_vault_id
+
+    if EncryptedString is not None:
+        init = EncryptedString.__init__
+
+        def __init__(self, *args, **kwargs):
+            init(self, *args, **kwargs)
+            _prewarm(self._ciphertext)
+
+        EncryptedString.__init__ = __init__
+
+    return cache
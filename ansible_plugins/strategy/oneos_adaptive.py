@@ -0,0 +1,211 @@
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+
+DOCUMENTATION = """
+---
+author: Maarten Wallraf
+name: oneos_adaptive
+short_description: Runs the play on a batch of hosts that adapts to the health of the network
+description:
+  - Every host runs the play without waiting for the other hosts, as with the free strategy, but only a
+    batch of hosts runs at the same time. When a host finishes the next host of the inventory starts.
+  - The batch starts small and grows by one host for every host that finishes healthy. It is halved when
+    a host fails or when the mean command latency of the host is more than latency_factor times the
+    lowest latency seen in the play, and no new hosts start for a while when too many of the last hosts
+    failed (see plugin_utils/oneos/adaptive.py).
+  - The command latency is read from the metrics of the oneos cliconf plugins (ansible_oneos_metrics),
+    for hosts without metrics the mean task time is used.
+  - Group limits cap the number of hosts that run at the same time per inventory group, for example
+    per site or per PE, so a rollout does not overload a shared upstream link.
+  - The settings are play or extra vars. With C(serial) the batch adapts within every serial batch.
+options:
+  initial:
+    description: Batch size of the first hosts.
+    default: 1
+    vars:
+    - name: oneos_adaptive_initial
+  min:
+    description: Lowest batch size.
+    default: 1
+    vars:
+    - name: oneos_adaptive_min
+  max:
+    description: Highest batch size, default the number of forks.
+    vars:
+    - name: oneos_adaptive_max
+  increase:
+    description: Hosts added to the batch for every host that finishes healthy.
+    default: 1
+    vars:
+    - name: oneos_adaptive_increase
+  decrease:
+    description: Factor the batch is multiplied with when a host fails or is slow.
+    default: 0.5
+    vars:
+    - name: oneos_adaptive_decrease
+  max_failure_rate:
+    description: Failure rate of the last 20 hosts above which no new hosts are started for I(pause) seconds.
+    default: 0.2
+    vars:
+    - name: oneos_adaptive_max_failure_rate
+  latency_factor:
+    description: A host is slow when its mean command latency is above the baseline times this factor.
+    default: 2.0
+    vars:
+    - name: oneos_adaptive_latency_factor
+  pause:
+    description: Seconds no new hosts are started after too many failures.
+    default: 60
+    vars:
+    - name: oneos_adaptive_pause
+  group_limits:
+    description:
+    - Maximum number of running hosts per inventory group, the keys are group name patterns.
+    - "For example C({'site_*': 2, 'pe_*': 1})."
+    default: {}
+    vars:
+    - name: oneos_adaptive_group_limits
+  metrics_dir:
+    description: Folder of the oneos cliconf metrics.
+    default: /runner/artifacts/metrics
+    vars:
+    - name: ansible_oneos_metrics_dir
+"""
+
+import time
+
+from ansible.plugins.strategy.free import StrategyModule as FreeStrategyModule
+from ansible.template import Templar
+from ansible.utils.display import Display
+
+from oneos.adaptive import AdaptiveBatch, command_latency
+
+display = Display()
+
+
+SETTINGS = (
+    ('initial', int, 1),
+    ('min', int, 1),
+    ('max', int, None),
+    ('increase', float, 1.0),
+    ('decrease', float, 0.5),
+    ('max_failure_rate', float, 0.2),
+    ('latency_factor', float, 2.0),
+    ('pause', int, 60),
+    ('group_limits', dict, {}),
+)
+
+DEFAULT_METRICS_DIR = '/runner/artifacts/metrics'
+
+
+class StrategyModule(FreeStrategyModule):
+
+    def __init__(self, tqm):
+        super(StrategyModule, self).__init__(tqm)
+        self._batch = None
+        self._metrics_dir = DEFAULT_METRICS_DIR
+        # host name: time the host was started
+        self._started = {}
+        # host name: (time the running task was queued, total task time, number of tasks)
+        self._task_times = {}
+
+    def _load_settings(self, iterator):
+        variables = self._variable_manager.get_vars(play=iterator._play)
+        templar = Templar(loader=self._loader, variables=variables)
+        settings = {}
+        for name, kind, default in SETTINGS:
+            value = variables.get('oneos_adaptive_' + name)
+            settings[name] = default if value is None else kind(templar.template(value))
+        if settings['max'] is None:
+            settings['max'] = len(self._workers)
+        for group, limit in settings['group_limits'].items():
+            settings['group_limits'][group] = int(limit)
+        self._metrics_dir = templar.template(variables.get('ansible_oneos_metrics_dir', DEFAULT_METRICS_DIR))
+
+        self._batch = AdaptiveBatch(
+            initial=settings['initial'], minimum=settings['min'], maximum=settings['max'],
+            increase=settings['increase'], decrease=settings['decrease'],
+            max_failure_rate=settings['max_failure_rate'], latency_factor=settings['latency_factor'],
+            pause=settings['pause'], group_limits=settings['group_limits'])
+        display.v("oneos_adaptive: batch %d (max %d), group limits %s"
+                  % (self._batch.batch, self._batch.maximum, settings['group_limits'] or 'none'))
+
+    def _latency(self, host):
+        """
+        The (latency, source) of a host, the mean command latency of the
+        cliconf metrics or the mean task time of the host. The metrics are
+        exported every few seconds so a host that just finished may have no
+        metrics yet, the sources have their own baseline.
+        """
+        address = host.vars.get('ansible_host', host.name)
+        latency = command_latency(self._metrics_dir, str(address), self._started[host.name])
+        if latency is not None:
+            return latency, 'command'
+        _, total, count = self._task_times.get(host.name, (None, 0.0, 0))
+        return (total / count if count else None), 'task'
+
+    def _finished(self, iterator, host):
+        if host.name in self._tqm._unreachable_hosts:
+            return True
+        if self._blocked_hosts.get(host.name, False):
+            return False
+        state, task = iterator.get_next_task_for_host(host, peek=True)
+        return task is None
+
+    def get_hosts_left(self, iterator):
+        """
+        The hosts of the play that were started, the free strategy only runs
+        tasks for these hosts. Hosts that finished are passed to the batch
+        and the next hosts are started.
+        """
+        hosts_left = super(StrategyModule, self).get_hosts_left(iterator)
+        if self._batch is None:
+            self._load_settings(iterator)
+
+        hosts = dict((host.name, host) for host in hosts_left)
+        for name in list(self._batch.running):
+            host = hosts.get(name) or self._inventory.get_host(name)
+            if not self._finished(iterator, host):
+                continue
+            failed = (name in self._tqm._unreachable_hosts or name in self._tqm._failed_hosts or
+                      iterator.is_failed(host))
+            latency, source = (None, 'command') if failed else self._latency(host)
+            message = self._batch.finish(name, failed, latency, source)
+            if message:
+                display.display("oneos_adaptive: %s" % message)
+
+        waiting = [host for host in hosts_left if host.name not in self._started]
+        if waiting and not self._batch.running:
+            # nothing runs during a pause, the free strategy stops when no host has work
+            time.sleep(max(self._batch.paused_until - time.time(), 0))
+
+        for host in waiting:
+            groups = [group.name for group in host.get_groups()]
+            if self._batch.can_start(groups):
+                self._batch.start(host.name, groups)
+                self._started[host.name] = time.time()
+                display.vv("oneos_adaptive: starting %s, %d of %d running"
+                           % (host.name, len(self._batch.running), int(self._batch.batch)))
+
+        return [host for host in hosts_left if host.name in self._started]
+
+    def _queue_task(self, host, task, task_vars, play_context):
+        _, total, count = self._task_times.get(host.name, (None, 0.0, 0))
+        self._task_times[host.name] = (time.time(), total, count)
+        return super(StrategyModule, self)._queue_task(host, task, task_vars, play_context)
+
+    def _process_pending_results(self, iterator, *args, **kwargs):
+        results = super(StrategyModule, self)._process_pending_results(iterator, *args, **kwargs)
+        now = time.time()
+        for result in results:
+            host = getattr(result, 'host', None) or result._host
+            queued, total, count = self._task_times.get(host.name, (None, 0.0, 0))
+            if queued is not None:
+                self._task_times[host.name] = (None, total + now - queued, count + 1)
+        return results
@@ -28,35 +28,43 @@ from ansible.module_utils._text import to_text, to_bytes
 from ansible.plugins.terminal import TerminalBase
 from ansible.utils.display import Display
 
+from oneos.instrument import timed
+from oneos.matcher import CombinedPattern, TailPattern
+
 display = Display()
 
 
 class TerminalModule(TerminalBase):
 
+    # the prompt is only searched at the end of the response and the error
+    # regexes are only searched in the new part of the response,
+    # see oneos/matcher.py
     terminal_stdout_re = [
-        re.compile(br"[\r\n]?[\w\+\-\.:\/\[\]]+(?:\([^\)]+\)){0,3}(?:[>#]) ?$")
+        TailPattern(re.compile(br"[\r\n]?[\w\+\-\.:\/\[\]]+(?:\([^\)]+\)){0,3}(?:[>#]) ?$"))
     ]
 
     terminal_stderr_re = [
-        re.compile(br"Error: Invalid command"),
-        re.compile(br" +^$"),
-        #re.compile(br".*: No such file or directory")
-        #re.compile(br"% ?Error"),
-        # re.compile(br"^% \w+", re.M),
-        #re.compile(br"% ?Bad secret"),
-        #re.compile(br"[\r\n%] Bad passwords"),
-        #re.compile(br"invalid input", re.I),
-        #re.compile(br"(?:incomplete|ambiguous) command", re.I),
-        #re.compile(br"connection timed out", re.I),
-        #re.compile(br"[^\r\n]+ not found"),
-        #re.compile(br"'[^']' +returned error code: ?\d+"),
-        #re.compile(br"Bad mask", re.I),
-        #re.compile(br"% ?(\S+) ?overlaps with ?(\S+)", re.I),
-        #re.compile(br"[%\S] ?Error: ?[\s]+", re.I),
-        #re.compile(br"[%\S] ?Informational: ?[\s]+", re.I),
-        #re.compile(br"Command authorization failed"),
+        CombinedPattern([
+            re.compile(br"Error: Invalid command"),
+            #re.compile(br".*: No such file or directory")
+            #re.compile(br"% ?Error"),
+            # re.compile(br"^% \w+", re.M),
+            #re.compile(br"% ?Bad secret"),
+            #re.compile(br"[\r\n%] Bad passwords"),
+            #re.compile(br"invalid input", re.I),
+            #re.compile(br"(?:incomplete|ambiguous) command", re.I),
+            #re.compile(br"connection timed out", re.I),
+            #re.compile(br"[^\r\n]+ not found"),
+            #re.compile(br"'[^']' +returned error code: ?\d+"),
+            #re.compile(br"Bad mask", re.I),
+            #re.compile(br"% ?(\S+) ?overlaps with ?(\S+)", re.I),
+            #re.compile(br"[%\S] ?Error: ?[\s]+", re.I),
+            #re.compile(br"[%\S] ?Informational: ?[\s]+", re.I),
+            #re.compile(br"Command authorization failed"),
+        ])
     ]
 
+    @timed('terminal', 'on_open_shell')
     def on_open_shell(self):
         try:
             self._exec_cli_command(b"term len 0")
@@ -70,6 +78,7 @@ class TerminalModule(TerminalBase):
                 "WARNING: Unable to set terminal width, command responses may be truncated"
             )
 
+    @timed('terminal', 'on_become')
     def on_become(self, passwd=None):
         if self._get_prompt().endswith(b"#"):
             return
@@ -28,22 +28,30 @@ from ansible.module_utils._text import to_text, to_bytes
 from ansible.plugins.terminal import TerminalBase
 from ansible.utils.display import Display
 
+from oneos.instrument import timed
+from oneos.matcher import CombinedPattern, TailPattern
+
 display = Display()
 
 
 class TerminalModule(TerminalBase):
 
+    # the prompt is only searched at the end of the response and the error
+    # regexes are only searched in the new part of the response,
+    # see oneos/matcher.py
     terminal_stdout_re = [
-        re.compile(br"[\r\n]?[\w\+\-\.:\/\[\]]+(?:\([^\)]+\)){0,3}(?:[>#]) ?$")
+        TailPattern(re.compile(br"[\r\n]?[\w\+\-\.:\/\[\]]+(?:\([^\)]+\)){0,3}(?:[>#]) ?$"))
     ]
 
     terminal_stderr_re = [
-        re.compile(br"Error: Invalid command"),
-        re.compile(br" +^$"),
-        re.compile(br"% No entries found."),
-        re.compile(br"Syntax error"),
+        CombinedPattern([
+            re.compile(br"Error: Invalid command"),
+            re.compile(br"% No entries found."),
+            re.compile(br"Syntax error"),
+        ])
     ]
 
+    @timed('terminal', 'on_open_shell')
     def on_open_shell(self):
         try:
             self._exec_cli_command(b"term len 0")
@@ -58,6 +66,7 @@ class TerminalModule(TerminalBase):
             )
 
 
+    @timed('terminal', 'on_become')
     def on_become(self, passwd=None):
         if self._get_prompt().endswith(b"#"):
             return
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Compares the indexed diff engine (oneos.diff) with NetworkConfig.difference
+as used by the oneos5 cliconf get_diff.
+
+Every combination of match/replace is run on a generated running-config and
+the output of both engines must be identical. Requires ansible and the
+ansible.netcommon collection.
+
+    python benchmarks/bench_diff.py --lines 50000 --candidate-lines 200 500
+    python benchmarks/bench_diff.py --check 500      # random equivalence tests only
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ansible_plugins', 'plugin_utils'))
+
+from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.config import NetworkConfig
+
+from oneos.diff import config_diff
+
+
+MATCHES = ('line', 'strict', 'exact', 'none')
+REPLACES = ('line', 'block', 'config')
+
+
+def networkconfig_diff(candidate, running, match='line', path=None, replace='line', ignore_lines=None):
+    """
+    The NetworkConfig based implementation of Cliconf.get_diff (oneos5).
+    """
+    candidate_obj = NetworkConfig(indent=1)
+    candidate_obj.load(candidate)
+
+    if running and match != 'none':
+        running_obj = NetworkConfig(indent=1, contents=running, ignore_lines=ignore_lines)
+        configdiffobjs = candidate_obj.difference(running_obj, path=path, match=match, replace=replace)
+    else:
+        configdiffobjs = candidate_obj.items
+
+    if configdiffobjs and replace == 'config':
+        return candidate
+    elif configdiffobjs:
+        configlines = list()
+        for i, o in enumerate(configdiffobjs):
+            configlines.append(o.text)
+            if i + 1 < len(configdiffobjs):
+                levels = len(o.parents) - len(configdiffobjs[i + 1].parents)
+            else:
+                levels = len(o.parents)
+            if o.text == 'end':
+                levels -= 1
+            if levels > 0:
+                for i in range(levels):
+                    configlines.append("end")
+        return "\n".join(configlines)
+    return ''
+
+
+def generate_config(lines, seed=1):
+    """
+    Returns a OneOS style running-config of about the given number of lines
+    with vrf, interface and nested router bgp sections.
+    """
+    rnd = random.Random(seed)
+    config = ["hostname bench-cpe", "!"]
+    i = 0
+    while len(config) < lines:
+        config.extend([
+            "ip vrf VRF%d" % i,
+            " rd 65000:%d" % i,
+            " route-target both 65000:%d" % i,
+            "exit",
+            "!",
+            "interface gigabitethernet 0/%d.%d" % (i // 4000, i % 4000 + 1),
+            " description CUSTOMER-%05d" % i,
+            " encapsulation dot1q %d" % (i % 4000 + 1),
+            " ip vrf forwarding VRF%d" % i,
+            " ip address 10.%d.%d.1 255.255.255.252" % (i // 256 % 256, i % 256),
+            " no shutdown" if rnd.random() > 0.2 else " shutdown",
+            "exit",
+            "!",
+        ])
+        if i % 50 == 0:
+            config.extend([
+                "router bgp 65000",
+                " address-family ipv4 vrf VRF%d" % i,
+                "  neighbor 10.%d.%d.2 remote-as %d" % (i // 256 % 256, i % 256, 64512 + i),
+                "  neighbor 10.%d.%d.2 activate" % (i // 256 % 256, i % 256),
+                " exit",
+                "exit",
+                "!",
+            ])
+        i += 1
+    config.append("end")
+    return config
+
+
+def generate_candidate(running, lines, seed=2):
+    """
+    Returns a candidate with the given number of lines, a mix of existing
+    sections, changed lines and new sections.
+    """
+    rnd = random.Random(seed)
+    starts = [i for i, line in enumerate(running) if line and not line[0].isspace() and line not in ('!', 'exit', 'end')]
+    candidate = []
+    new = 0
+    while len(candidate) < lines:
+        choice = rnd.random()
+        if choice < 0.2:
+            candidate.extend(["interface loopback %d" % new, " description NEW-%d" % new, " ip address 192.0.2.%d 255.255.255.255" % (new % 256), "exit"])
+            new += 1
+            continue
+
+        start = rnd.choice(starts)
+        end = start + 1
+        while end < len(running) and (running[end].startswith(' ') or running[end] == 'exit'):
+            end += 1
+        block = running[start:end]
+        if choice < 0.6 and len(block) > 2:
+            index = rnd.randrange(1, len(block) - 1)
+            block[index] = block[index].rstrip() + " changed"
+        candidate.extend(block)
+    return candidate
+
+
+def random_config(rnd, lines):
+    """
+    Small random configs with odd indentation, duplicates, comments and
+    braces to check that both engines give the same result.
+    """
+    words = ['interface', 'ip', 'vrf', 'router', 'bgp', 'exit', 'end', 'description', 'a', 'b', '{', '}', ';']
+    config = []
+    for i in range(lines):
+        indent = rnd.choice([0, 0, 1, 1, 2, 3, 4])
+        if rnd.random() < 0.05:
+            config.append(rnd.choice(['!', '', '  ', '# comment', 'Building configuration', 'echo x']))
+            continue
+        config.append(" " * indent + " ".join(rnd.choice(words) for w in range(rnd.randint(1, 3))))
+    return "\n".join(config)
+
+
+def check(iterations, seed=0):
+    rnd = random.Random(seed)
+    failures = 0
+    for n in range(iterations):
+        running = random_config(rnd, rnd.randint(0, 40))
+        candidate = random_config(rnd, rnd.randint(1, 20))
+        lines = [line for line in running.split("\n") if line.strip()]
+        path = None
+        if lines and rnd.random() < 0.3:
+            path = [rnd.choice(lines).strip()]
+        for match in MATCHES:
+            for replace in REPLACES:
+                expected = networkconfig_diff(candidate, running, match=match, path=path, replace=replace)
+                result = config_diff(candidate, running, match=match, path=path, replace=replace)
+                if expected != result:
+                    failures += 1
+                    print("MISMATCH match=%s replace=%s path=%s\n--- running\n%s\n--- candidate\n%s\n--- expected\n%s\n--- result\n%s"
+                          % (match, replace, path, running, candidate, expected, result))
+    print("random configs: %d iterations, %d mismatches" % (iterations, failures))
+    return failures
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=50000, help='lines in the running-config')
+    parser.add_argument('--candidate-lines', type=int, nargs='+', default=[100, 500],
+                        help='lines in the candidate, NetworkConfig is quadratic so keep this small')
+    parser.add_argument('--check', type=int, default=200, help='number of random equivalence tests')
+    args = parser.parse_args()
+
+    failures = check(args.check)
+
+    running = generate_config(args.lines)
+    running_text = "\n".join(running)
+    print("running-config: %d lines" % len(running))
+    print("%-10s %-8s %-8s %12s %12s %8s  %s" % ('candidate', 'match', 'replace', 'netconfig', 'indexed', 'speedup', 'identical'))
+
+    for size in args.candidate_lines:
+        candidate = "\n".join(generate_candidate(running, size))
+        for match in ('line', 'strict', 'exact'):
+            for replace in ('line', 'block'):
+                expected, t_expected = timed(networkconfig_diff, candidate, running_text, match=match, replace=replace)
+                result, t_result = timed(config_diff, candidate, running_text, match=match, replace=replace)
+                identical = expected == result
+                failures += not identical
+                print("%-10d %-8s %-8s %11.3fs %11.3fs %7.1fx  %s"
+                      % (size, match, replace, t_expected, t_result, t_expected / t_result, identical))
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+End-to-end benchmark of the oneos5/oneos6 cliconf and terminal plugins
+against local mock devices (benchmarks/oneos_mock.py).
+
+A number of mock devices is started on localhost, every device is handled by
+a separate worker process (like an ansible fork) that opens a network_cli
+connection and measures:
+
+- connect:          SSH setup and terminal setup (on_open_shell)
+- get_capabilities: first call, includes get_device_info by default
+- get_config:       running-config throughput in bytes/s
+- edit_config:      configuration lines/s (oneos5 only, see --config-mode)
+
+With --type-ahead the mock devices echo the input as soon as it is received,
+the batched commands of get_capabilities and edit_config must still be split
+per command (get_capabilities must not fall back to serial commands after the
+batch timeout).
+
+After edit_config the running-config is checked for the candidate lines and
+in file mode the uploaded candidate must be removed from the device, the
+benchmark exits with 1 when a device fails these checks.
+
+Requires ansible, the ansible.netcommon collection and paramiko.
+
+    python benchmarks/bench_e2e.py --os oneos5 --devices 10 --latency 0.05 --jitter 0.02
+    python benchmarks/bench_e2e.py --os oneos5 --config-mode bulk --edit-lines 2000 --json e2e.json
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ansible_plugins')
+
+os.environ.setdefault('ANSIBLE_CLICONF_PLUGINS', os.path.join(BASE, 'cliconf'))
+os.environ.setdefault('ANSIBLE_TERMINAL_PLUGINS', os.path.join(BASE, 'terminal'))
+sys.path.insert(0, os.path.join(BASE, 'plugin_utils'))
+
+from oneos_mock import USERNAME, PASSWORD, start_servers
+
+
+# persistent_command_timeout of the connections, the batch timeout
+BATCH_TIMEOUT = 20
+
+# config_file_dir of the file mode of edit_config
+CANDIDATE_FILE = '/BSA/config/ansible_candidate.cfg'
+
+METRICS = (
+    ('connect', 's'),
+    ('get_capabilities', 's'),
+    ('get_config', 'bytes/s'),
+    ('edit_config', 'lines/s'),
+)
+
+
+def connect(network_os, host, port, options):
+    from ansible.playbook.play_context import PlayContext
+    from ansible.plugins.loader import connection_loader, init_plugin_loader
+
+    init_plugin_loader([])
+
+    play_context = PlayContext()
+    play_context.network_os = network_os
+    play_context.remote_addr = host
+    play_context.port = port
+    play_context.remote_user = USERNAME
+    play_context.password = PASSWORD
+
+    connection = connection_loader.get('ansible.netcommon.network_cli', play_context, '/dev/null')
+    direct = {
+        'host': host,
+        'remote_addr': host,
+        'port': port,
+        'remote_user': USERNAME,
+        'password': PASSWORD,
+        'host_key_checking': False,
+        'host_key_auto_add': True,
+        'record_host_keys': False,
+        'look_for_keys': False,
+        'ssh_type': 'paramiko',
+        'persistent_command_timeout': BATCH_TIMEOUT,
+    }
+    direct.update(options)
+    connection.set_options(direct=direct)
+    connection._connect()
+    return connection
+
+
+def candidate(lines):
+    config = []
+    i = 0
+    while len(config) < lines:
+        config.extend([
+            "interface loopback %d" % (1000 + i),
+            " description BENCH-%d" % i,
+            " ip address 198.51.%d.%d 255.255.255.255" % (i // 256 % 256, i % 256),
+            "exit",
+        ])
+        i += 1
+    return config[:lines]
+
+
+def run_device(args):
+    """
+    Runs the benchmark for a single device in a worker process, returns
+    the measurements.
+    """
+    network_os, host, port, edit_lines, options = args
+    result = {'host': '%s:%d' % (host, port)}
+
+    start = time.time()
+    connection = connect(network_os, host, port, options)
+    result['connect'] = time.time() - start
+
+    try:
+        start = time.time()
+        capabilities = json.loads(connection.get_capabilities())
+        result['get_capabilities'] = time.time() - start
+        if options.get('capabilities_device_info', True):
+            # the batch output was split per command without a fallback
+            device_info = capabilities.get('device_info', {})
+            result['device_info_ok'] = bool(device_info.get('network_os_hostname')) \
+                and result['get_capabilities'] < BATCH_TIMEOUT
+
+        start = time.time()
+        config = connection.get_config()
+        seconds = time.time() - start
+        result['config_bytes'] = len(config)
+        result['get_config'] = len(config) / seconds
+
+        if edit_lines and network_os == 'oneos5':
+            lines = candidate(edit_lines)
+            start = time.time()
+            connection.edit_config(candidate=lines)
+            result['edit_config'] = edit_lines / (time.time() - start)
+            running = set(line.strip() for line in connection.get_config().splitlines())
+            result['edit_applied'] = all(line.strip() in running for line in lines if line != 'exit')
+    finally:
+        connection.close()
+
+    return result
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = int(round((len(values) - 1) * pct / 100.0))
+    return values[index]
+
+
+def summary(results):
+    stats = {}
+    for metric, unit in METRICS:
+        values = [r[metric] for r in results if metric in r]
+        if values:
+            stats[metric] = {
+                'unit': unit,
+                'min': min(values),
+                'median': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'max': max(values),
+            }
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--os', default='oneos5', choices=['oneos5', 'oneos6'], help='network_os of the devices')
+    parser.add_argument('--devices', type=int, default=5, help='number of mock devices')
+    parser.add_argument('--forks', type=int, help='number of worker processes, default one per device')
+    parser.add_argument('--latency', type=float, default=0.0, help='per-command latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='maximum random extra latency in seconds')
+    parser.add_argument('--config-sections', type=int, default=500,
+                        help='number of vrf/interface stanzas in the running-config of the devices')
+    parser.add_argument('--edit-lines', type=int, default=200, help='lines in the edit_config candidate, 0 to skip')
+    parser.add_argument('--config-mode', choices=['line', 'bulk', 'file'], help='ansible_oneos_config_mode')
+    parser.add_argument('--batch-size', type=int, help='ansible_oneos_batch_size')
+    parser.add_argument('--type-ahead', action='store_true',
+                        help='the mock devices echo the input as soon as it is received')
+    parser.add_argument('--no-device-info', action='store_true',
+                        help='do not include the device info in get_capabilities')
+    parser.add_argument('--json', help='write the results and the summary to this file')
+    args = parser.parse_args()
+
+    # the paramiko transport of the mock logs every connection that is reset by the client
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    servers = start_servers(args.devices, {
+        'network_os': args.os,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'config_sections': args.config_sections,
+        'type_ahead': args.type_ahead,
+    })
+
+    options = {
+        'facts_cache_bypass': True,
+        'capabilities_device_info': not args.no_device_info,
+    }
+    if args.config_mode:
+        options['config_mode'] = args.config_mode
+    if args.batch_size:
+        options['batch_size'] = args.batch_size
+
+    jobs = [(args.os, s.host, s.port, args.edit_lines, options) for s in servers]
+    # spawn, the mock servers run in threads of this process
+    pool = multiprocessing.get_context('spawn').Pool(args.forks or args.devices)
+    try:
+        start = time.time()
+        results = pool.map(run_device, jobs)
+        elapsed = time.time() - start
+        leftovers = [s for s in servers if os.path.exists(s.device.local_path(CANDIDATE_FILE))]
+    finally:
+        pool.close()
+        pool.join()
+        for server in servers:
+            server.stop()
+
+    stats = summary(results)
+    print("%d %s devices, latency %.3fs, jitter %.3fs, %d forks, total %.2fs"
+          % (args.devices, args.os, args.latency, args.jitter, args.forks or args.devices, elapsed))
+    print("%-18s %-8s %12s %12s %12s %12s" % ('metric', 'unit', 'min', 'median', 'p95', 'max'))
+    for metric, unit in METRICS:
+        if metric in stats:
+            row = stats[metric]
+            print("%-18s %-8s %12.3f %12.3f %12.3f %12.3f"
+                  % (metric, unit, row['min'], row['median'], row['p95'], row['max']))
+
+    failed = 0
+    checked = [r for r in results if 'device_info_ok' in r]
+    if checked:
+        ok = sum(1 for r in checked if r['device_info_ok'])
+        print("get_capabilities: device info of %d of %d devices from the batch" % (ok, len(checked)))
+        failed += len(checked) - ok
+    edited = [r for r in results if 'edit_applied' in r]
+    if edited:
+        applied = sum(1 for r in edited if r['edit_applied'])
+        print("edit_config: candidate applied on %d of %d devices" % (applied, len(edited)))
+        failed += len(edited) - applied
+    if leftovers:
+        print("edit_config: %s left on %d devices" % (CANDIDATE_FILE, len(leftovers)))
+        failed += len(leftovers)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'elapsed': elapsed, 'summary': stats, 'devices': results}, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
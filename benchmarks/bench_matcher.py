@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Compares the prompt and error matchers of the OneOS terminal plugins
+(oneos.matcher) with the plain regex lists they replace.
+
+The receive loops of network_cli are replayed on large outputs:
+
+- libssh:   every chunk is appended to the response and the complete response
+            is checked for errors and the prompt (receive_libssh)
+- paramiko: only the last 256 bytes plus the new chunk are checked
+            (receive_paramiko)
+
+For every chunk both implementations must find the same error and prompt.
+The outputs are generated (a running-config and a "show log") unless
+recorded outputs are passed with --file. Requires ansible.
+
+    python benchmarks/bench_matcher.py --size 2
+    python benchmarks/bench_matcher.py --file show_log.txt running.cfg --os oneos6
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import os
+import random
+import sys
+import time
+
+BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ansible_plugins')
+sys.path.insert(0, os.path.join(BASE, 'plugin_utils'))
+
+from importlib.machinery import SourceFileLoader
+
+from bench_diff import generate_config
+
+
+PROMPT = b"bench-cpe#"
+
+
+def load_terminal(network_os):
+    path = os.path.join(BASE, 'terminal', '%s.py' % network_os)
+    return SourceFileLoader('terminal_%s' % network_os, path).load_module().TerminalModule
+
+
+def plain_regexes(terminal):
+    """
+    Returns the stdout and stderr regex lists as they were before the
+    matchers were added.
+    """
+    stdout_re = [getattr(r, 'regex', r) for r in terminal.terminal_stdout_re]
+    stderr_re = []
+    for regex in terminal.terminal_stderr_re:
+        stderr_re.extend(getattr(regex, 'regexes', [regex]))
+    return stdout_re, stderr_re
+
+
+def find_error(stderr_re, response):
+    # network_cli _find_error
+    for regex in stderr_re:
+        if regex.search(response):
+            return True
+    return False
+
+
+def find_prompt(stdout_re, response):
+    # network_cli _find_prompt
+    for regex in stdout_re:
+        match = regex.search(response)
+        if match:
+            return match.group()
+    return None
+
+
+def receive_libssh(output, chunk_size, stdout_re, stderr_re):
+    results = []
+    resp = b''
+    for offset in range(0, len(output), chunk_size):
+        resp += output[offset:offset + chunk_size]
+        results.append((find_error(stderr_re, resp), find_prompt(stdout_re, resp)))
+    return results
+
+
+def receive_paramiko(output, chunk_size, stdout_re, stderr_re):
+    results = []
+    recv = b''
+    for offset in range(0, len(output), chunk_size):
+        data = output[offset:offset + chunk_size]
+        window = (recv[-256:] + data).strip()
+        recv += data
+        results.append((find_error(stderr_re, window), find_prompt(stdout_re, window)))
+    return results
+
+
+def generate_log(size, seed=1):
+    rnd = random.Random(seed)
+    events = [
+        "LINK-3-UPDOWN Interface gigabitethernet 0/%d, changed state to %s",
+        "BGP-5-ADJCHANGE neighbor 10.0.%d.2 %s",
+        "SYS-6-LOGGINGHOST_STARTSTOP Logging to host 192.0.2.%d %s",
+    ]
+    lines = []
+    total = 0
+    while total < size:
+        line = "Oct 17 %02d:%02d:%02d %s" % (
+            rnd.randrange(24), rnd.randrange(60), rnd.randrange(60),
+            rnd.choice(events) % (rnd.randrange(255), rnd.choice(['up', 'down']))
+        )
+        lines.append(line)
+        total += len(line) + 2
+    return lines
+
+
+def build_output(command, lines, error=None):
+    """
+    Returns the output as it is received from the shell: the echo of the
+    command, the output and the prompt.
+    """
+    lines = list(lines)
+    if error:
+        lines.insert(len(lines) // 2, error)
+    body = "\r\n".join(lines).encode('utf-8')
+    return command + b"\r\n" + body + b"\r\n" + PROMPT
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--os', default='oneos6', choices=['oneos5', 'oneos6'], help='terminal plugin')
+    parser.add_argument('--size', type=float, default=1,
+                        help='size of the generated outputs in MB, the plain regexes are quadratic so keep this small')
+    parser.add_argument('--file', nargs='+', help='recorded outputs to use instead of the generated outputs')
+    parser.add_argument('--chunk-size', type=int, nargs='+', default=[16384, 65536],
+                        help='bytes per read in the libssh loop, the paramiko loop always reads 256 bytes')
+    args = parser.parse_args()
+
+    terminal = load_terminal(args.os)
+    stdout_re, stderr_re = plain_regexes(terminal)
+    size = int(args.size * 1024 * 1024)
+
+    outputs = []
+    if args.file:
+        for path in args.file:
+            with open(path, 'rb') as f:
+                data = f.read().rstrip()
+            if not find_prompt(stdout_re, data[-256:]):
+                data += b"\r\n" + PROMPT
+            outputs.append((os.path.basename(path), data))
+    else:
+        config = generate_config(size // 32)
+        log = generate_log(size)
+        outputs = [
+            ('running-config', build_output(b"show running-config", config)),
+            ('show log', build_output(b"show log", log)),
+            ('show log+error', build_output(b"show log", log, error="Syntax error: Illegal parameter")),
+        ]
+
+    loops = [('libssh', receive_libssh, chunk) for chunk in args.chunk_size]
+    loops.append(('paramiko', receive_paramiko, 256))
+
+    print("%-16s %8s %-9s %7s %10s %10s %8s  %s" % ('output', 'MB', 'loop', 'chunk', 'regexes', 'matcher', 'speedup', 'identical'))
+    failures = 0
+    for name, output in outputs:
+        for loop, receive, chunk_size in loops:
+            expected, t_expected = timed(receive, output, chunk_size, stdout_re, stderr_re)
+            for regex in terminal.terminal_stderr_re:
+                getattr(regex, 'reset', lambda: None)()
+            result, t_result = timed(receive, output, chunk_size, terminal.terminal_stdout_re, terminal.terminal_stderr_re)
+            identical = expected == result
+            failures += not identical
+            print("%-16s %8.1f %-9s %7d %9.3fs %9.3fs %7.1fx  %s"
+                  % (name, len(output) / 1048576.0, loop, chunk_size, t_expected, t_result,
+                     t_expected / t_result, identical))
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+CPU and memory benchmark of the parsing that is done on the controller:
+
+- device_info: the parsers of get_device_info (oneos.parsers) for oneos5
+               and oneos6, on the recorded outputs in benchmarks/corpus
+- diff:        parsing a config and the "end" block reconstruction of
+               get_diff (oneos.diff)
+- terminal:    the prompt and error regexes of the terminal plugins
+
+Every case runs on the recorded outputs (realistic) and on generated
+outputs (extreme: a /BSA/binaries listing with 10k files, 100k-line
+configs). For every case the ops/sec and the peak memory (tracemalloc) are
+reported and compared with a baseline file. Requires ansible.
+
+    python benchmarks/bench_parsers.py
+    python benchmarks/bench_parsers.py -k oneos6 --min-time 2
+    python benchmarks/bench_parsers.py --save benchmarks/baseline_parsers.json
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'ansible_plugins', 'plugin_utils'))
+
+from oneos import diff, parsers
+
+from bench_diff import generate_config
+from bench_matcher import PROMPT, build_output, load_terminal, plain_regexes
+from oneos_mock import CORPUS_DIR, corpus_filename
+
+
+BASELINE = os.path.join(BENCH_DIR, 'baseline_parsers.json')
+
+CALIBRATION_RE = re.compile(r"line (\d+) value (\d+)")
+
+DEVICE_INFO_COMMANDS = {
+    'oneos5': [
+        'show system status',
+        'show product-info-area',
+        'ls /BSA/binaries',
+        'cat /BSA/bsaBoot.inf',
+        'show device status flash',
+    ],
+    'oneos6': [
+        'show system status',
+        'show product-info-area',
+        'show memory',
+        'ls -l /BSA/binaries',
+        'show software-image',
+        'cat /BSA/bsaBoot.inf',
+    ],
+}
+
+
+def corpus(network_os, command):
+    with open(os.path.join(CORPUS_DIR, network_os, corpus_filename(command))) as f:
+        return f.read()
+
+
+def binaries_listing(network_os, files):
+    """
+    Returns a /BSA/binaries listing with the given number of files in the
+    format of the recorded output.
+    """
+    if network_os == 'oneos5':
+        lines = ["Listing the directory /BSA/binaries", ".%39d" % 0, "..%38d" % 0]
+        lines.extend("%-32s %9d" % ("OneOs-%05d" % i, 16302911 + i) for i in range(files))
+    else:
+        lines = ["-rw-rw-rw-    1 %d 2019-06-26 13:09 OneOS-pCPE-PPC_pi2-6.2.%d.ZZZ" % (28890616 + i, i)
+                 for i in range(files)]
+    return "\n".join(lines)
+
+
+def device_info(network_os, outputs):
+    result = {}
+    for command, text in outputs:
+        result.update(parsers.parse(network_os, command, text))
+    return result
+
+
+def cases(files, config_lines):
+    """
+    Returns the list of (name, function, args).
+    """
+    result = []
+    for network_os, commands in sorted(DEVICE_INFO_COMMANDS.items()):
+        outputs = [(command, corpus(network_os, command)) for command in commands]
+        result.append(("device_info %s" % network_os, device_info, (network_os, outputs)))
+        for command, text in outputs:
+            result.append(("%s %s" % (network_os, command), parsers.parse, (network_os, command, text)))
+
+        command = commands[3] if network_os == 'oneos6' else commands[2]
+        result.append(("%s %s (%dk files)" % (network_os, command, files // 1000), parsers.parse,
+                       (network_os, command, binaries_listing(network_os, files))))
+
+    config = "\n".join(generate_config(config_lines))
+    items = diff.parse(config)
+    size = "(%dk lines)" % (config_lines // 1000)
+    result.extend([
+        ("oneos5 show running-config |hostname %s" % size, parsers.parse,
+         ('oneos5', 'show running-config |hostname', config)),
+        ("diff parse %s" % size, diff.parse, (config,)),
+        ("diff dumps %s" % size, diff.dumps, (items,)),
+        ("diff config_diff match=none %s" % size, diff.config_diff, (config, None, 'none')),
+    ])
+
+    terminal = load_terminal('oneos6')
+    stdout_re, stderr_re = plain_regexes(terminal)
+    prompt = terminal.terminal_stdout_re[0]
+    errors = terminal.terminal_stderr_re[0]
+    output = build_output(b"show running-config", config.split("\n"))
+
+    def plain_search(regexes, data):
+        return [regex.search(data) for regex in regexes]
+
+    def combined_search(regex, data):
+        regex.reset()
+        return regex.search(data)
+
+    result.extend([
+        ("terminal prompt regex %s" % size, plain_search, (stdout_re, output)),
+        ("terminal prompt TailPattern %s" % size, prompt.search, (output,)),
+        ("terminal stderr regexes %s" % size, plain_search, (stderr_re, output)),
+        ("terminal stderr CombinedPattern %s" % size, combined_search, (errors, output)),
+        ("terminal prompt regex (prompt only)", plain_search, (stdout_re, PROMPT)),
+    ])
+    return result
+
+
+def ops_per_sec(func, args, min_time, repeat=3, min_runs=2):
+    """
+    Returns the best ops/sec of repeat rounds, every round runs at least
+    min_time seconds.
+    """
+    best = 0
+    for i in range(repeat):
+        runs = 0
+        start = time.perf_counter()
+        elapsed = 0
+        while runs < min_runs or elapsed < min_time:
+            func(*args)
+            runs += 1
+            elapsed = time.perf_counter() - start
+        best = max(best, runs / elapsed)
+    return best
+
+
+def calibration():
+    """
+    A fixed mix of string, regex and dict work, the results are compared
+    with the baseline relative to this case so the baseline can be used on
+    a faster or slower machine.
+    """
+    text = "\n".join("line %d value %d" % (i, i * 7) for i in range(200))
+    result = {}
+    for line in text.split("\n"):
+        match = CALIBRATION_RE.match(line)
+        result[match.group(1)] = int(match.group(2))
+    return result
+
+
+def peak_memory(func, args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='keyword', help='only run the cases that contain this text')
+    parser.add_argument('--files', type=int, default=10000, help='number of files in the generated listings')
+    parser.add_argument('--config-lines', type=int, default=100000, help='lines in the generated config')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum run time per round in seconds')
+    parser.add_argument('--repeat', type=int, default=3, help='rounds per case, the best round is reported')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file to compare with')
+    parser.add_argument('--save', help='write the results to this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='fail when ops/sec is lower or the peak memory higher than the baseline by this fraction')
+    args = parser.parse_args()
+
+    baseline = {}
+    baseline_calibration = 1
+    if args.baseline and os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            data = json.load(f)
+        baseline = data['results']
+        baseline_calibration = data['calibration']
+
+    calibration_ops = ops_per_sec(calibration, (), args.min_time, args.repeat)
+    # > 1 when this machine is faster than the one of the baseline
+    speed = calibration_ops / baseline_calibration if baseline else 1
+
+    results = {}
+    regressions = 0
+    if baseline:
+        print("machine speed compared with the baseline: %.2fx, ops/sec is compared relative to it" % speed)
+    print("%-52s %12s %10s %8s %8s" % ('case', 'ops/sec', 'peak KB', 'ops', 'memory'))
+    for name, func, func_args in cases(args.files, args.config_lines):
+        if args.keyword and args.keyword not in name:
+            continue
+
+        ops = ops_per_sec(func, func_args, args.min_time, args.repeat)
+        peak = peak_memory(func, func_args)
+        results[name] = {'ops_per_sec': ops, 'peak_bytes': peak}
+
+        ops_ratio = memory_ratio = ''
+        if name in baseline:
+            ops_ratio = ops / baseline[name]['ops_per_sec'] / speed
+            memory_ratio = float(peak) / max(baseline[name]['peak_bytes'], 1)
+            if ops_ratio < 1 - args.tolerance or memory_ratio > 1 + args.tolerance:
+                regressions += 1
+            ops_ratio = "%.2fx" % ops_ratio
+            memory_ratio = "%.2fx" % memory_ratio
+        print("%-52s %12.1f %10.1f %8s %8s" % (name, ops, peak / 1024.0, ops_ratio, memory_ratio))
+
+    if baseline:
+        print("compared with %s: %d regressions (tolerance %d%%)" % (args.baseline, regressions, args.tolerance * 100))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': sys.version.split()[0],
+                'calibration': calibration_ops,
+                'files': args.files,
+                'config_lines': args.config_lines,
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Cold start benchmark of the runner image (make bench-startup).
+
+Every run starts a new container that runs a playbook with a single task on
+localhost, the oneos_timeline callback records when the container, the
+ansible-playbook process, the playbook and the first task were started.
+Reported per run and as the median:
+
+- container:     docker run -> pid 1 of the container
+- interpreter:   pid 1 -> ansible-playbook process
+- imports:       ansible-playbook process -> playbook start (imports, plugin
+                 loading, inventory)
+- first task:    playbook start -> first task
+- to first task: docker run -> first task
+
+The first run is started with PYTHONPROFILEIMPORTTIME, its import profile is
+written to --importtime and the slowest imports are printed. Only the
+standard library is used, this script runs on the docker host.
+
+    python3 benchmarks/bench_startup.py --image ansible-runner-network:1.0 --runs 5
+    python3 benchmarks/bench_startup.py --image ansible-runner-network:slim --json startup.json
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+PLAYBOOK = """
+- hosts: localhost
+  gather_facts: no
+  tasks:
+    - name: first task
+      ansible.builtin.debug:
+        msg: started
+"""
+
+SEPARATOR = '==IMPORTTIME=='
+
+SCRIPT = (
+    'printf "%%s" "$BENCH_PLAYBOOK" > /tmp/startup.yml; '
+    'ansible-playbook -i localhost, -c local /tmp/startup.yml >/dev/null 2>/tmp/importtime.log; '
+    'cat /tmp/timeline.json; echo; echo %s; cat /tmp/importtime.log'
+) % SEPARATOR
+
+PHASES = (
+    ('container', 'job_start', 'container_start'),
+    ('interpreter', 'container_start', 'playbook_process_start'),
+    ('imports', 'playbook_process_start', 'playbook_start'),
+    ('first task', 'playbook_start', 'first_task_start'),
+    ('to first task', 'job_start', 'first_task_start'),
+)
+
+
+def run_once(args, playbook, importtime=False):
+    """
+    Returns the timeline marks and the import time log of a single run.
+    """
+    start = time.time()
+    command = [
+        args.engine, 'run', '--rm',
+        '-e', 'RUNNER_JOB_START=%f' % start,
+        '-e', 'ANSIBLE_CALLBACKS_ENABLED=oneos_timeline',
+        '-e', 'ONEOS_TIMELINE_PATH=/tmp/timeline.json',
+        '-e', 'BENCH_PLAYBOOK',
+    ]
+    if importtime:
+        command.extend(['-e', 'PYTHONPROFILEIMPORTTIME=1'])
+    command.extend([args.image, 'sh', '-c', SCRIPT])
+
+    env = dict(os.environ, BENCH_PLAYBOOK=playbook)
+    output = subprocess.check_output(command, env=env).decode('utf-8')
+    timeline, _, imports = output.partition(SEPARATOR)
+    marks = json.loads(timeline)['marks']
+    marks['job_end'] = time.time()
+    return marks, imports
+
+
+def phases(marks):
+    result = {}
+    for name, start, end in PHASES:
+        if marks.get(start) is not None and marks.get(end) is not None:
+            result[name] = marks[end] - marks[start]
+    result['total'] = marks['job_end'] - marks['job_start']
+    return result
+
+
+def slowest_imports(log, limit):
+    """
+    Returns the (cumulative us, module) of the slowest top level imports of
+    a PYTHONPROFILEIMPORTTIME log.
+    """
+    result = []
+    for line in log.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = [p.strip() for p in line[len('import time:'):].split('|')]
+        try:
+            cumulative = int(parts[1])
+        except ValueError:
+            continue
+        module = parts[2]
+        # nested imports are indented, only the top level imports add up to the total
+        if module == module.lstrip():
+            result.append((cumulative, module))
+    return sorted(result, reverse=True)[:limit]
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', required=True, help='image and tag to start')
+    parser.add_argument('--engine', default=os.environ.get('CONTAINER_ENGINE', 'docker'), help='docker or podman')
+    parser.add_argument('--runs', type=int, default=5, help='number of containers that are started')
+    parser.add_argument('--playbook', help='playbook to run instead of a single debug task on localhost')
+    parser.add_argument('--importtime', default='startup_importtime.log', help='file for the import profile')
+    parser.add_argument('--limit', type=int, default=15, help='number of slowest imports that are printed')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    playbook = PLAYBOOK
+    if args.playbook:
+        with open(args.playbook) as f:
+            playbook = f.read()
+
+    names = [name for name, start, end in PHASES] + ['total']
+    print("%-6s %s" % ('run', ' '.join('%13s' % name for name in names)))
+    results = []
+    first_imports = ''
+    for i in range(args.runs):
+        marks, imports = run_once(args, playbook, importtime=(i == 0))
+        if i == 0:
+            first_imports = imports
+            with open(args.importtime, 'w') as f:
+                f.write(imports)
+        result = phases(marks)
+        results.append(result)
+        print("%-6d %s" % (i + 1, ' '.join('%12.3fs' % result[name] if name in result else '%13s' % '-'
+                                            for name in names)))
+
+    # the first run includes the import profiling
+    measured = results[1:] or results
+    summary = dict((name, median([r[name] for r in measured if name in r]))
+                   for name in names if any(name in r for r in measured))
+    print("%-6s %s" % ('median', ' '.join('%12.3fs' % summary[name] if name in summary else '%13s' % '-'
+                                          for name in names)))
+
+    print("")
+    print("slowest imports of the first run (%s):" % args.importtime)
+    for cumulative, module in slowest_imports(first_imports, args.limit):
+        print("%10.3fs  %s" % (cumulative / 1e6, module))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'image': args.image, 'runs': results, 'median': summary}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,604 @@
+#!/usr/bin/env python
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Local SSH stand-in for OneOS 5 and OneOS 6 devices.
+
+The mock emulates the parts of the OneOS CLI that the oneos5/oneos6 terminal
+and cliconf plugins rely on:
+
+  - user (>) and enable (#) mode, "enable" and "disable"
+  - terminal setup: "term len 0", "stty columns", "screen-width"
+  - "configure terminal" with nested (config-xxx)# modes, "exit" and "end"
+  - "show running-config" including the section filters
+  - canned outputs for show/ls/cat commands, replayed from benchmarks/corpus
+  - "copy <file> running-config" (lines with "invalid" fail) and "rm <file>"
+  - an SFTP subsystem rooted in a local folder that holds /BSA/...
+
+Every command can be delayed with a fixed latency and a random jitter to
+simulate WAN links. With --type-ahead the input is echoed as soon as it is
+received, like a tty, instead of when the command is executed, so the echo of
+pipelined commands arrives before their output and prompt. Paramiko is the
+only requirement.
+
+usage:
+    python benchmarks/oneos_mock.py --os oneos5 --port 2222 --count 5 --latency 0.2
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import logging
+import os
+import random
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import paramiko
+
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+USERNAME = "autoscript"
+PASSWORD = "autoscript"
+
+ERRORS = {
+    "oneos5": "Error: Invalid command",
+    "oneos6": "Syntax error: Illegal command line",
+}
+
+SUBMODES = (
+    (re.compile(r"^interface\s"), "config-if"),
+    (re.compile(r"^(ip )?vrf\s"), "config-vrf"),
+    (re.compile(r"^router\s"), "config-router"),
+    (re.compile(r"^(ip )?access-list\s"), "config-acl"),
+    (re.compile(r"^class-map\s"), "config-cmap"),
+    (re.compile(r"^policy-map\s"), "config-pmap"),
+    (re.compile(r"^class\s"), "config-pmap-c"),
+)
+
+log = logging.getLogger("oneos_mock")
+
+
+def corpus_filename(command):
+    """
+    Returns the name of the corpus file that holds the output of a command.
+    """
+    return re.sub(r"[^\w.-]+", "_", command).strip("_") + ".txt"
+
+
+def generate_running_config(hostname, sections=10):
+    """
+    Returns a running-config with the given number of interface and vrf
+    stanzas, used to test config throughput.
+    """
+    lines = ["hostname %s" % hostname, "!"]
+    for i in range(sections):
+        lines.extend([
+            "ip vrf VRF%d" % i,
+            " rd 65000:%d" % i,
+            " route-target both 65000:%d" % i,
+            "exit",
+            "!",
+            "interface gigabitethernet 0/%d.%d" % (i // 4000, i % 4000 + 1),
+            " description CUSTOMER-%05d" % i,
+            " encapsulation dot1q %d" % (i % 4000 + 1),
+            " ip vrf forwarding VRF%d" % i,
+            " ip address 10.%d.%d.1 255.255.255.252" % (i // 256 % 256, i % 256),
+            "exit",
+            "!",
+        ])
+    lines.append("end")
+    return lines
+
+
+class DeviceProfile(object):
+    """
+    Static description of an emulated device.
+
+    :param network_os: oneos5 or oneos6
+    :param hostname: hostname used in the prompt and running-config
+    :param latency: fixed delay in seconds before each command response
+    :param jitter: maximum random delay in seconds added to the latency
+    :param config_sections: number of vrf/interface stanzas in the running-config
+    :param enabled: start the session in enable mode
+    :param type_ahead: echo the input when it is received instead of when it is executed
+    """
+
+    def __init__(self, network_os="oneos5", hostname="mock-cpe", latency=0.0, jitter=0.0,
+                 config_sections=10, enabled=True, type_ahead=False, corpus_dir=CORPUS_DIR):
+        if network_os not in ERRORS:
+            raise ValueError("unsupported network_os %s" % network_os)
+
+        self.network_os = network_os
+        self.hostname = hostname
+        self.latency = latency
+        self.jitter = jitter
+        self.enabled = enabled
+        self.type_ahead = type_ahead
+        self.corpus_dir = os.path.join(corpus_dir, network_os)
+        self.config_sections = config_sections
+        self._outputs = {}
+
+    def delay(self):
+        wait = self.latency + random.uniform(0, self.jitter) if self.jitter else self.latency
+        if wait > 0:
+            time.sleep(wait)
+
+    def output(self, command):
+        """
+        Returns the canned output of a command or None if there is none.
+        """
+        if command not in self._outputs:
+            path = os.path.join(self.corpus_dir, corpus_filename(command))
+            text = None
+            if os.path.isfile(path):
+                with open(path) as fh:
+                    text = fh.read()
+            self._outputs[command] = text
+        return self._outputs[command]
+
+
+class Device(object):
+    """
+    State of one emulated device, shared by all sessions to the device.
+    """
+
+    def __init__(self, profile, root=None):
+        self.profile = profile
+        self.root = root or tempfile.mkdtemp(prefix="oneos-mock-")
+        self.lock = threading.Lock()
+        self.running_config = generate_running_config(profile.hostname, profile.config_sections)
+        self.commands = 0
+        self._populate_root()
+
+    def _populate_root(self):
+        for folder in ("BSA/binaries", "BSA/config"):
+            path = os.path.join(self.root, folder)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+        startup = os.path.join(self.root, "BSA/config/bsaStart.cfg")
+        if not os.path.exists(startup):
+            with open(startup, "w") as fh:
+                fh.write("\n".join(self.running_config) + "\n")
+
+    def local_path(self, path):
+        path = path.replace("flash:", "")
+        return os.path.join(self.root, os.path.normpath("/" + path).lstrip("/"))
+
+    def section(self, path):
+        """
+        Returns the running-config lines of a section (the header line and
+        all its indented children).
+        """
+        result = []
+        inside = False
+        for line in self.running_config:
+            if not line.startswith(" ") and line not in ("!", "exit"):
+                inside = line == path or line.startswith(path + " ") or line.split(" ")[0] == path
+            if inside:
+                result.append(line)
+            elif result and line == "exit" and result[-1].startswith(" "):
+                result.append(line)
+        return result
+
+    def load_config(self, lines):
+        with self.lock:
+            end = self.running_config.pop() if self.running_config[-1:] == ["end"] else None
+            self.running_config.extend(lines)
+            if end:
+                self.running_config.append(end)
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class Session(object):
+    """
+    CLI state of a single shell session.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self.profile = device.profile
+        self.enabled = self.profile.enabled
+        self.modes = []
+
+    @property
+    def prompt(self):
+        hostname = self.profile.hostname
+        if self.modes:
+            return "%s(%s)#" % (hostname, self.modes[-1])
+        return hostname + ("#" if self.enabled else ">")
+
+    @property
+    def error(self):
+        return ERRORS[self.profile.network_os]
+
+    def execute(self, command):
+        """
+        Returns the output of a command (without echo and prompt).
+        """
+        command = command.strip()
+        self.device.commands += 1
+        if not command:
+            return ""
+
+        self.profile.delay()
+
+        if self.modes:
+            return self._configure(command)
+
+        if command == "enable":
+            self.enabled = True
+            return ""
+        if command == "disable":
+            self.enabled = False
+            return ""
+        if command in ("term len 0", "terminal length 0") or command.startswith("stty ") \
+                or command.startswith("screen-width "):
+            return ""
+        if command == "end":
+            return ""
+        if not self.enabled:
+            return self.error
+        if command in ("configure terminal", "conf t"):
+            self.modes.append("config")
+            return ""
+        if command.startswith("show running-config"):
+            return self._running_config(command[len("show running-config"):].strip())
+        if command.startswith("copy ") and command.endswith(" running-config") \
+                or command.startswith("exec-script "):
+            return self._load_file(command.split()[1])
+        if command.startswith("cat "):
+            return self._cat(command[4:].strip())
+        if command.startswith("rm "):
+            return self._rm(command[3:].strip())
+
+        output = self.profile.output(command)
+        if output is None:
+            return self.error
+        return output.rstrip("\n")
+
+    def _configure(self, line):
+        if line.startswith("!"):
+            return ""
+        if line == "end":
+            self.modes = []
+            return ""
+        if line == "exit":
+            self.modes.pop()
+            return ""
+        if "invalid" in line:
+            return self.error
+
+        self.device.load_config([" " * (len(self.modes) - 1) + line])
+
+        for regex, mode in SUBMODES:
+            if regex.match(line):
+                self.modes.append(mode)
+                break
+        return ""
+
+    def _running_config(self, flt):
+        lines = self.device.running_config
+        if flt.startswith("|"):
+            flt = flt[1:].strip()
+            return "\n".join(l for l in lines if flt in l)
+        if flt and flt not in ("ordered",):
+            return "\n".join(self.device.section(flt))
+        return "\n".join(lines)
+
+    def _cat(self, path):
+        local = self.device.local_path(path)
+        if os.path.isfile(local):
+            with open(local) as fh:
+                return fh.read().rstrip("\n")
+        output = self.profile.output("cat " + path)
+        if output is None:
+            return "%s: No such file or directory" % path
+        return output.rstrip("\n")
+
+    def _rm(self, path):
+        local = self.device.local_path(path)
+        if not os.path.isfile(local):
+            return "%s: No such file or directory" % path
+        os.remove(local)
+        return ""
+
+    def _load_file(self, path):
+        """
+        Merges a file in the running-config, like the CLI the invalid lines
+        are reported and the other lines are loaded.
+        """
+        local = self.device.local_path(path)
+        if not os.path.isfile(local):
+            return self.error
+        with open(local) as fh:
+            lines = [l.rstrip("\n") for l in fh if l.strip() and not l.startswith("!")]
+        errors = ["%s\n%s" % (l, self.error) for l in lines if "invalid" in l]
+        self.device.load_config([l for l in lines if "invalid" not in l])
+        return "\n".join(errors)
+
+
+class ShellHandler(threading.Thread):
+    """
+    Reads the input of a shell channel line by line, echoes it and replies
+    with the command output followed by the prompt.
+    """
+
+    def __init__(self, channel, device):
+        super(ShellHandler, self).__init__()
+        self.daemon = True
+        self.channel = channel
+        self.session = Session(device)
+
+    def send(self, text):
+        self.channel.sendall(text.replace("\n", "\r\n").encode())
+
+    def run(self):
+        try:
+            self.send("\n%s" % self.session.prompt)
+            buf = b""
+            while True:
+                data = self.channel.recv(65536)
+                if not data:
+                    break
+                buf += data
+                type_ahead = self.session.profile.type_ahead
+                if type_ahead:
+                    self.send(data.decode("utf-8", "replace").replace("\r\n", "\n").replace("\r", "\n"))
+                while True:
+                    match = re.search(b"[\r\n]", buf)
+                    if not match:
+                        break
+                    line, buf = buf[:match.start()], buf[match.end():]
+                    if match.group() == b"\r" and buf.startswith(b"\n"):
+                        buf = buf[1:]
+                    command = line.decode("utf-8", "replace")
+                    output = self.session.execute(command)
+                    reply = "" if type_ahead else command + "\n"
+                    if output:
+                        reply += output + "\n"
+                    self.send(reply + self.session.prompt)
+        except (socket.error, EOFError):
+            pass
+        finally:
+            # the client may have closed the transport first
+            try:
+                self.channel.close()
+            except (socket.error, EOFError):
+                pass
+
+
+class ServerInterface(paramiko.ServerInterface):
+
+    def __init__(self, device):
+        self.device = device
+        self.shell_requested = threading.Event()
+
+    def check_auth_password(self, username, password):
+        if username == USERNAME and password == PASSWORD:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        ShellHandler(channel, self.device).start()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        return False
+
+
+class SFTPHandle(paramiko.SFTPHandle):
+
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class SFTPServerInterface(paramiko.SFTPServerInterface):
+    """
+    SFTP subsystem that maps the device filesystem to a local folder.
+    """
+
+    def __init__(self, server, device, *args, **kwargs):
+        super(SFTPServerInterface, self).__init__(server, *args, **kwargs)
+        self.device = device
+
+    def _path(self, path):
+        return self.device.local_path(path)
+
+    def list_folder(self, path):
+        local = self._path(path)
+        try:
+            result = []
+            for name in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)))
+                attr.filename = name
+                result.append(attr)
+            return result
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        local = self._path(path)
+        try:
+            binary_flag = getattr(os, "O_BINARY", 0)
+            fd = os.open(local, flags | binary_flag, 0o666)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+        if flags & os.O_WRONLY:
+            mode = "ab" if flags & os.O_APPEND else "wb"
+        elif flags & os.O_RDWR:
+            mode = "a+b" if flags & os.O_APPEND else "r+b"
+        else:
+            mode = "rb"
+
+        fobj = os.fdopen(fd, mode)
+        handle = SFTPHandle(flags)
+        handle.filename = local
+        handle.readfile = fobj
+        handle.writefile = fobj
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(self._path(oldpath), self._path(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._path(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+
+class MockServer(threading.Thread):
+    """
+    SSH server for one emulated device listening on host:port, port 0 picks
+    a free port (see the port attribute after start()).
+    """
+
+    host_key = None
+
+    def __init__(self, profile, host="127.0.0.1", port=0, root=None):
+        super(MockServer, self).__init__()
+        self.daemon = True
+        self.device = Device(profile, root=root)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(100)
+        self.host = host
+        self.port = self.sock.getsockname()[1]
+        self._stopped = threading.Event()
+        self._transports = []
+
+        if MockServer.host_key is None:
+            MockServer.host_key = paramiko.RSAKey.generate(2048)
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                client, addr = self.sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+    def _handle(self, client):
+        transport = paramiko.Transport(client)
+        self._transports.append(transport)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, SFTPServerInterface, self.device)
+        try:
+            transport.start_server(server=ServerInterface(self.device))
+        except (paramiko.SSHException, EOFError, socket.error):
+            return
+
+    def stop(self):
+        self._stopped.set()
+        for transport in self._transports:
+            transport.close()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        self.device.cleanup()
+
+
+def start_servers(count, profile_kwargs, host="127.0.0.1", port=0):
+    """
+    Starts count mock devices, port 0 picks free ports, otherwise the devices
+    listen on port, port+1, ...
+    """
+    servers = []
+    for i in range(count):
+        kwargs = dict(profile_kwargs)
+        kwargs["hostname"] = "%s-%03d" % (kwargs.get("hostname", "mock-cpe"), i)
+        server = MockServer(DeviceProfile(**kwargs), host=host, port=port + i if port else 0)
+        server.start()
+        servers.append(server)
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SSH stand-in for OneOS 5/6 devices")
+    parser.add_argument("--os", dest="network_os", default="oneos5", choices=sorted(ERRORS))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2222, help="port of the first device")
+    parser.add_argument("--count", type=int, default=1, help="number of devices")
+    parser.add_argument("--latency", type=float, default=0.0, help="per-command latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="maximum random extra latency in seconds")
+    parser.add_argument("--config-sections", type=int, default=10,
+                        help="number of vrf/interface stanzas in the running-config")
+    parser.add_argument("--type-ahead", action="store_true",
+                        help="echo the input when it is received instead of when it is executed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    servers = start_servers(args.count, {
+        "network_os": args.network_os,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "config_sections": args.config_sections,
+        "type_ahead": args.type_ahead,
+    }, host=args.host, port=args.port)
+
+    for server in servers:
+        log.info("%s %s listening on %s:%s (user %s / password %s)", server.device.profile.network_os,
+                 server.device.profile.hostname, server.host, server.port, USERNAME, PASSWORD)
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
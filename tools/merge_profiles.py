@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Merges the profiles of the persistent connection processes in one report.
+
+The oneos cliconf plugins write a cProfile dump (.prof) and a tracemalloc
+snapshot (.tracemalloc) per host when ansible_oneos_profile is enabled
+(oneos.profiler). This script prints:
+
+- the profiled time and the traced memory per host
+- the functions with the most CPU time over all hosts (pstats)
+- the lines with the most allocated memory over all hosts (tracemalloc)
+
+Only the standard library is used, the Python version should be the one of
+the image to read the dumps.
+
+    python3 tools/merge_profiles.py projects/demo/artifacts/<ident>/profiles
+    python3 tools/merge_profiles.py --sort tottime --limit 50 --output merged.prof profiles/*.prof
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import glob
+import os
+import pstats
+import sys
+import tracemalloc
+
+
+def find_dumps(paths):
+    """
+    Returns the .prof and .tracemalloc files in paths (files or folders).
+    """
+    profiles, snapshots = [], []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, '*'))) if os.path.isdir(path) else [path]
+        for name in files:
+            if name.endswith('.prof'):
+                profiles.append(name)
+            elif name.endswith('.tracemalloc'):
+                snapshots.append(name)
+    return profiles, snapshots
+
+
+def host_of(path):
+    # <host>.<pid>.<n>.prof, the host can contain dots
+    return os.path.basename(path).rsplit('.', 3)[0]
+
+
+def merge_snapshots(snapshots, key_type, limit):
+    """
+    Returns the (size, count, trace) of the limit largest allocation sites
+    summed over all snapshots.
+    """
+    totals = {}
+    for path in snapshots:
+        snapshot = tracemalloc.Snapshot.load(path)
+        for stat in snapshot.statistics(key_type):
+            trace = str(stat.traceback) if key_type != 'traceback' else "\n    ".join(stat.traceback.format())
+            size, count = totals.get(trace, (0, 0))
+            totals[trace] = (size + stat.size, count + stat.count)
+    result = [(size, count, trace) for trace, (size, count) in totals.items()]
+    result.sort(reverse=True)
+    return result[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='profiles folders or dump files')
+    parser.add_argument('--sort', default='cumulative', help='pstats sort key (cumulative, tottime, calls, ...)')
+    parser.add_argument('--limit', type=int, default=30, help='number of functions and allocation sites')
+    parser.add_argument('--key', default='lineno', choices=['lineno', 'filename', 'traceback'],
+                        help='group the allocations per line, file or traceback')
+    parser.add_argument('--output', help='write the merged cProfile stats to this file (for snakeviz, gprof2dot, ...)')
+    args = parser.parse_args()
+
+    profiles, snapshots = find_dumps(args.paths)
+    if not profiles and not snapshots:
+        print("no profiles found in %s" % ' '.join(args.paths))
+        return 1
+
+    # host: [profiles, cpu seconds, maximum traced bytes]
+    hosts = {}
+    for path in profiles:
+        host = hosts.setdefault(host_of(path), [0, 0.0, 0])
+        host[0] += 1
+        host[1] += pstats.Stats(path).total_tt
+    for path in snapshots:
+        host = hosts.setdefault(host_of(path), [0, 0.0, 0])
+        traced = sum(stat.size for stat in tracemalloc.Snapshot.load(path).statistics('filename'))
+        host[2] = max(host[2], traced)
+
+    print("%-40s %8s %12s %12s" % ('host', 'profiles', 'profiled s', 'traced KB'))
+    for host, (count, seconds, traced) in sorted(hosts.items(), key=lambda item: item[1][1], reverse=True):
+        print("%-40s %8d %12.3f %12.1f" % (host, count, seconds, traced / 1024.0))
+
+    if profiles:
+        stats = pstats.Stats(profiles[0])
+        for path in profiles[1:]:
+            stats.add(path)
+        if args.output:
+            stats.dump_stats(args.output)
+        print("")
+        print("CPU, %d profiles, sorted by %s" % (len(profiles), args.sort))
+        stats.strip_dirs().sort_stats(args.sort).print_stats(args.limit)
+
+    if snapshots:
+        print("")
+        print("memory still allocated at connection close, %d snapshots, per %s" % (len(snapshots), args.key))
+        print("%12s %10s  %s" % ('KB', 'blocks', 'allocated at'))
+        for size, count, trace in merge_snapshots(snapshots, args.key, args.limit):
+            print("%12.1f %10d  %s" % (size / 1024.0, count, trace))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
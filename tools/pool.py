@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Pool of warm runner containers, used by make run-pool (ansible-run <project>
+--pool).
+
+make run starts a new container for every job. A pool container is started
+once per image and project (with the project mounted on /runner as make run
+does) and then sleeps. Jobs are run in it with docker exec as
+"ansible-runner run /runner -p <playbook>", so the container start, the
+entrypoint and the compiled modules of ansible and the collections are
+reused by the next job.
+
+- a container runs one job at a time (a lock folder in the container), when
+  all containers of the project are busy a new one is started, up to --size
+  containers, then the job waits for a free container
+- a container stops itself (and is removed) when it was idle for
+  --idle-timeout seconds
+- containers of an older image (the image tag was built again) are removed
+  when they are idle and never get a job again
+
+Only the standard library is used, this script runs on the docker host.
+
+    python3 tools/pool.py run demo --playbook playbook --image ansible-runner-network:1.0
+    python3 tools/pool.py status
+    python3 tools/pool.py stop --project demo
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import hashlib
+import os
+import subprocess
+import sys
+import time
+
+
+LABEL = 'ansible-runner-network.pool'
+
+BUSY_DIR = '/tmp/pool.busy'
+LAST_USED = '/tmp/pool.last'
+
+# exit code of the job script when the container is running another job (EX_TEMPFAIL)
+BUSY_RC = 75
+
+# the command of a pool container, it exits when it is not busy and was not used for $IDLE_TIMEOUT seconds
+WATCHDOG = (
+    "touch %(last)s; "
+    "while [ -d %(busy)s ] || [ $(( $(date +%%s) - $(stat -c %%Y %(last)s) )) -lt $IDLE_TIMEOUT ]; "
+    "do sleep 5; done"
+) % {'busy': BUSY_DIR, 'last': LAST_USED}
+
+JOB = (
+    "mkdir %(busy)s 2>/dev/null || exit %(rc)d; "
+    "touch %(last)s; "
+    "ansible-runner run /runner -p \"$RUNNER_PLAYBOOK\"; rc=$?; "
+    "rmdir %(busy)s; touch %(last)s; exit $rc"
+) % {'busy': BUSY_DIR, 'last': LAST_USED, 'rc': BUSY_RC}
+
+
+class Engine(object):
+    """
+    Runs the commands of the docker (or podman) CLI.
+    """
+
+    def __init__(self, command):
+        self.command = command
+
+    def output(self, *args):
+        return subprocess.check_output([self.command] + list(args)).decode('utf-8').strip()
+
+    def call(self, *args, **kwargs):
+        return subprocess.call([self.command] + list(args), **kwargs)
+
+    def image_id(self, image):
+        return self.output('image', 'inspect', '--format', '{{.Id}}', image)
+
+    def containers(self, project=None):
+        """
+        Returns the running pool containers as dicts with name, project,
+        image (id) and busy.
+        """
+        args = ['ps', '--filter', 'label=%s' % LABEL]
+        if project:
+            args.extend(['--filter', 'label=%s.project=%s' % (LABEL, project)])
+        result = []
+        for name in self.output(*(args + ['--format', '{{.Names}}'])).split():
+            fmt = '{{.Image}} {{index .Config.Labels "%s.project"}}' % LABEL
+            try:
+                image, project_name = self.output('inspect', '--format', fmt, name).split(' ', 1)
+            except (subprocess.CalledProcessError, ValueError):
+                # stopped in the meantime
+                continue
+            busy = self.call('exec', name, 'test', '-d', BUSY_DIR,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+            result.append({'name': name, 'project': project_name, 'image': image, 'busy': busy})
+        return result
+
+
+def container_name(project, image_id, number):
+    digest = hashlib.sha1(image_id.encode('utf-8')).hexdigest()[:8]
+    return 'arn-pool-%s-%s-%d' % (project, digest, number)
+
+
+def start_container(engine, args, image_id, number):
+    name = container_name(args.project, image_id, number)
+    engine.output(
+        'run', '-d', '--rm', '--name', name,
+        '--label', LABEL,
+        '--label', '%s.project=%s' % (LABEL, args.project),
+        '-e', 'IDLE_TIMEOUT=%d' % args.idle_timeout,
+        '-e', 'RUNNER_PROJECT=%s' % args.project,
+        '-v', '%s:/runner' % os.path.abspath(os.path.join(args.projects_dir, args.project)),
+        args.image, 'sh', '-c', WATCHDOG,
+    )
+    return name
+
+
+def recycle(engine, containers, image_id):
+    """
+    Removes the idle containers of another image, returns the containers
+    of the image.
+    """
+    current = []
+    for container in containers:
+        if container['image'] == image_id:
+            current.append(container)
+        elif not container['busy']:
+            engine.call('rm', '-f', container['name'], stdout=subprocess.DEVNULL)
+    return current
+
+
+def run(args):
+    engine = Engine(args.engine)
+    image_id = engine.image_id(args.image)
+    env = [
+        '-e', 'RUNNER_PLAYBOOK=%s.yml' % args.playbook,
+        '-e', 'RUNNER_JOB_START=%s' % (args.job_start or time.time()),
+    ]
+    for name in args.env:
+        env.extend(['-e', name])
+
+    deadline = time.time() + args.wait
+    while True:
+        containers = recycle(engine, engine.containers(args.project), image_id)
+        names = [c['name'] for c in containers if not c['busy']]
+        if len(containers) < args.size:
+            used = set(c['name'] for c in containers)
+            number = min(n for n in range(args.size + 1) if container_name(args.project, image_id, n) not in used)
+            try:
+                names.append(start_container(engine, args, image_id, number))
+            except subprocess.CalledProcessError:
+                # started by another job at the same time
+                pass
+
+        for name in names:
+            rc = engine.call('exec', *(env + [name, 'sh', '-c', JOB]))
+            if rc != BUSY_RC:
+                return rc
+
+        if time.time() > deadline:
+            print("all %d pool containers of %s are busy" % (args.size, args.project))
+            return BUSY_RC
+        time.sleep(2)
+
+
+def status(args):
+    engine = Engine(args.engine)
+    print("%-50s %-20s %-8s %s" % ('container', 'project', 'state', 'image'))
+    for container in engine.containers(args.project):
+        print("%-50s %-20s %-8s %s" % (container['name'], container['project'],
+                                       'busy' if container['busy'] else 'idle', container['image'][:19]))
+    return 0
+
+
+def stop(args):
+    engine = Engine(args.engine)
+    for container in engine.containers(args.project):
+        if container['busy'] and not args.force:
+            print("%s is running a job, use --force to stop it" % container['name'])
+            continue
+        engine.call('rm', '-f', container['name'], stdout=subprocess.DEVNULL)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engine', default=os.environ.get('CONTAINER_ENGINE', 'docker'), help='docker or podman')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    parser_run = commands.add_parser('run', help='run a playbook of a project in a pool container')
+    parser_run.add_argument('project', help='project name')
+    parser_run.add_argument('--playbook', default='playbook', help='playbook name without .yml')
+    parser_run.add_argument('--image', required=True, help='image and tag of the containers')
+    parser_run.add_argument('--projects-dir', default='projects', help='folder of the projects')
+    parser_run.add_argument('--size', type=int, default=1, help='maximum number of containers of the project')
+    parser_run.add_argument('--idle-timeout', type=int, default=900,
+                            help='seconds after which an idle container stops')
+    parser_run.add_argument('--wait', type=int, default=3600, help='seconds to wait for a free container')
+    parser_run.add_argument('--job-start', type=float, help='unix time the job was started (job timeline)')
+    parser_run.add_argument('-e', '--env', action='append', default=[], help='NAME=value passed to the job')
+    parser_run.set_defaults(func=run)
+
+    parser_status = commands.add_parser('status', help='list the pool containers')
+    parser_status.add_argument('--project', help='only the containers of this project')
+    parser_status.set_defaults(func=status)
+
+    parser_stop = commands.add_parser('stop', help='remove the pool containers')
+    parser_stop.add_argument('--project', help='only the containers of this project')
+    parser_stop.add_argument('--force', action='store_true', help='also remove containers that run a job')
+    parser_stop.set_defaults(func=stop)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
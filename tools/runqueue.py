@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Local job queue for ansible-run.
+
+serve    runs the queue daemon on a unix socket (make runqueue). It limits the
+         number of jobs that run at the same time, in total (--max-jobs) and
+         per project (--max-project-jobs). Jobs start in the order they were
+         submitted, a job of a project that is at its limit is skipped until
+         a job of that project finished.
+submit   queues a job and runs the command when the daemon starts it
+         (ansible-run does this when the daemon is running). The command runs
+         in the client, with the permissions and the terminal of the user,
+         the connection to the daemon is the lease of the job slot.
+status   prints the running and queued jobs.
+
+A job that is submitted while an identical job (same project, playbook,
+inventory hash and command, so the same run mode and options) is still
+queued is not queued again, the client waits for
+the result of the queued job and exits with its rc.
+
+The queue position and ETA are computed from the median duration of the
+last runs of the project and playbook, kept in the history file next to the
+socket. Only the standard library is used, this script runs on the docker
+host.
+
+    python3 tools/runqueue.py --socket projects/.runqueue.sock serve --max-jobs 4
+    python3 tools/runqueue.py --socket projects/.runqueue.sock submit demo playbook -- make run PROJECT=demo
+    python3 tools/runqueue.py --socket projects/.runqueue.sock status
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import getpass
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import select
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+DEFAULT_SOCKET = 'projects/.runqueue.sock'
+
+HISTORY_SIZE = 20
+
+# seconds between the position updates that are sent to a queued client
+UPDATE_INTERVAL = 10
+
+
+def inventory_hash(project_dir):
+    """
+    Returns the sha256 of the files in the inventory folder of a project.
+    """
+    digest = hashlib.sha256()
+    inventory_dir = os.path.join(project_dir, 'inventory')
+    for root, dirs, files in os.walk(inventory_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, inventory_dir).encode('utf-8') + b'\0')
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return '?'
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return '%dh%02dm' % (seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60:
+        return '%dm%02ds' % (seconds // 60, seconds % 60)
+    return '%ds' % seconds
+
+
+class History(object):
+    """
+    The durations of the last runs per project and playbook.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.durations = {}
+        try:
+            with open(path) as f:
+                self.durations = json.load(f)
+        except (IOError, OSError, ValueError):
+            pass
+
+    def add(self, project, playbook, seconds):
+        key = '%s/%s' % (project, playbook)
+        self.durations[key] = (self.durations.get(key, []) + [seconds])[-HISTORY_SIZE:]
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.durations, f, indent=2, sort_keys=True)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError):
+            pass
+
+    def estimate(self, project, playbook):
+        """
+        Returns the median duration of the project and playbook, or of all
+        runs when it never ran, None without history.
+        """
+        values = self.durations.get('%s/%s' % (project, playbook))
+        if not values:
+            values = [value for durations in self.durations.values() for value in durations]
+        if not values:
+            return None
+        return sorted(values)[len(values) // 2]
+
+
+class Job(object):
+
+    def __init__(self, number, request):
+        self.number = number
+        self.project = request['project']
+        self.playbook = request['playbook']
+        self.inventory = request.get('inventory')
+        self.user = request.get('user')
+        # the command holds the run mode and options (make run, run-shards, PREFLIGHT=...)
+        self.command = tuple(request.get('command') or ())
+        self.key = (self.project, self.playbook, self.inventory, self.command)
+        self.state = 'queued'
+        self.submitted = time.time()
+        self.started = None
+        self.rc = None
+        # clients waiting for the job, the first one runs it
+        self.clients = []
+        self.owner = None
+
+    def to_dict(self):
+        return {
+            'number': self.number,
+            'project': self.project,
+            'playbook': self.playbook,
+            'user': self.user,
+            'state': self.state,
+            'submitted': self.submitted,
+            'started': self.started,
+            'waiting': len(self.clients),
+        }
+
+
+class RunQueue(object):
+    """
+    The queued and running jobs, all methods are thread safe.
+    """
+
+    def __init__(self, max_jobs, max_project_jobs, history):
+        self.max_jobs = max_jobs
+        self.max_project_jobs = max_project_jobs
+        self.history = history
+        self.condition = threading.Condition()
+        self.queue = []
+        self.running = []
+        self._numbers = itertools.count(1)
+        self._clients = itertools.count(1)
+
+    def submit(self, request):
+        """
+        Returns the job, the client id and whether the job was already
+        queued.
+        """
+        with self.condition:
+            client = next(self._clients)
+            job = Job(None, request)
+            for queued in self.queue:
+                if queued.key == job.key:
+                    queued.clients.append(client)
+                    return queued, client, True
+            job.number = next(self._numbers)
+            job.clients.append(client)
+            self.queue.append(job)
+            self._schedule()
+            return job, client, False
+
+    def detach(self, job, client):
+        """
+        A client disconnected, a queued job without clients is removed and a
+        running job of which the owner disconnected is finished.
+        """
+        with self.condition:
+            if client in job.clients:
+                job.clients.remove(client)
+            if job.state == 'queued' and not job.clients:
+                self.queue.remove(job)
+                self._schedule()
+            elif job.state == 'running' and job.owner == client:
+                self._finish(job, None)
+
+    def finish(self, job, rc):
+        with self.condition:
+            self._finish(job, rc)
+
+    def _finish(self, job, rc):
+        if job in self.running:
+            self.running.remove(job)
+        job.state = 'done'
+        job.rc = rc
+        if rc is not None:
+            self.history.add(job.project, job.playbook, time.time() - job.started)
+        self._schedule()
+
+    def _project_jobs(self, project):
+        return sum(1 for job in self.running if job.project == project)
+
+    def _schedule(self):
+        for job in list(self.queue):
+            if len(self.running) >= self.max_jobs:
+                break
+            if self._project_jobs(job.project) >= self.max_project_jobs:
+                continue
+            self.queue.remove(job)
+            job.state = 'running'
+            job.started = time.time()
+            job.owner = job.clients[0]
+            self.running.append(job)
+        self.condition.notify_all()
+
+    def _estimates(self):
+        """
+        Returns {job: estimated start} for the queued jobs, by replaying the
+        scheduling with the estimated durations.
+        """
+        now = time.time()
+        ends = []
+        project_ends = {}
+        for job in self.running:
+            duration = self.history.estimate(job.project, job.playbook)
+            end = max(job.started + (duration or 0), now)
+            ends.append(end)
+            project_ends.setdefault(job.project, []).append(end)
+        ends.extend([now] * max(self.max_jobs - len(ends), 0))
+        heapq.heapify(ends)
+
+        result = {}
+        unknown = False
+        for job in self.queue:
+            start = heapq.heappop(ends)
+            running = project_ends.setdefault(job.project, [])
+            if len(running) >= self.max_project_jobs:
+                running.sort()
+                start = max(start, running.pop(0))
+            duration = self.history.estimate(job.project, job.playbook)
+            unknown = unknown or duration is None
+            result[job] = None if unknown else start
+            end = start + (duration or 0)
+            heapq.heappush(ends, end)
+            running.append(end)
+        return result
+
+    def position(self, job):
+        """
+        Returns the position in the queue and the estimated seconds until
+        the job starts.
+        """
+        with self.condition:
+            if job not in self.queue:
+                return None, None
+            start = self._estimates()[job]
+            return self.queue.index(job) + 1, None if start is None else max(start - time.time(), 0)
+
+    def status(self):
+        with self.condition:
+            estimates = self._estimates()
+            now = time.time()
+            jobs = []
+            for job in self.running + self.queue:
+                data = job.to_dict()
+                duration = self.history.estimate(job.project, job.playbook)
+                if job.state == 'running':
+                    data['remaining'] = None if duration is None else max(job.started + duration - now, 0)
+                else:
+                    start = estimates[job]
+                    data['eta'] = None if start is None else max(start - now, 0)
+                jobs.append(data)
+            return {
+                'max_jobs': self.max_jobs,
+                'max_project_jobs': self.max_project_jobs,
+                'jobs': jobs,
+            }
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """
+    A client connection, the messages are JSON lines.
+    """
+
+    def send(self, **message):
+        self.wfile.write((json.dumps(message) + "\n").encode('utf-8'))
+        self.wfile.flush()
+
+    def disconnected(self):
+        # a client never sends anything while it waits, readable means closed
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        if request.get('command') == 'status':
+            self.send(**self.server.queue.status())
+            return
+
+        queue = self.server.queue
+        job, client, duplicate = queue.submit(request)
+        self.send(event='queued', number=job.number, duplicate=duplicate, owner=job.user)
+        try:
+            self.wait(job, client)
+        except (IOError, OSError):
+            queue.detach(job, client)
+
+    def wait(self, job, client):
+        queue = self.server.queue
+        last_position = None
+        last_update = 0
+        announced = False
+        seen = None
+        while True:
+            with queue.condition:
+                # every change of the queue notifies, the timeout checks the client connection
+                if (job.state, job.owner) == seen:
+                    queue.condition.wait(1)
+                state, owner, rc = job.state, job.owner, job.rc
+                seen = (state, owner)
+
+            if self.disconnected():
+                queue.detach(job, client)
+                return
+
+            if state == 'queued':
+                position, eta = queue.position(job)
+                if position is not None and (position != last_position or
+                                             time.time() - last_update >= UPDATE_INTERVAL):
+                    self.send(event='position', position=position, eta=eta)
+                    last_position, last_update = position, time.time()
+            elif state == 'running' and owner == client:
+                self.send(event='start')
+                line = self.rfile.readline()
+                message = json.loads(line.decode('utf-8')) if line else {}
+                queue.finish(job, message.get('rc'))
+                return
+            elif state == 'running' and not announced:
+                self.send(event='running', user=job.user)
+                announced = True
+            elif state == 'done':
+                self.send(event='done', rc=rc)
+                return
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(args):
+    if os.path.exists(args.socket):
+        try:
+            socket.socket(socket.AF_UNIX).connect(args.socket)
+            print("a run queue is already running on %s" % args.socket)
+            return 1
+        except (IOError, OSError):
+            os.remove(args.socket)
+
+    history = History(args.history or os.path.splitext(args.socket)[0] + '.history.json')
+    server = Server(args.socket, Handler)
+    # the users of the projects folder group submit jobs
+    os.chmod(args.socket, 0o660)
+    server.queue = RunQueue(args.max_jobs, args.max_project_jobs, history)
+    print("run queue on %s: %d jobs, %d per project" % (args.socket, args.max_jobs, args.max_project_jobs))
+    # remove the socket when the service is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+    return 0
+
+
+def connect(path):
+    sock = socket.socket(socket.AF_UNIX)
+    sock.connect(path)
+    return sock
+
+
+def submit(args):
+    request = {
+        'project': args.project,
+        'playbook': args.playbook,
+        'inventory': inventory_hash(os.path.join(args.projects_dir, args.project)),
+        'command': args.cmd,
+        'user': getpass.getuser(),
+    }
+    try:
+        sock = connect(args.socket)
+    except (IOError, OSError) as exc:
+        print("the run queue is not running on %s: %s" % (args.socket, exc))
+        return 1
+
+    reader = sock.makefile('rb')
+    sock.sendall((json.dumps(request) + "\n").encode('utf-8'))
+    for line in reader:
+        message = json.loads(line.decode('utf-8'))
+        event = message['event']
+        if event == 'queued' and message['duplicate']:
+            print("an identical run of %s/%s is already queued (job %d of %s), waiting for its result"
+                  % (args.project, args.playbook, message['number'], message['owner']))
+        elif event == 'queued':
+            print("queued as job %d" % message['number'])
+        elif event == 'position':
+            print("queue position %d, starts in about %s" % (message['position'], format_seconds(message['eta'])))
+        elif event == 'start':
+            rc = subprocess.call(args.cmd)
+            sock.sendall((json.dumps({'event': 'done', 'rc': rc}) + "\n").encode('utf-8'))
+            return rc
+        elif event == 'running':
+            print("the identical run of %s is running" % message['user'])
+        elif event == 'done':
+            if message['rc'] is None:
+                print("the identical run was interrupted")
+                return 1
+            print("the identical run finished with rc %d, see the artifacts of %s" % (message['rc'], args.project))
+            return message['rc']
+
+    print("the run queue closed the connection")
+    return 1
+
+
+def status(args):
+    try:
+        sock = connect(args.socket)
+    except (IOError, OSError) as exc:
+        print("the run queue is not running on %s: %s" % (args.socket, exc))
+        return 1
+    sock.sendall((json.dumps({'command': 'status'}) + "\n").encode('utf-8'))
+    data = json.loads(sock.makefile('rb').readline().decode('utf-8'))
+
+    print("max %d jobs, %d per project" % (data['max_jobs'], data['max_project_jobs']))
+    print("%5s %-9s %-20s %-20s %-12s %8s %10s" % ('job', 'state', 'project', 'playbook', 'user', 'waiting', 'eta/left'))
+    for job in data['jobs']:
+        eta = job['remaining'] if job['state'] == 'running' else job['eta']
+        print("%5d %-9s %-20s %-20s %-12s %8d %10s" % (job['number'], job['state'], job['project'], job['playbook'],
+                                                       job['user'], job['waiting'], format_seconds(eta)))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='unix socket of the daemon')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    parser_serve = commands.add_parser('serve', help='run the queue daemon')
+    parser_serve.add_argument('--max-jobs', type=int, default=4, help='maximum number of jobs that run at once')
+    parser_serve.add_argument('--max-project-jobs', type=int, default=1,
+                              help='maximum number of jobs of a project that run at once')
+    parser_serve.add_argument('--history', help='history file, default <socket>.history.json')
+    parser_serve.set_defaults(func=serve)
+
+    parser_submit = commands.add_parser('submit', help='queue a job and run the command when it starts')
+    parser_submit.add_argument('project', help='project name')
+    parser_submit.add_argument('playbook', help='playbook name')
+    parser_submit.add_argument('--projects-dir', default='projects', help='folder of the projects')
+    parser_submit.set_defaults(func=submit)
+
+    parser_status = commands.add_parser('status', help='list the running and queued jobs')
+    parser_status.set_defaults(func=status)
+
+    # the command of the job follows --, its arguments are not parsed
+    argv = sys.argv[1:]
+    cmd = []
+    if '--' in argv:
+        argv, cmd = argv[:argv.index('--')], argv[argv.index('--') + 1:]
+    args = parser.parse_args(argv)
+    args.cmd = cmd
+    if args.command == 'submit' and not args.cmd:
+        parser.error("submit needs the command of the job after --")
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
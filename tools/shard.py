@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Splits the inventory of a project in shards and merges the results of the
+shards, used by make run-shards (ansible-run <project> --shards N).
+
+split   writes projects/<project>/shards/<n>/inventory for n = 1..N: a copy of
+        the inventory folder (group_vars, host_vars, ...) with a hosts file
+        that only contains the hosts of the shard. The groups, children and
+        vars sections are kept in every shard. The hosts are balanced on the
+        task time per host of the last runs (timeline.json of the
+        oneos_timeline callback), hosts without a timeline count as the
+        median host.
+
+merge   collects the artifacts of the shard runs that were started after
+        --job-start and prints the merged play recap. The rc, status and
+        stats of every run and the merged stats are written to
+        artifacts/shards.json. Exits with the highest rc of the runs.
+
+Only INI inventories are supported. Only the standard library is used, this
+script runs on the docker host.
+
+    python3 tools/shard.py split projects/demo --shards 4
+    python3 tools/shard.py merge projects/demo --shards 4 --job-start 1634460000.12
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import glob
+import heapq
+import json
+import os
+import re
+import shutil
+import string
+import sys
+import time
+
+
+STATS = ('ok', 'changed', 'dark', 'failures', 'skipped', 'rescued', 'ignored')
+
+# ansible recap names of the stats
+RECAP = (('ok', 'ok'), ('changed', 'changed'), ('dark', 'unreachable'), ('failures', 'failed'),
+         ('skipped', 'skipped'), ('rescued', 'rescued'), ('ignored', 'ignored'))
+
+SECTION_RE = re.compile(r'^\[([^\]:]+)(?::(\w+))?\]\s*$')
+
+RANGE_RE = re.compile(r'\[([0-9a-zA-Z]+):([0-9a-zA-Z]+)(?::(\d+))?\]')
+
+
+def expand_hosts(pattern):
+    """
+    Expands a host range like www[01:50:2].example.com or db-[a:c] as
+    ansible does, returns [pattern] when there is no range.
+    """
+    match = RANGE_RE.search(pattern)
+    if not match:
+        return [pattern]
+    start, end, step = match.group(1), match.group(2), int(match.group(3) or 1)
+    if start.isdigit() and end.isdigit():
+        width = len(start) if start.startswith('0') else 0
+        values = ["%0*d" % (width, i) for i in range(int(start), int(end) + 1, step)]
+    elif len(start) == 1 and len(end) == 1:
+        letters = string.ascii_letters
+        values = list(letters[letters.index(start):letters.index(end) + 1:step])
+    else:
+        raise ValueError("invalid host range %s" % pattern)
+    head, tail = pattern[:match.start()], pattern[match.end():]
+    result = []
+    for value in values:
+        result.extend(expand_hosts(head + value + tail))
+    return result
+
+
+def parse_inventory(path):
+    """
+    Returns the lines of an INI inventory as (host, line) tuples, host is
+    None for the lines that are kept in every shard. Host ranges are
+    expanded in a line per host.
+    """
+    lines = []
+    host_section = True
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            stripped = line.strip()
+            match = SECTION_RE.match(stripped)
+            if match:
+                host_section = match.group(2) is None
+                lines.append((None, line))
+            elif not stripped or stripped[0] in '#;' or not host_section:
+                lines.append((None, line))
+            elif stripped.startswith('---') or stripped.endswith(':'):
+                raise ValueError("%s is not an INI inventory" % path)
+            else:
+                pattern, _, rest = stripped.partition(' ')
+                for host in expand_hosts(pattern):
+                    lines.append((host, (host + ' ' + rest).rstrip()))
+    return lines
+
+
+def load_weights(project_dir):
+    """
+    Returns the task time per host of the most recent timeline of every
+    host.
+    """
+    weights = {}
+    timelines = glob.glob(os.path.join(project_dir, 'artifacts', '*', 'timeline.json'))
+    for path in sorted(timelines, key=os.path.getmtime):
+        try:
+            with open(path) as f:
+                weights.update(json.load(f)['task_execution']['hosts'])
+        except (IOError, OSError, ValueError, KeyError):
+            continue
+    return weights
+
+
+def balance(hosts, shards, weights=None):
+    """
+    Returns a shard number (1..shards) per host, the hosts are assigned
+    heaviest first to the shard with the lowest total weight.
+    """
+    weights = weights or {}
+    known = sorted(weights[host] for host in hosts if host in weights)
+    default = known[len(known) // 2] if known else 1.0
+    order = sorted(enumerate(hosts), key=lambda item: (-weights.get(item[1], default), item[0]))
+
+    # (total weight, number of hosts, shard)
+    heap = [(0.0, 0, shard) for shard in range(1, shards + 1)]
+    result = {}
+    for i, host in order:
+        total, count, shard = heapq.heappop(heap)
+        result[host] = shard
+        heapq.heappush(heap, (total + weights.get(host, default), count + 1, shard))
+    return result
+
+
+def split(args):
+    inventory_dir = os.path.join(args.project_dir, 'inventory')
+    lines = parse_inventory(os.path.join(inventory_dir, args.inventory))
+
+    hosts = []
+    seen = set()
+    for host, line in lines:
+        if host is not None and host not in seen:
+            hosts.append(host)
+            seen.add(host)
+    if not hosts:
+        print("no hosts found in %s" % os.path.join(inventory_dir, args.inventory))
+        return 1
+
+    weights = load_weights(args.project_dir)
+    assignment = balance(hosts, args.shards, weights)
+
+    shards_dir = os.path.join(args.project_dir, 'shards')
+    if os.path.isdir(shards_dir):
+        shutil.rmtree(shards_dir)
+    for shard in range(1, args.shards + 1):
+        path = os.path.join(shards_dir, str(shard), 'inventory')
+        shutil.copytree(inventory_dir, path, ignore=shutil.ignore_patterns(args.inventory))
+        with open(os.path.join(path, args.inventory), 'w') as f:
+            for host, line in lines:
+                if host is None or assignment[host] == shard:
+                    f.write(line + "\n")
+
+        members = [host for host in hosts if assignment[host] == shard]
+        print("shard %d: %d hosts, %.1fs task time in the last runs"
+              % (shard, len(members), sum(weights.get(host, 0.0) for host in members)))
+    return 0
+
+
+def find_runs(artifacts_dir, job_start):
+    """
+    Returns the ansible-runner artifact folders that were created after
+    job_start.
+    """
+    runs = []
+    for path in glob.glob(os.path.join(artifacts_dir, '*', 'job_events')):
+        path = os.path.dirname(path)
+        if os.path.getmtime(path) >= job_start:
+            runs.append(path)
+    return sorted(runs, key=os.path.getmtime)
+
+
+def read_run(path):
+    """
+    Returns the rc, status, stats and playbook time of an artifact folder.
+    """
+    run = {'ident': os.path.basename(path), 'rc': None, 'status': None, 'stats': {}}
+    for name in ('rc', 'status'):
+        try:
+            with open(os.path.join(path, name)) as f:
+                value = f.read().strip()
+            run[name] = int(value) if name == 'rc' else value
+        except (IOError, OSError, ValueError):
+            pass
+
+    for event_path in glob.glob(os.path.join(path, 'job_events', '*.json')):
+        with open(event_path) as f:
+            try:
+                event = json.load(f)
+            except ValueError:
+                continue
+        if event.get('event') == 'playbook_on_stats':
+            run['stats'] = dict((stat, event['event_data'].get(stat) or {}) for stat in STATS)
+
+    try:
+        with open(os.path.join(path, 'timeline.json')) as f:
+            phases = json.load(f)['phases']
+        run['playbook_seconds'] = sum(p['seconds'] for p in phases if p['name'] == 'task execution')
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+    return run
+
+
+def merge(args):
+    artifacts_dir = os.path.join(args.project_dir, 'artifacts')
+    runs = [read_run(path) for path in find_runs(artifacts_dir, args.job_start)]
+
+    stats = dict((stat, {}) for stat in STATS)
+    for run in runs:
+        for stat, hosts in run['stats'].items():
+            for host, count in hosts.items():
+                stats[stat][host] = stats[stat].get(host, 0) + count
+
+    hosts = set()
+    for values in stats.values():
+        hosts.update(values)
+
+    print("")
+    print("SHARDS %d of %d runs found" % (len(runs), args.shards))
+    for run in runs:
+        seconds = run.get('playbook_seconds')
+        print("  %-40s rc=%s status=%s hosts=%d%s" % (
+            run['ident'], run['rc'], run['status'], len(set().union(*run['stats'].values())) if run['stats'] else 0,
+            " playbook %.1fs" % seconds if seconds is not None else ""))
+
+    print("")
+    print("MERGED PLAY RECAP (%d hosts)" % len(hosts))
+    for host in sorted(hosts):
+        print("%-26s : %s" % (host, " ".join(
+            "%s=%-4d" % (name, stats[stat].get(host, 0)) for stat, name in RECAP)))
+
+    result = {
+        'job_start': args.job_start,
+        'merged': time.time(),
+        'shards': args.shards,
+        'runs': runs,
+        'stats': stats,
+    }
+    with open(os.path.join(artifacts_dir, 'shards.json'), 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+
+    rcs = [run['rc'] for run in runs]
+    if len(runs) < args.shards or None in rcs:
+        return 1
+    return max(rcs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    parser_split = commands.add_parser('split', help='split the inventory in shards')
+    parser_split.add_argument('project_dir', help='project folder')
+    parser_split.add_argument('--shards', type=int, required=True, help='number of shards')
+    parser_split.add_argument('--inventory', default='hosts', help='inventory file in the inventory folder')
+    parser_split.set_defaults(func=split)
+
+    parser_merge = commands.add_parser('merge', help='merge the results of the shards')
+    parser_merge.add_argument('project_dir', help='project folder')
+    parser_merge.add_argument('--shards', type=int, required=True, help='number of shards')
+    parser_merge.add_argument('--job-start', type=float, default=0, help='unix time before the shards were started')
+    parser_merge.set_defaults(func=merge)
+
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
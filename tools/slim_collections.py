@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Removes the content of the installed collections that is not used, run by
+make build SLIM=yes (Dockerfile).
+
+The keep file (collections.keep) has a line per collection or per plugin:
+
+    ansible.netcommon                 keep the complete collection
+    cisco.ios modules/ios_command.py  only keep the matching plugins of this
+    cisco.ios cliconf/*               type, the other plugins of the
+                                      collection are removed
+
+module_utils, plugin_utils and doc_fragments are always kept, they are
+imported by the plugins that are kept. Collections that are not in the keep
+file are kept. The tests, docs and changelogs folders are removed from all
+collections.
+
+    python3 tools/slim_collections.py collections.keep
+    python3 tools/slim_collections.py collections.keep --dry-run
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import fnmatch
+import os
+import shutil
+import sys
+
+
+ALWAYS_KEEP = ('module_utils', 'plugin_utils', 'doc_fragments')
+
+REMOVE_DIRS = ('tests', 'docs', 'changelogs')
+
+
+def read_keep(path):
+    """
+    Returns {collection: [patterns]}, an empty list keeps the complete
+    collection.
+    """
+    keep = {}
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split()
+            patterns = keep.setdefault(parts[0], [])
+            if len(parts) > 1:
+                patterns.append(parts[1])
+            elif patterns:
+                raise ValueError("%s: %s is listed complete and per plugin" % (path, parts[0]))
+    return keep
+
+
+def collection_paths(paths=None):
+    """
+    Returns {collection: folder} of the installed collections.
+    """
+    if not paths:
+        from ansible import constants as C
+        paths = C.COLLECTIONS_PATHS
+    result = {}
+    for path in paths:
+        root = os.path.join(os.path.expanduser(path), 'ansible_collections')
+        if not os.path.isdir(root):
+            continue
+        for namespace in sorted(os.listdir(root)):
+            if not os.path.isdir(os.path.join(root, namespace)):
+                continue
+            for name in sorted(os.listdir(os.path.join(root, namespace))):
+                folder = os.path.join(root, namespace, name)
+                # the first path wins, as for ansible
+                if os.path.isdir(folder):
+                    result.setdefault('%s.%s' % (namespace, name), folder)
+    return result
+
+
+def size_of(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, dirs, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def plan(folder, patterns):
+    """
+    Returns the files and folders of a collection that are removed.
+    """
+    remove = [os.path.join(folder, name) for name in REMOVE_DIRS if os.path.isdir(os.path.join(folder, name))]
+    if not patterns:
+        return remove
+
+    plugins = os.path.join(folder, 'plugins')
+    if not os.path.isdir(plugins):
+        return remove
+    for plugin_type in sorted(os.listdir(plugins)):
+        type_dir = os.path.join(plugins, plugin_type)
+        if plugin_type in ALWAYS_KEEP or not os.path.isdir(type_dir):
+            continue
+        for root, dirs, files in os.walk(type_dir):
+            dirs[:] = [d for d in dirs if d != '__pycache__']
+            for name in files:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, plugins).replace(os.sep, '/')
+                if name == '__init__.py' or any(fnmatch.fnmatch(relative, p) for p in patterns):
+                    continue
+                remove.append(path)
+    return remove
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('keep', help='keep file')
+    parser.add_argument('--collections-path', action='append', help='collection paths, default COLLECTIONS_PATHS')
+    parser.add_argument('--dry-run', action='store_true', help='only print what would be removed')
+    args = parser.parse_args()
+
+    keep = read_keep(args.keep)
+    installed = collection_paths(args.collections_path)
+    for name in sorted(set(keep) - set(installed)):
+        print("warning: %s is in %s but is not installed" % (name, args.keep))
+
+    total = 0
+    for name, folder in sorted(installed.items()):
+        remove = plan(folder, keep.get(name, []))
+        size = sum(size_of(path) for path in remove)
+        total += size
+        print("%-30s %6d files/folders %8.1f KB removed" % (name, len(remove), size / 1024.0))
+        if args.dry_run:
+            continue
+        for path in remove:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    print("%-30s %31.1f KB removed" % ('total', total / 1024.0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# (c) 2021 Maarten Wallraf
+#
+# Licensed under the BSD 3 Clause license
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Completes and prints the job timeline of the oneos_timeline callback.
+
+Called by make run after docker run returned: the timeline.json of the job
+is looked up in the artifacts folder of the project, the artifact write
+and container stop is added and the report is printed. Runs on the docker host, only the standard
+library is used.
+
+    python3 tools/timeline.py --job-start 1634460000.12 --job-end 1634460300.54 projects/demo/artifacts
+    python3 tools/timeline.py projects/demo/artifacts/<ident>/timeline.json
+"""
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ansible_plugins', 'plugin_utils'))
+
+from oneos.timeline import add_job_end, format_report
+
+
+def find_timeline(path, job_start=None):
+    """
+    Returns the most recent timeline.json in the artifacts folder path that
+    was written after job_start.
+    """
+    if os.path.isfile(path):
+        return path
+    candidates = glob.glob(os.path.join(path, 'timeline.json')) + glob.glob(os.path.join(path, '*', 'timeline.json'))
+    if job_start is not None:
+        candidates = [c for c in candidates if os.path.getmtime(c) >= job_start]
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='artifacts folder of the project or a timeline.json file')
+    parser.add_argument('--job-start', type=float, help='unix time before docker run was started')
+    parser.add_argument('--job-end', type=float, help='unix time after docker run returned')
+    args = parser.parse_args()
+
+    path = find_timeline(args.path, args.job_start)
+    if path is None:
+        print("no job timeline found in %s (is the oneos_timeline callback enabled?)" % args.path)
+        return 0
+
+    with open(path) as f:
+        timeline = json.load(f)
+    if args.job_end is not None:
+        add_job_end(timeline, args.job_end)
+        with open(path, 'w') as f:
+            json.dump(timeline, f, indent=2, sort_keys=True)
+
+    print("")
+    print("JOB TIMELINE (%s)" % path)
+    print(format_report(timeline))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())